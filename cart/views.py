@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from products.models import Product, ProductVariation
+from products.variations import attributes_from_post, resolve_for_sale
 from decimal import Decimal
 from django.http import JsonResponse
 from django.template.loader import render_to_string
@@ -16,21 +17,10 @@ def add_to_cart(request, product_id):
         quantity = int(request.POST.get('quantity', 1))
         
         # Get selected attributes
-        selected_attributes = {}
-        for key, value in request.POST.items():
-            if key.startswith('attribute_'):
-                attr_name = key.replace('attribute_', '')
-                selected_attributes[attr_name] = value
+        selected_attributes = attributes_from_post(request.POST)
         
-        # Find the matching variation
-        variation = None
-        if selected_attributes:
-            variations = product.variations.all()
-            for var in variations:
-                var_attrs = {attr.attribute.name.lower(): attr.value for attr in var.attributes.all()}
-                if var_attrs == selected_attributes:
-                    variation = var
-                    break
+        # Find the matching variation (cached matrix lookup, live stock and price)
+        variation = resolve_for_sale(product, selected_attributes)
         
         if variation and variation.stock < quantity:
             return JsonResponse({
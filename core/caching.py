@@ -0,0 +1,25 @@
+"""
+Whether the default cache is shared between processes.
+
+Version keys (product detail, facet index) only invalidate across web
+workers, management commands and background threads when they all see
+the same cache. LocMemCache keeps one cache per process and DummyCache
+keeps none, so modules that would cache for long fall back to the short
+timeouts of the baseline when either is configured.
+"""
+from django.conf import settings
+
+
+PER_PROCESS_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_shared(alias='default'):
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return backend not in PER_PROCESS_BACKENDS
+
+
+# Read once at startup, like the rest of the settings
+SHARED_CACHE = is_shared()
@@ -0,0 +1,319 @@
+"""
+Responsive renditions of the site's uploaded images.
+
+Every image field listed in IMAGE_FIELDS gets a width ladder. Each width
+is rendered once per format: AVIF when Pillow can encode it, and WebP.
+The renditions are ImageKit cache files, so their names depend only on
+the source file and the spec. Uploads generate their ladder after
+commit. Existing files are covered by generate_renditions (product
+images) and generate_site_renditions (everything else).
+
+Only ProductImage records whether its ladder exists (renditions_ready),
+so only its URLs are built without a storage call (the site-wide
+PregeneratedStrategy). The other fields in IMAGE_FIELDS have no such
+bookkeeping: their renditions use ImageKit's JustInTime strategy, which
+generates a missing file (for example before generate_site_renditions
+has run, or after a failed generation) the first time its URL is read.
+
+Templates use the responsive_image tag (core/templatetags/lazy_load.py)
+or the image_srcset / get_image_url tags (product_filters.py). Both emit
+<picture> sources or srcset/sizes from these URLs.
+
+Uploads to the processed fields (product images, brand logos, category
+images) go through Ingest first. Ingest decodes a JPEG directly at
+roughly its target scale, instead of decoding a full-size photo and
+copying it. validate_pixel_budget rejects uploads too large to ingest.
+"""
+import base64
+import io
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from imagekit import ImageSpec, register
+from imagekit.cachefiles import ImageCacheFile
+from imagekit.cachefiles.strategies import JustInTime
+from imagekit.processors import ResizeToFit, Transpose
+from PIL import Image, ImageOps, features
+
+
+WIDTHS = (200, 400, 800, 1200)
+ICON_WIDTHS = (64, 128)
+
+# (app_label.Model, field name) -> width ladder
+IMAGE_FIELDS = {
+    ('products.ProductImage', 'image'): WIDTHS,
+    ('core.Banner', 'image'): WIDTHS + (1600,),
+    ('core.Promotion', 'image'): WIDTHS,
+    ('core.HomeAd', 'image'): WIDTHS,
+    ('orders.PaymentMethod', 'icon'): ICON_WIDTHS,
+    ('accounts.User', 'profile_picture'): (100, 200, 400),
+}
+# Fields whose rows record when their ladder was generated; the rest generate on first use
+REGISTERED_FIELDS = {('products.ProductImage', 'image')}
+
+QUALITY = {
+    'AVIF': 55,
+    'WEBP': 80,
+}
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+}
+
+
+def _avif_supported():
+    try:
+        return features.check('avif')
+    except ValueError:
+        # Pillow older than 11.2 doesn't know the feature
+        return False
+
+
+# Best first: <picture> sources are tried in order
+FORMATS = ('AVIF', 'WEBP') if _avif_supported() else ('WEBP',)
+FALLBACK_FORMAT = 'WEBP'
+
+
+class WidthRendition(ImageSpec):
+    """Source scaled down to `width` pixels wide (never up) in `format`"""
+
+    def __init__(self, source, width, format):
+        self.width = width
+        self.format = format
+        self.options = {'quality': QUALITY[format]}
+        super().__init__(source=source)
+
+    @property
+    def processors(self):
+        return [Transpose(), ResizeToFit(width=self.width, upscale=False)]
+
+
+# ImageKit only runs cache file strategies for registered generators
+register.generator('core:width_rendition', WidthRendition)
+
+
+ORIENTATION_TAG = 0x0112
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+# Decode at least this many times the target size, so the final downscale keeps its quality
+DRAFT_GAP = 2
+# Largest JPEG accepted, from its header (a 48MP phone photo fits)
+MAX_SOURCE_PIXELS = 50_000_000
+# Largest bitmap ingestion decodes; other formats can't be decoded reduced
+MAX_DECODE_PIXELS = 24_000_000
+
+
+def check_pixel_budget(image):
+    """Raise ValueError if an opened (not yet loaded) image is over the budget"""
+    width, height = image.size
+    limit = MAX_SOURCE_PIXELS if image.format == 'JPEG' else MAX_DECODE_PIXELS
+    if width * height > limit:
+        raise ValueError(
+            f'{width}x{height} image is over the {limit // 1_000_000} MP limit for {image.format} uploads'
+        )
+
+
+def validate_pixel_budget(field_file):
+    """Field validator: rejects oversized uploads from their header alone"""
+    if getattr(field_file, '_committed', True):
+        # Stored already; checked when it was uploaded
+        return
+    upload = field_file.file
+    try:
+        with Image.open(upload) as image:
+            check_pixel_budget(image)
+    except (ValueError, Image.DecompressionBombError) as e:
+        raise ValidationError(str(e))
+    except Exception:
+        # Not an image: the form's ImageField reports that
+        pass
+    finally:
+        upload.seek(0)
+
+
+class Ingest:
+    """
+    ImageKit processor for uploads. It fits the image into width x height,
+    or with fill=True crops it to fill that box, and never upscales when
+    fitting. A JPEG is drafted (DCT-scaled while decoding) to about
+    DRAFT_GAP times the target scale. The EXIF orientation and alpha
+    flattening are applied to the reduced bitmap. It must be the first
+    processor, because draft() only works before the pixels are loaded.
+    With flatten=False, transparency is kept (core.resize).
+    """
+
+    def __init__(self, width, height, fill=False, flatten=True):
+        self.width = width
+        self.height = height
+        self.fill = fill
+        self.flatten = flatten
+
+    def process(self, img):
+        check_pixel_budget(img)
+        width, height = self.width, self.height
+        if img.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+            # Work in the stored orientation; transposed at the end
+            width, height = height, width
+
+        source_width, source_height = img.size
+        ratios = (width / source_width, height / source_height)
+        scale = min(max(ratios) if self.fill else min(ratios), 1)
+        img.draft(None, (
+            max(1, int(source_width * scale * DRAFT_GAP)),
+            max(1, int(source_height * scale * DRAFT_GAP)),
+        ))
+        if img.size[0] * img.size[1] > MAX_DECODE_PIXELS:
+            raise ValueError(f'{img.size[0]}x{img.size[1]} decode is over the pixel budget')
+
+        if img.mode in ('P', 'PA', '1'):
+            # Palette images would be resized with nearest-neighbour
+            img = img.convert('RGBA' if img.mode == 'PA' or 'transparency' in img.info else 'RGB')
+        if self.fill:
+            img = ImageOps.fit(img, (width, height), Image.Resampling.LANCZOS)
+        else:
+            img.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA') and not self.flatten:
+            img = img.convert('RGBA')
+        elif img.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img
+
+
+def _field_key(field_file):
+    """(app_label.Model, field name) of the field this file belongs to, or None"""
+    instance = getattr(field_file, 'instance', None)
+    field = getattr(field_file, 'field', None)
+    if instance is None or field is None:
+        return None
+    return (instance._meta.label, field.name)
+
+
+def widths_for(field_file):
+    """Width ladder of the field this file belongs to"""
+    return IMAGE_FIELDS.get(_field_key(field_file), WIDTHS)
+
+
+def has_ladder(field_file):
+    """Whether the file's field has a pregenerated width ladder (IMAGE_FIELDS)"""
+    return _field_key(field_file) in IMAGE_FIELDS
+
+
+def rendition(field_file, width, format=FALLBACK_FORMAT):
+    # None keeps the default (pregenerated) strategy
+    strategy = None if _field_key(field_file) in REGISTERED_FIELDS else JustInTime()
+    return ImageCacheFile(WidthRendition(field_file, width, format), cachefile_strategy=strategy)
+
+
+def rendition_url(field_file, width, format=FALLBACK_FORMAT):
+    """URL of the smallest ladder rendition at least `width` wide ('' if no file)"""
+    if not field_file:
+        return ''
+    ladder = widths_for(field_file)
+    width = next((w for w in ladder if w >= int(width)), ladder[-1])
+    try:
+        return rendition(field_file, width, format).url
+    except Exception as e:
+        print(f"Error building rendition URL for {field_file.name}: {e}")
+        return ''
+
+
+def srcset(field_file, format=FALLBACK_FORMAT):
+    """'url 200w, url 400w, ...' for one format"""
+    if not field_file:
+        return ''
+    try:
+        return ', '.join(
+            f'{rendition(field_file, width, format).url} {width}w'
+            for width in widths_for(field_file)
+        )
+    except Exception as e:
+        print(f"Error building srcset for {field_file.name}: {e}")
+        return ''
+
+
+def sources(field_file):
+    """[{'type': mime, 'srcset': ...}] for <picture>, best format first"""
+    return [
+        {'type': MIME_TYPES[format], 'srcset': value}
+        for format in FORMATS
+        for value in [srcset(field_file, format)]
+        if value
+    ]
+
+
+def generate_ladder(field_file, force=False):
+    """Generate every rendition of one file; returns {'<width>.<format>': seconds}"""
+    timings = {}
+    if not field_file:
+        return timings
+    for format in FORMATS:
+        for width in widths_for(field_file):
+            started = time.perf_counter()
+            rendition(field_file, width, format).generate(force=force)
+            timings[f'{width}.{format.lower()}'] = time.perf_counter() - started
+    return timings
+
+
+def describe(file):
+    """{'url', 'width', 'height', 'size'} of a stored image (reads only its header)"""
+    storage, name = file.storage, file.name
+    with storage.open(name, 'rb') as fh:
+        with Image.open(fh) as image:
+            width, height = image.size
+    return {'url': storage.url(name), 'width': width, 'height': height, 'size': storage.size(name)}
+
+
+def describe_ladder(field_file):
+    """describe() of every generated ladder rendition, keyed '<width>.<format>'"""
+    return {
+        f'{width}.{format.lower()}': describe(rendition(field_file, width, format))
+        for format in FORMATS
+        for width in widths_for(field_file)
+    }
+
+
+PLACEHOLDER_SIZE = 24
+PLACEHOLDER_QUALITY = 30
+
+
+def placeholder(field_file):
+    """
+    Low-quality image placeholder: a ~24px WebP as a data URI (a few hundred
+    bytes) that pages inline as the <img> src and blur until the real image
+    arrives.
+    """
+    with field_file.storage.open(field_file.name, 'rb') as fh:
+        with Image.open(fh) as image:
+            # JPEG sources decode straight at a reduced scale
+            image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def generate_now(field_file):
+    try:
+        generate_ladder(field_file)
+    except Exception as e:
+        print(f"Error generating renditions for {field_file.name}: {e}")
+
+
+def schedule_generate(field_file):
+    """Generate the ladder of a just-saved file once the transaction commits"""
+    if field_file:
+        transaction.on_commit(lambda: generate_now(field_file))
@@ -0,0 +1,112 @@
+from django.apps import apps
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core import images, storage
+from products import renditions
+from products.models import ProductImage
+
+class Command(BaseCommand):
+    help = 'Move existing uploads to content-addressed storage, merging identical files and rewriting references'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved and merged')
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='Delete the old files once every reference and rendition has moved')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes for product renditions')
+    
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        content_storage = storage.content_storage
+        moved = {}          # old name -> content name
+        stored = set()      # content names stored (or, in a dry run, that would be)
+        failed = set()
+        stats = {'rows': 0, 'files': 0, 'duplicates': 0, 'bytes': 0, 'duplicate_bytes': 0}
+        changed = {}        # label -> [pk]
+        
+        for label, field_name in storage.CONTENT_FIELDS:
+            model = apps.get_model(label)
+            rows = model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list('pk', field_name).order_by('pk')
+            updates = []
+            for pk, name in rows.iterator():
+                if storage.is_content_name(name) or name in failed:
+                    continue
+                target = moved.get(name)
+                if target is None:
+                    try:
+                        target = self.move(name, stored, stats, dry_run)
+                    except Exception as e:
+                        failed.add(name)
+                        self.stderr.write(f'{label} #{pk} ({name}): {e}')
+                        continue
+                    moved[name] = target
+                updates.append((pk, target))
+        
+            if updates and not dry_run:
+                # update() so no save signals regenerate anything half-way
+                with transaction.atomic():
+                    for pk, target in updates:
+                        model.objects.filter(pk=pk).update(**{field_name: target})
+            changed.setdefault(label, []).extend(pk for pk, _ in updates)
+            stats['rows'] += len(updates)
+            self.stdout.write(f'  {label}.{field_name}: {len(updates)} references')
+        
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(
+            f"{verb} {stats['files']} files ({stats['bytes'] / 1024 / 1024:.1f} MB) for {stats['rows']} references; "
+            f"{stats['duplicates']} duplicates merged ({stats['duplicate_bytes'] / 1024 / 1024:.1f} MB saved)"
+        )
+        if dry_run or not moved:
+            return
+        
+        # Rendition names follow the source path, so moved files need new ones
+        image_ids = changed.get('products.ProductImage', [])
+        if image_ids:
+            self.stdout.write(f'Regenerating renditions of {len(image_ids)} product images...')
+            _, failures = renditions.generate(image_ids, workers=options['workers'])
+            if failures:
+                # Keep the originals their old renditions still point at
+                failed_targets = set(ProductImage.objects.filter(
+                    id__in=[image_id for image_id, _ in failures]
+                ).values_list('image', flat=True))
+                failed.update(name for name, target in moved.items() if target in failed_targets)
+        for label, field_name in storage.CONTENT_FIELDS:
+            if label == 'products.ProductImage' or (label, field_name) not in images.IMAGE_FIELDS:
+                continue
+            model = apps.get_model(label)
+            for instance in model.objects.filter(pk__in=changed.get(label, [])).iterator():
+                images.generate_now(getattr(instance, field_name))
+        
+        if options['delete_originals']:
+            deleted = 0
+            for name, target in moved.items():
+                if name in failed:
+                    continue
+                content_storage.delete(name)
+                deleted += 1
+            self.stdout.write(f'Deleted {deleted} original files')
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {stats['rows']} references now point at {len(stored)} content-addressed files, "
+            f'{len(failed)} failed'
+        ))
+    
+    def move(self, name, stored, stats, dry_run):
+        """Copy one file to its content name; returns that name"""
+        content_storage = storage.content_storage
+        with content_storage.open(name, 'rb') as fh:
+            file = File(fh, name)
+            size = file.size
+            target = storage.content_name(storage.content_hash(file), name)
+            if target in stored or content_storage.exists(target):
+                stats['duplicates'] += 1
+                stats['duplicate_bytes'] += size
+            else:
+                stats['files'] += 1
+                stats['bytes'] += size
+                if not dry_run:
+                    content_storage.save(name, file)
+        stored.add(target)
+        return target
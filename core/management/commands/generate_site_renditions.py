@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from core import images
+
+class Command(BaseCommand):
+    help = 'Generate the responsive renditions of banners, promotions, ads, payment icons and profile pictures'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+    
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for (label, field_name), _ in images.IMAGE_FIELDS.items():
+            if label == 'products.ProductImage':
+                # Covered by generate_renditions (process pool, resumable)
+                continue
+            model = apps.get_model(label)
+            for instance in model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).iterator():
+                try:
+                    images.generate_ladder(getattr(instance, field_name), force=options['force'])
+                    generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{label} #{instance.pk}: {e}')
+            self.stdout.write(f'  {label}.{field_name} done')
+        
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {generated} images, {failed} failed'))
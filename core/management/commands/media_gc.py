@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import media_gc
+
+class Command(BaseCommand):
+    help = 'Delete media files no row references: stale originals, ImageKit renditions and resized copies'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+        parser.add_argument('--grace-hours', type=float, default=media_gc.GRACE_SECONDS / 3600,
+                            help='Leave files modified more recently than this alone (default: 24)')
+        parser.add_argument('--resized-days', type=float, default=media_gc.RESIZED_MAX_AGE / 86400,
+                            help='Expire on-demand resized copies unused for this long (default: 30)')
+        parser.add_argument('--keep', action='append', default=[], metavar='PREFIX',
+                            help='Media path prefix to leave alone, e.g. a hand-managed directory (repeatable)')
+    
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        references = media_gc.referenced_names()
+        if not references:
+            # An empty or wrong database would make every file garbage
+            raise CommandError('No media references found; refusing to sweep')
+        self.stdout.write(f'{len(references)} referenced media files')
+        
+        verbosity = options['verbosity']
+        def report(kind, name, size, error):
+            if error:
+                self.stderr.write(f'{name}: {error}')
+            elif verbosity >= 2:
+                self.stdout.write(f'  {kind}: {name} ({size / 1024:.0f} KB)')
+        
+        stats = media_gc.sweep(
+            references,
+            grace=options['grace_hours'] * 3600,
+            resized_max_age=options['resized_days'] * 86400,
+            keep=tuple(options['keep']),
+            delete=not dry_run,
+            report=report,
+        )
+        
+        verb = 'Would delete' if dry_run else 'Deleted'
+        for kind in media_gc.KINDS:
+            self.stdout.write(
+                f"  {verb} {stats[kind]['files']} {kind} ({stats[kind]['bytes'] / 1024 / 1024:.1f} MB)"
+            )
+        self.stdout.write(
+            f"  Kept {stats['kept']['files']} files ({stats['kept']['bytes'] / 1024 / 1024:.1f} MB) in use, "
+            f"{stats['recent']['files']} unreferenced files ({stats['recent']['bytes'] / 1024 / 1024:.1f} MB) "
+            f"within the grace period"
+        )
+        total = sum(stats[kind]['bytes'] for kind in media_gc.KINDS)
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {sum(stats[kind]['files'] for kind in media_gc.KINDS)} files "
+            f"({total / 1024 / 1024:.1f} MB), {stats['errors']} failed"
+        ))
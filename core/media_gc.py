@@ -0,0 +1,165 @@
+"""
+Garbage collection of unreferenced media files (media_gc).
+
+Deleting or replacing an image, duplicating a product and re-uploading
+all leave files behind: the old original, its ImageKit renditions under
+CACHE/, and its on-demand resized copies (core.resize). Nothing removes
+them, because content-addressed files (core.storage) may be shared and
+are never deleted through a row.
+
+The referenced names come from every FileField/ImageField stored under
+MEDIA_ROOT, streamed with one query per model. ProductImage.renditions_source
+is also kept, because until a replaced image's renditions are regenerated,
+cards and detail pages still point at the renditions of the previous file.
+The media tree is then walked once with os.scandir, and each file falls
+into one of three kinds:
+
+- renditions, under IMAGEKIT_CACHEFILE_DIR: ImageKit names them after
+  their source (CACHE/images/<source path minus extension>/<hash>.<ext>).
+  A rendition is live while a file with that stem is referenced.
+- resized copies, under core.resize.CACHE_DIR: their cache keys can't be
+  traced back to a source, so they expire when not used (atime, or mtime
+  where atime isn't updated) for `resized_max_age`. Leftover .part files
+  expire after the grace period.
+- originals, which covers everything else: live while their name is
+  referenced.
+
+Only files older than the grace period are collected. queue_upload and
+import_product_images store a file before its row exists.
+"""
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+
+from . import resize
+
+
+RENDITIONS_DIR = getattr(settings, 'IMAGEKIT_CACHEFILE_DIR', 'CACHE/images')
+KINDS = ('originals', 'renditions', 'resized')
+GRACE_SECONDS = 24 * 3600
+RESIZED_MAX_AGE = 30 * 24 * 3600
+CHUNK_SIZE = 2000
+
+
+def file_fields():
+    """{model: [field names]} of the FileFields (ImageFields included) stored under MEDIA_ROOT"""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    fields = {}
+    for model in apps.get_models():
+        if model._meta.proxy:
+            continue
+        names = [
+            field.name for field in model._meta.concrete_fields
+            if isinstance(field, models.FileField)
+            and getattr(field.storage, 'location', None)
+            and os.path.realpath(field.storage.location) == media_root
+        ]
+        if names:
+            fields[model] = names
+    return fields
+
+
+def referenced_names():
+    """Every media name a row points at"""
+    names = set()
+    for model, field_names in file_fields().items():
+        rows = model._base_manager.values_list(*field_names).order_by()
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            names.update(name for name in row if name)
+    # Registered renditions (and the cards built from them) until regenerated
+    ProductImage = apps.get_model('products', 'ProductImage')
+    names.update(
+        ProductImage._base_manager.exclude(renditions_source='').order_by()
+        .values_list('renditions_source', flat=True).iterator(chunk_size=CHUNK_SIZE)
+    )
+    return names
+
+
+def _kind(name):
+    if name.startswith(f'{RENDITIONS_DIR}/'):
+        return 'renditions'
+    if name.startswith(f'{resize.CACHE_DIR}/'):
+        return 'resized'
+    return 'originals'
+
+
+def sweep(references, grace=GRACE_SECONDS, resized_max_age=RESIZED_MAX_AGE,
+          keep=(), delete=False, report=None):
+    """
+    Walk MEDIA_ROOT and collect the garbage among its files, deleting it
+    unless `delete` is false. `keep` lists path prefixes that are never
+    touched. report(kind, name, size, error) is called for each collected
+    file. Returns {kind: {'files', 'bytes'}} for the collected kinds,
+    'kept' and 'recent' (within the grace period), plus 'errors'.
+    """
+    stats = {kind: {'files': 0, 'bytes': 0} for kind in KINDS + ('kept', 'recent')}
+    stats['errors'] = 0
+    stems = {os.path.splitext(name)[0] for name in references}
+    root = settings.MEDIA_ROOT
+    now = time.time()
+
+    def is_garbage(kind, name, stat):
+        if kind == 'originals':
+            return name not in references
+        if kind == 'renditions':
+            source = os.path.dirname(name[len(RENDITIONS_DIR) + 1:])
+            # No directory: a source ImageKit couldn't name by path
+            return bool(source) and source not in stems
+        if name.endswith('.part'):
+            return True
+        return now - max(stat.st_atime, stat.st_mtime) > resized_max_age
+
+    def walk(path, prefix):
+        """Sweep one directory; returns whether it's now empty"""
+        empty = True
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = prefix + entry.name
+                if entry.name.startswith('.') or entry.is_symlink() or name.startswith(keep):
+                    empty = False
+                    continue
+                if entry.is_dir():
+                    stat = entry.stat()
+                    if walk(entry.path, f'{name}/') and delete and prefix and now - stat.st_mtime > grace:
+                        try:
+                            os.rmdir(entry.path)
+                            continue
+                        except OSError:
+                            # Written to meanwhile
+                            pass
+                    empty = False
+                    continue
+                stat = entry.stat()
+                kind = _kind(name)
+                if not is_garbage(kind, name, stat):
+                    bucket = 'kept'
+                elif now - stat.st_mtime <= grace:
+                    bucket = 'recent'
+                else:
+                    error = None
+                    if delete:
+                        try:
+                            os.remove(entry.path)
+                        except OSError as e:
+                            error = str(e)
+                    if report:
+                        report(kind, name, stat.st_size, error)
+                    if error:
+                        stats['errors'] += 1
+                        empty = False
+                        continue
+                    stats[kind]['files'] += 1
+                    stats[kind]['bytes'] += stat.st_size
+                    empty = empty and delete
+                    continue
+                stats[bucket]['files'] += 1
+                stats[bucket]['bytes'] += stat.st_size
+                empty = False
+        return empty
+
+    if os.path.isdir(root):
+        walk(root, '')
+    return stats
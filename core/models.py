@@ -1,10 +1,12 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 
+from .storage import content_storage
+
 
 class Banner(models.Model):
     title = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='banners/')
+    image = models.ImageField(upload_to='banners/', storage=content_storage)
     url = models.CharField(max_length=255)
     order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
@@ -30,7 +32,7 @@ class Banner(models.Model):
 
 class Promotion(models.Model):
     title = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='promotions/')
+    image = models.ImageField(upload_to='promotions/', storage=content_storage)
     url = models.CharField(max_length=255)
     order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
@@ -56,7 +58,7 @@ class Promotion(models.Model):
 
 class HomeAd(models.Model):
     title = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='home_ads/')
+    image = models.ImageField(upload_to='home_ads/', storage=content_storage)
     url = models.CharField(max_length=255)
     order = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
@@ -0,0 +1,147 @@
+"""
+On-demand resized copies of media files: /img/<w>x<h>[.<format>]/<path>.
+
+get_image_url sends here what the pregenerated width ladders
+(core.images) don't cover: boxes with a height, widths past the top of a
+ladder, other formats, and fields without a ladder. None of these needs
+a new ImageSpec field. Only the
+sizes in SIZES and the formats in FORMATS are served, so the set of
+files that can be created stays bounded. A requested size snaps to the
+smallest allowed size that covers it. A height of 0 means "this width,
+any height". Images are fitted inside the box and never upscaled.
+
+Each size is generated once, into a sharded disk cache under
+MEDIA_ROOT/resized/. The cache key covers the source path, its mtime
+and size, the box and the format. Repeat requests are a stat and a file
+send. With IMAGE_RESIZE_SENDFILE set ('X-Sendfile', or 'X-Accel-Redirect'
+together with IMAGE_RESIZE_INTERNAL_URL), the web server sends the file
+instead. Sources in content-addressed storage (core.storage) never
+change, so their resized URLs are served as immutable.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils._os import safe_join
+from PIL import Image
+
+from . import images
+from .storage import is_content_name
+
+
+URL_PREFIX = '/img/'
+CACHE_DIR = 'resized'
+
+# (width, height) boxes that may be requested; height 0 = width only
+SIZES = set(getattr(settings, 'IMAGE_RESIZE_SIZES', (
+    [(width, 0) for width in (64, 100, 128, 200, 240, 400, 600, 800, 1200, 1600)]
+    + [(side, side) for side in (80, 100, 120, 150, 200, 240, 300, 400, 600, 800)]
+)))
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+if 'AVIF' in images.FORMATS:
+    FORMATS['avif'] = ('AVIF', 'image/avif', {'quality': 55})
+DEFAULT_FORMAT = 'webp'
+# Height bound of width-only boxes
+MAX_HEIGHT = 100_000
+SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff', '.avif'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Other sources can be replaced under the same name
+MUTABLE_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def snap(width, height=0):
+    """Smallest allowed box covering width x height (largest allowed box if none does)"""
+    width, height = int(width or 0), int(height or 0)
+    candidates = [
+        (w, h) for w, h in SIZES
+        if w >= width and ((h == 0) if not height else (h >= height))
+    ]
+    if not candidates:
+        candidates = [(w, h) for w, h in SIZES if (h == 0) == (not height)] or list(SIZES)
+        return max(candidates, key=lambda size: (size[0], size[1]))
+    return min(candidates, key=lambda size: (size[0] * (size[1] or size[0]), size))
+
+
+def resized_url(name, width, height=0, format=DEFAULT_FORMAT):
+    """URL of `name` (a media path) resized to the allowed box covering width x height"""
+    width, height = snap(width, height)
+    suffix = '' if format == DEFAULT_FORMAT else f'.{format}'
+    return f'{URL_PREFIX}{width}x{height}{suffix}/{name}'
+
+
+def source_path(name):
+    """Absolute path of a media file that may be resized, or None"""
+    if os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+        return None
+    if name.startswith(f'{CACHE_DIR}/'):
+        return None
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except Exception:
+        # Outside MEDIA_ROOT
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def cache_path(name, stat, width, height, format):
+    key = hashlib.sha1(
+        f'{name}|{stat.st_mtime_ns}|{stat.st_size}|{width}x{height}|{format}'.encode()
+    ).hexdigest()
+    return os.path.join(settings.MEDIA_ROOT, CACHE_DIR, key[:2], key[2:4], f'{key}.{format}')
+
+
+def render(path, width, height, format):
+    """Resized copy of the image at `path` as a PIL image"""
+    with Image.open(path) as img:
+        # Drafted decode and EXIF rotation as for uploads; a 0 height is unbounded
+        return images.Ingest(
+            width, height or MAX_HEIGHT, flatten=FORMATS[format][0] == 'JPEG'
+        ).process(img)
+
+
+def get_or_create(name, width, height, format):
+    """
+    (cached file path, content type, Cache-Control) of a resized media file,
+    generating it on the first request. Returns None for a size, format
+    or path that isn't served.
+    """
+    if (width, height) not in SIZES or format not in FORMATS:
+        return None
+    path = source_path(name)
+    if path is None:
+        return None
+    stat = os.stat(path)
+    target = cache_path(name, stat, width, height, format)
+    if not os.path.exists(target):
+        pil_format, _, options = FORMATS[format]
+        img = render(path, width, height, format)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write aside and rename, so concurrent requests never see half a file
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                img.save(fh, pil_format, **options)
+            os.replace(temporary, target)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_content_name(name) else MUTABLE_CACHE_CONTROL
+    return target, FORMATS[format][1], cache_control
+
+
+def sendfile_header(target):
+    """(header, value) handing `target` to the web server, if IMAGE_RESIZE_SENDFILE is set"""
+    header = getattr(settings, 'IMAGE_RESIZE_SENDFILE', '')
+    if not header:
+        return None
+    if header == 'X-Accel-Redirect':
+        # nginx wants an internal location mapped to MEDIA_ROOT/resized/
+        relative = os.path.relpath(target, os.path.join(settings.MEDIA_ROOT, CACHE_DIR)).replace(os.sep, '/')
+        return header, f"{settings.IMAGE_RESIZE_INTERNAL_URL.rstrip('/')}/{relative}"
+    return header, target
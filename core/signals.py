@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from accounts.models import User
+from orders.models import PaymentMethod
+from . import images
+from .models import Banner, Promotion, HomeAd
+
+
+# Responsive renditions of site images (product images: products/signals.py)
+
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=Promotion)
+@receiver(post_save, sender=HomeAd)
+def generate_renditions_for_site_image(sender, instance, **kwargs):
+    images.schedule_generate(instance.image)
+
+@receiver(post_save, sender=PaymentMethod)
+def generate_renditions_for_payment_icon(sender, instance, **kwargs):
+    images.schedule_generate(instance.icon)
+
+@receiver(post_save, sender=User)
+def generate_renditions_for_profile_picture(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'profile_picture' not in update_fields:
+        # Logins and other partial saves don't touch the picture
+        return
+    images.schedule_generate(instance.profile_picture)
@@ -0,0 +1,82 @@
+"""
+Content-addressed media storage.
+
+Uploads to the fields in CONTENT_FIELDS are stored under the SHA-256 of
+their bytes, sharded two levels deep:
+
+    cas/3f/a2/3fa2...e9.webp
+
+The name depends only on the content. A re-upload of the same photo
+therefore resolves to the file that is already stored, and so do its
+ImageKit renditions (named after the source path) and its rendition
+registry entry (products.renditions). The same applies to rows copied by
+ProductAdmin.duplicate_product. Nothing is written or processed twice.
+
+Because a file can be shared by several rows, it must never be deleted
+through one of them. Files uploaded before this storage existed are
+moved over by the dedupe_media command.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+CONTENT_ROOT = 'cas'
+HASH_CHUNK_SIZE = 64 * 1024
+
+# (app_label.Model, field name) stored by content
+CONTENT_FIELDS = (
+    ('products.ProductImage', 'image'),
+    ('products.Brand', 'logo'),
+    ('products.Category', 'image'),
+    ('products.Category', 'banner'),
+    ('core.Banner', 'image'),
+    ('core.Promotion', 'image'),
+    ('core.HomeAd', 'image'),
+)
+
+
+def content_hash(content):
+    """SHA-256 hex digest of a file's bytes (leaves it rewound)"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(digest, filename):
+    """Sharded storage name of a digest, keeping the file's extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{CONTENT_ROOT}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_content_name(name):
+    return bool(name) and name.startswith(f'{CONTENT_ROOT}/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after their content hash"""
+
+    def __init__(self, **kwargs):
+        # The same name always means the same bytes, so a concurrent
+        # upload of the same file may safely write over it
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(content_hash(content), name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+content_storage = ContentAddressedStorage()
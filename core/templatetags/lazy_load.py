@@ -1,25 +1,39 @@
 from django import template
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
+
+from core import images
 
 register = template.Library()
 
+TRANSPARENT_PIXEL = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+
 
 @register.simple_tag
-def lazy_image(image_url, alt_text, class_name='', width='', height=''):
+def lazy_image(image_url, alt_text, class_name='', width='', height='', srcset='', sizes='', placeholder=''):
     """
-    Generate lazy-loaded image tag
+    Generate lazy-loaded image tag (srcset is swapped in by lazy-load.js too).
+    With an LQIP `placeholder` (ProductImage.placeholder, card.placeholder) the
+    blurred preview paints at once; width/height reserve the tile's space.
     """
-    placeholder = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+    if placeholder:
+        class_name = f'{class_name} lqip'.strip()
+    else:
+        placeholder = TRANSPARENT_PIXEL
     
     attributes = []
     if class_name:
-        attributes.append(f'class="{class_name}"')
+        attributes.append(('class', class_name))
     if width:
-        attributes.append(f'width="{width}"')
+        attributes.append(('width', width))
     if height:
-        attributes.append(f'height="{height}"')
+        attributes.append(('height', height))
+    if srcset:
+        attributes.append(('data-srcset', srcset))
+    if sizes:
+        attributes.append(('sizes', sizes))
     
-    attrs_str = ' '.join(attributes)
+    # Escaped per value; a pre-joined string would have its quotes escaped
+    attrs_str = format_html_join(' ', '{}="{}"', attributes)
     
     return format_html(
         '<img src="{}" data-src="{}" alt="{}" loading="lazy" {}>',
@@ -28,11 +42,47 @@ def lazy_image(image_url, alt_text, class_name='', width='', height=''):
 
 
 @register.simple_tag
-def lazy_background(image_url, class_name=''):
+def lazy_background(image_url, class_name='', placeholder=''):
     """
-    Generate lazy-loaded background image
+    Generate lazy-loaded background image (blurred LQIP until it loads)
     """
+    if placeholder:
+        return format_html(
+            '<div class="{} lazy-background lqip" data-bg="{}" style="background-image: url({});"></div>',
+            class_name, image_url, placeholder
+        )
     return format_html(
         '<div class="{} lazy-background" data-bg="{}" style="background-color: #f5f5f5;"></div>',
         class_name, image_url
+    )
+
+
+@register.simple_tag
+def responsive_image(image, alt_text, sizes='100vw', class_name='', width='', height=''):
+    """
+    <picture> with AVIF/WebP width-ladder sources and a natively lazy <img>.
+    `image` is an image field file or a dict carrying url/srcset/sources
+    (product detail images).
+    """
+    if isinstance(image, dict):
+        fallback = image.get('thumbnail_url') or image.get('url', '')
+        sources = image.get('sources') or []
+        width = width or image.get('width') or ''
+        height = height or image.get('height') or ''
+    elif image:
+        # The original when its renditions can't be generated
+        fallback = images.rendition_url(image, 400) or image.url
+        sources = images.sources(image)
+    else:
+        fallback = '/static/img/no-image.jpg'
+        sources = []
+    
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}"{}{} loading="lazy" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+            (source['type'], source['srcset'], sizes) for source in sources
+        )),
+        fallback, alt_text, class_name,
+        format_html(' width="{}"', width) if width else '',
+        format_html(' height="{}"', height) if height else '',
     )
\ No newline at end of file
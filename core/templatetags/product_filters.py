@@ -3,6 +3,8 @@ from django.utils.safestring import mark_safe
 from urllib.parse import urlparse
 import re
 
+from core import images, resize
+
 register = template.Library()
 
 
@@ -73,22 +75,37 @@ def safe_url(url):
 
 
 @register.simple_tag
-def get_image_url(image_field, width=None, height=None):
-    """Get optimized image URL with optional dimensions"""
+def get_image_url(image_field, width=None, height=None, format='webp'):
+    """
+    Get optimized image URL. A width the field's pregenerated ladder covers
+    gets that ladder rendition, the same file image_srcset lists. Boxes and
+    sizes the ladder doesn't cover go to the on-demand resize (core.resize,
+    /img/<w>x<h>/<path>).
+    """
     if not image_field:
         return '/static/img/no-image.jpg'
     
     try:
-        url = image_field.url
-        
-        # If you have a CDN with image processing, add parameters here
-        # Example for Cloudinary: f"{url}?w={width}&h={height}&c=fill"
-        
-        return url
+        if not (width or height):
+            return image_field.url
+        ladder_format = format.upper()
+        if (not height and ladder_format in images.FORMATS and images.has_ladder(image_field)
+                and resize.snap(width)[0] <= images.widths_for(image_field)[-1]):
+            return images.rendition_url(image_field, width, ladder_format)
+        return resize.resized_url(image_field.name, width or 0, height or 0, format)
     except:
         return '/static/img/no-image.jpg'
 
 
+@register.simple_tag
+def image_srcset(image_field, format='webp'):
+    """srcset of an image field's width ladder in one format (webp or avif)"""
+    format = format.upper()
+    if not image_field or format not in images.FORMATS:
+        return ''
+    return images.srcset(image_field, format)
+
+
 @register.filter
 def get_first_image(product):
     """Get first image of product"""
@@ -1,3 +1,183 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from products.models import Product, ProductImage
+
+from . import images, media_gc
+from .models import Banner
+from .storage import ContentAddressedStorage, content_name, is_content_name
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def stored_files(self):
+        return [
+            os.path.relpath(os.path.join(root, name), self.location)
+            for root, _, files in os.walk(self.location) for name in files
+        ]
+
+    def test_names_files_by_content(self):
+        name = self.storage.save('products/photo.WEBP', ContentFile(b'pixels'))
+        self.assertTrue(is_content_name(name))
+        self.assertRegex(name, r'^cas/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.webp$')
+
+    def test_same_bytes_are_stored_once(self):
+        first = self.storage.save('products/a.webp', ContentFile(b'pixels'))
+        second = self.storage.save('banners/b.webp', ContentFile(b'pixels'))
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_existing_file_is_not_rewritten(self):
+        name = self.storage.save('a.webp', ContentFile(b'pixels'))
+        path = self.storage.path(name)
+        os.utime(path, (1, 1))
+        self.storage.save('b.webp', ContentFile(b'pixels'))
+        self.assertEqual(os.stat(path).st_mtime, 1)
+
+    def test_different_bytes_get_different_names(self):
+        first = self.storage.save('a.webp', ContentFile(b'pixels'))
+        second = self.storage.save('a.webp', ContentFile(b'other pixels'))
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_content_name_keeps_extension_only(self):
+        self.assertEqual(content_name('ab' * 32, 'x/y/Photo.JPG'), f"cas/ab/ab/{'ab' * 32}.jpg")
+        self.assertFalse(is_content_name('products/photo.webp'))
+        self.assertFalse(is_content_name(''))
+
+
+class MediaGCTests(SimpleTestCase):
+    OLD = time.time() - 3 * 24 * 3600
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make(self, name, age=None, used=None):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(b'x' * 10)
+        modified = self.OLD if age is None else time.time() - age
+        os.utime(path, (used or modified, modified))
+        return path
+
+    def sweep(self, references, **kwargs):
+        collected = []
+        def report(kind, name, size, error):
+            collected.append((kind, name))
+        stats = media_gc.sweep(set(references), report=report, **kwargs)
+        return stats, sorted(collected)
+
+    def test_classifies_unreferenced_files(self):
+        self.make('cas/ab/cd/live.webp')
+        self.make('cas/ab/cd/dead.webp')
+        self.make('CACHE/images/cas/ab/cd/live/1.webp')
+        self.make('CACHE/images/cas/ab/cd/dead/1.webp')
+        self.make('resized/aa/bb/stale.webp', age=90 * 24 * 3600)
+        self.make('resized/aa/bb/recent.webp', used=time.time() - 60)
+        self.make('resized/aa/bb/tmp.part')
+
+        stats, collected = self.sweep({'cas/ab/cd/live.webp'})
+
+        self.assertEqual(collected, [
+            ('originals', 'cas/ab/cd/dead.webp'),
+            ('renditions', 'CACHE/images/cas/ab/cd/dead/1.webp'),
+            ('resized', 'resized/aa/bb/stale.webp'),
+            ('resized', 'resized/aa/bb/tmp.part'),
+        ])
+        self.assertEqual(stats['originals'], {'files': 1, 'bytes': 10})
+        self.assertEqual(stats['kept']['files'], 3)
+
+    def test_dry_run_deletes_nothing(self):
+        path = self.make('products/orphan.jpg')
+        stats, _ = self.sweep(set())
+        self.assertEqual(stats['originals']['files'], 1)
+        self.assertTrue(os.path.exists(path))
+
+    def test_delete_removes_garbage_and_emptied_directories(self):
+        kept = self.make('cas/ab/cd/live.webp')
+        self.make('CACHE/images/products/old/1.webp')
+        for directory in ('CACHE/images/products/old', 'CACHE/images/products'):
+            os.utime(os.path.join(self.media_root, directory), (self.OLD, self.OLD))
+
+        self.sweep({'cas/ab/cd/live.webp'}, delete=True)
+
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'CACHE/images/products')))
+
+    def test_grace_period_and_keep_prefixes(self):
+        young = self.make('products/just-uploaded.jpg', age=60)
+        kept = self.make('manual/logo.png')
+        hidden = self.make('.gitkeep')
+
+        stats, collected = self.sweep(set(), keep=('manual/',), delete=True)
+
+        self.assertEqual(collected, [])
+        self.assertEqual(stats['recent']['files'], 1)
+        self.assertTrue(all(os.path.exists(path) for path in (young, kept, hidden)))
+
+
+class MediaGCReferenceTests(TestCase):
+    def test_collects_file_fields_and_registered_rendition_sources(self):
+        Banner.objects.create(title='Sale', image='cas/aa/bb/banner.webp')
+        product = Product.objects.create(name='Mug', sku='MUG', price=10)
+        ProductImage.objects.bulk_create([ProductImage(
+            product=product, image='cas/cc/dd/new.webp', renditions_source='cas/ee/ff/old.webp'
+        )])
+
+        references = media_gc.referenced_names()
+
+        self.assertTrue({
+            'cas/aa/bb/banner.webp', 'cas/cc/dd/new.webp', 'cas/ee/ff/old.webp'
+        } <= references)
+
+
+class SiteRenditionTests(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def source(self, name):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', (900, 300), (40, 80, 120)).save(path)
+
+    def rendition_paths(self, field_file):
+        return [
+            os.path.join(self.media_root, images.rendition(field_file, width, format).name)
+            for format in images.FORMATS for width in images.widths_for(field_file)
+        ]
+
+    def test_site_image_sources_generate_missing_renditions(self):
+        self.source('banners/sale.jpg')
+        banner = Banner(title='Sale', image='banners/sale.jpg')
+
+        sources = images.sources(banner.image)
+
+        self.assertEqual(len(sources), len(images.FORMATS))
+        self.assertTrue(all(os.path.exists(path) for path in self.rendition_paths(banner.image)))
+
+    def test_product_image_urls_leave_generation_to_the_pipeline(self):
+        self.source('products/mug.jpg')
+        image = ProductImage(image='products/mug.jpg')
+
+        images.srcset(image.image)
+
+        self.assertFalse(any(os.path.exists(path) for path in self.rendition_paths(image.image)))
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from django.views.generic import TemplateView
 from products import views as product_views
 from . import views
@@ -7,6 +7,9 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
 
+    # On-demand resized media (core.resize): /img/400x0/<path>, /img/200x200.avif/<path>
+    re_path(r'^img/(?P<width>\d+)x(?P<height>\d+)(?:\.(?P<format>[a-z]+))?/(?P<path>.+)$', views.resized_image, name='resized_image'),
+
     path('search/suggestions/', views.search_suggestions, name='search_suggestions'),
     path('search/by-name/', views.product_name_search, name='product_name_search'),
 
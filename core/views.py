@@ -9,6 +9,10 @@ from django.template.loader import render_to_string
 
 from core.models import Banner, Promotion, HomeAd, CurrencySettingsTable, SiteFeature
 from products.models import Product, Category, Brand, AttributeValue, ProductImage
+from products.facets import get_facet_index
+from products.catalog import CatalogQuery
+from products.cards import cards_for, hydrate_page
+from products.pagination import keyset_ordering, paginate_by_cursor, cursor_after_page
 from reviews.models import Review
 
 import time
@@ -19,6 +23,13 @@ from django.core.cache import cache
 from django.db.models import Exists, OuterRef
 
 from core.email_send_views import send_email_function
+import logging
+
+from django.http import FileResponse, Http404, HttpResponse
+from PIL import Image, UnidentifiedImageError
+from core import resize
+
+logger = logging.getLogger(__name__)
 
 
 # def home(request):
@@ -220,93 +231,37 @@ def product_name_search(request):
     sort = request.GET.get('sort', '')
     
     # Base queryset - ONLY filter by product name
-    products = Product.objects.filter(
-        is_active=True,
-        name__icontains=query  # Only name search, no description or SKU
-    ).select_related('brand').prefetch_related(
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('display_order', 'id')
-        ),
-        Prefetch(
-            'categories',
-            queryset=Category.objects.only('id', 'name', 'slug', 'parent_id')
-        ),
-        Prefetch(
-            'reviews',
-            queryset=Review.objects.only('product_id', 'rating', 'created_at')
-        )
-    ).only(
-        'id', 'name', 'slug', 'price', 'discount_price', 'brand__name',
-        'brand__slug', 'brand__id', 'created_at', 'view_count', 'description', 'is_featured', 'sku'
-    ).distinct()
+    catalog = CatalogQuery(query=query, name_only=True, sort=sort)
+    products = catalog.listing()
+    
+    # Facets for the name-only search results come from the in-memory index
+    # (infinite-scroll requests don't render the sidebar, so skip the id query)
+    facet_index = get_facet_index()
+    context_mask = 0
+    if not is_ajax:
+        context_mask = catalog.facet_mask(facet_index)
     
     # Get brands for filtering (based on name-only search results)
-    all_context_brands = Brand.objects.filter(
-        product__in=products.values('id'),
-        is_active=True
-    ).annotate(
-        product_count=Count('product')
-    ).filter(product_count__gt=0).order_by('-product_count')
+    all_context_brands = facet_index.brand_counts(context_mask)
     
     # Get attributes for filtering (based on name-only search results)
-    all_context_attributes = AttributeValue.objects.filter(
-        product__in=products.values('id')
-    ).annotate(
-        product_count=Count('product')
-    ).filter(product_count__gt=0).select_related('attribute').order_by('attribute__name', 'value')
+    all_context_attributes = facet_index.attribute_counts(context_mask)
     
     # Group attributes by type
     attribute_groups = {}
     for attr in all_context_attributes:
-        attr_name = attr.attribute.name
+        attr_name = attr['attribute']
         if attr_name not in attribute_groups:
             attribute_groups[attr_name] = []
         attribute_groups[attr_name].append({
-            'id': attr.id,
-            'value': attr.value,
-            'product_count': attr.product_count,
+            'id': attr['id'],
+            'value': attr['value'],
+            'product_count': attr['product_count'],
             'is_available': True  # All are available in this context
         })
     
     # Get price range for the filter
-    price_range = products.aggregate(
-        min_price=Min('price'),
-        max_price=Max('price')
-    )
-    
-    # Apply sorting
-    if sort == 'price_asc':
-        from django.db.models import Case, When, F, FloatField
-        products = products.annotate(
-            actual_price=Case(
-                When(discount_price__isnull=False, discount_price__gt=0, 
-                     then=F('discount_price')),
-                default=F('price'),
-                output_field=FloatField()
-            )
-        ).order_by('actual_price')
-    elif sort == 'price_desc':
-        from django.db.models import Case, When, F, FloatField
-        products = products.annotate(
-            actual_price=Case(
-                When(discount_price__isnull=False, discount_price__gt=0, 
-                     then=F('discount_price')),
-                default=F('price'),
-                output_field=FloatField()
-            )
-        ).order_by('-actual_price')
-    elif sort == 'rating':
-        products = products.annotate(
-            avg_rating=Avg('reviews__rating'),
-            review_count=Count('reviews')
-        ).order_by('-avg_rating', '-review_count')
-    elif sort == 'newest':
-        products = products.order_by('-created_at')
-    elif sort == 'popular':
-        products = products.order_by('-view_count')
-    else:
-        products = products.order_by('-created_at')
+    price_range = facet_index.price_range(context_mask)
     
     # Pagination for infinite scroll
     per_page = 12
@@ -319,32 +274,8 @@ def product_name_search(request):
     
     # If it's an AJAX request, return JSON
     if is_ajax:
-        products_data = []
-        for product in products_page:
-            # Get main image
-            main_image = product.images.filter(is_featured=True).first()
-            if not main_image and product.images.exists():
-                main_image = product.images.first()
-            
-            # Calculate discount percentage
-            discount_percentage = 0
-            if product.discount_price and product.price and product.price > 0:
-                discount_percentage = ((product.price - product.discount_price) / product.price) * 100
-                discount_percentage = round(discount_percentage)
-            
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'slug': product.slug,
-                'price': str(product.price),
-                'discount_price': str(product.discount_price) if product.discount_price else None,
-                'discount_percentage': discount_percentage,
-                'brand_name': product.brand.name if product.brand else '',
-                'image_url': main_image.image.url if main_image else '/static/img/no-image.jpg',
-                'url': product.get_absolute_url(),
-                'avg_rating': round(product.avg_rating, 1) if hasattr(product, 'avg_rating') and product.avg_rating else 0,
-                'review_count': product.review_count if hasattr(product, 'review_count') else 0,
-            })
+        # Cards carry everything the JSON needs (one narrow query per page)
+        products_data = [product.to_dict() for product in products_page]
         
         return JsonResponse({
             'success': True,
@@ -375,14 +306,14 @@ def product_name_search(request):
         'selected_category': None,
         'selected_brand_slug': None,
         'all_context_brands': all_context_brands,
-        'available_brand_slugs': list(all_context_brands.values_list('slug', flat=True)),
+        'available_brand_slugs': [brand['slug'] for brand in all_context_brands],
         'selected_brands': [],
         'min_price': None,
         'max_price': None,
         'price_range': price_range,
         'selected_rating': None,
         'attribute_groups': attribute_groups,
-        'available_attribute_ids': list(all_context_attributes.values_list('id', flat=True)),
+        'available_attribute_ids': [attr['id'] for attr in all_context_attributes],
         'selected_attributes': [],
         'sort_option': sort,
         'subcategory_list': None,
@@ -499,17 +430,10 @@ def load_deals_section(request):
     """Load deals section via AJAX"""
     from django.template.loader import render_to_string
     
-    deals = Product.objects.filter(
+    deals = cards_for(Product.objects.filter(
         is_active=True, 
         is_featured=True
-    ).select_related('brand').prefetch_related(
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('id')
-        )
-    ).only(
-        'id', 'name', 'slug', 'price', 'discount_price', 'brand__name'
-    ).order_by('-created_at')[:8]
+    ).only('id').order_by('-created_at')[:8])
     
     from datetime import datetime, timedelta
     deal_end_date = datetime.now() + timedelta(days=1)
@@ -569,17 +493,10 @@ def load_category_products_section(request, category_slug):
     """Load deals section via AJAX"""
     from django.template.loader import render_to_string
     
-    products = Product.objects.filter(
+    products = cards_for(Product.objects.filter(
                     categories__slug=category_slug,
                     is_active=True
-                ).select_related('brand').prefetch_related(
-                    Prefetch(
-                        'images',
-                        queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('id')
-                    )
-                ).only(
-                    'id', 'name', 'slug', 'price', 'discount_price', 'brand__name'
-                ).distinct().order_by('-created_at')[:10]
+                ).only('id', 'created_at').distinct().order_by('-created_at')[:10])
     
     html = render_to_string('partials/category_products_section.html', {
         'products': products,
@@ -592,16 +509,9 @@ def load_new_arrivals_section(request):
     """Load new arrivals section via AJAX"""
     from django.template.loader import render_to_string
     
-    new_arrivals = Product.objects.filter(
+    new_arrivals = cards_for(Product.objects.filter(
         is_active=True
-    ).select_related('brand').prefetch_related(
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('id')
-        )
-    ).only(
-        'id', 'name', 'slug', 'price', 'discount_price', 'brand__name'
-    ).order_by('-created_at')[:8]
+    ).only('id').order_by('-created_at')[:8])
     
     html = render_to_string('partials/new_arrivals_section.html', {
         'new_arrivals': new_arrivals,
@@ -667,47 +577,36 @@ def load_more_products(request):
         # Apply filters
         if product_type == 'deals':
             products = products.filter(is_featured=True)
-        elif product_type == 'new_arrivals':
-            products = products.order_by('-created_at')
-        
-        # Optimize query
-        products = products.select_related('brand').prefetch_related(
-            Prefetch(
-                'images',
-                queryset=ProductImage.objects.only('image', 'product_id').order_by('id')
-            )
-        ).only(
-            'id', 'name', 'slug', 'price', 'discount_price', 'brand__name'
-        )
+        ordering = keyset_ordering('-created_at')
+        products = products.order_by(*ordering)
         
-        # Paginate
-        paginator = Paginator(products, per_page)
+        # Only the sort key here; the page is rendered from its ProductCards
+        products = products.only('id', 'created_at')
         
-        try:
-            products_page = paginator.page(page)
-        except (PageNotAnInteger, EmptyPage):
-            products_page = paginator.page(1)
+        # Paginate - ?cursor= switches to keyset mode (no OFFSET, no COUNT)
+        if 'cursor' in request.GET:
+            products_page = paginate_by_cursor(
+                products, ordering, request.GET.get('cursor'), per_page, count=False
+            )
+            next_cursor = products_page.next_cursor
+        else:
+            paginator = Paginator(products, per_page)
+            
+            try:
+                products_page = paginator.page(page)
+            except (PageNotAnInteger, EmptyPage):
+                products_page = paginator.page(1)
+            next_cursor = cursor_after_page(products_page, ordering, None)
         
-        # Prepare response
-        products_data = []
-        for product in products_page:
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'slug': product.slug,
-                'price': str(product.price),
-                'discount_price': str(product.discount_price) if product.discount_price else None,
-                'discount_percentage': product.get_discount_percentage(),
-                'brand_name': product.brand.name if product.brand else '',
-                'image_url': product.images.first().image.url if product.images.exists() else '/static/img/no-image.jpg',
-                'url': product.get_absolute_url(),
-            })
+        # Prepare response from the page's cards
+        products_data = [card.to_dict() for card in hydrate_page(products_page)]
         
         response_data = {
             'success': True,
             'products': products_data,
             'has_next': products_page.has_next(),
             'next_page': products_page.next_page_number() if products_page.has_next() else None,
+            'next_cursor': next_cursor,
         }
         
     except Exception as e:
@@ -734,43 +633,33 @@ def load_category_products(request):
         products = Product.objects.filter(
             categories=category,
             is_active=True
-        ).select_related('brand').prefetch_related(
-            Prefetch(
-                'images',
-                queryset=ProductImage.objects.only('image', 'product_id').order_by('id')
-            )
-        ).only(
-            'id', 'name', 'slug', 'price', 'discount_price', 'brand__name'
-        ).distinct().order_by('-created_at')
-        
-        # Paginate
-        paginator = Paginator(products, per_page)
+        ).only('id', 'created_at').distinct()
+        ordering = keyset_ordering('-created_at')
         
-        try:
-            products_page = paginator.page(page)
-        except (PageNotAnInteger, EmptyPage):
-            products_page = paginator.page(1)
+        # Paginate - ?cursor= switches to keyset mode (no OFFSET, no COUNT)
+        if 'cursor' in request.GET:
+            products_page = paginate_by_cursor(
+                products, ordering, request.GET.get('cursor'), per_page, count=False
+            )
+            next_cursor = products_page.next_cursor
+        else:
+            paginator = Paginator(products.order_by(*ordering), per_page)
+            
+            try:
+                products_page = paginator.page(page)
+            except (PageNotAnInteger, EmptyPage):
+                products_page = paginator.page(1)
+            next_cursor = cursor_after_page(products_page, ordering, None)
         
-        # Prepare response
-        products_data = []
-        for product in products_page:
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'slug': product.slug,
-                'price': str(product.price),
-                'discount_price': str(product.discount_price) if product.discount_price else None,
-                'discount_percentage': product.get_discount_percentage(),
-                'brand_name': product.brand.name if product.brand else '',
-                'image_url': product.images.first().image.url if product.images.exists() else '/static/img/no-image.jpg',
-                'url': product.get_absolute_url(),
-            })
+        # Prepare response from the page's cards
+        products_data = [card.to_dict() for card in hydrate_page(products_page)]
         
         response_data = {
             'success': True,
             'products': products_data,
             'has_next': products_page.has_next(),
             'next_page': products_page.next_page_number() if products_page.has_next() else None,
+            'next_cursor': next_cursor,
             'category_name': category.name,
         }
         
@@ -923,4 +812,26 @@ def terms_and_conditions(request):
     return render(request, "policies/terms_and_conditions.html")
 
 def Replacement_Policy(request):
-    return render(request, "policies/Replacement_Policy.html")
\ No newline at end of file
+    return render(request, "policies/Replacement_Policy.html")
+
+
+def resized_image(request, width, height, path, format=None):
+    """Media file fitted into an allowed box (core.resize): generated once, then served from disk"""
+    try:
+        result = resize.get_or_create(path, int(width), int(height), format or resize.DEFAULT_FORMAT)
+    except (UnidentifiedImageError, Image.DecompressionBombError, ValueError) as e:
+        # Not a usable image (or over the pixel budget); disk and permission
+        # errors are real failures and propagate
+        logger.warning("Cannot resize %s: %s", path, e)
+        raise Http404("Image not available")
+    if result is None:
+        raise Http404("Image size or format not served")
+    target, content_type, cache_control = result
+    sendfile = resize.sendfile_header(target)
+    if sendfile:
+        response = HttpResponse(content_type=content_type)
+        response[sendfile[0]] = sendfile[1]
+    else:
+        response = FileResponse(open(target, 'rb'), content_type=content_type)
+    response['Cache-Control'] = cache_control
+    return response
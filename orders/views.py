@@ -3,6 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import Order, OrderItem, OrderTrackingTableNew
 from products.models import Product, ProductVariation
+from products.variations import attributes_from_post, resolve_for_sale
 from accounts.models import CustomerProfile
 import json
 from django.shortcuts import render, redirect
@@ -176,21 +177,15 @@ def process_buy_now(request):
         product = Product.objects.get(id=product_id)
         
         # Get selected variations
-        variation_attributes = {}
-        for key, value in request.POST.items():
-            if key.startswith('attribute_'):
-                attr_name = key.replace('attribute_', '')
-                variation_attributes[attr_name] = value
+        variation_attributes = attributes_from_post(request.POST)
         
-        # Find the matching variation
-        variation = None
-        if variation_attributes:
-            variations = product.variations.all()
-            for v in variations:
-                if all(attr.value == variation_attributes.get(attr.attribute.name.lower().replace(' ', '_')) 
-                       for attr in v.attributes.all()):
-                    variation = v
-                    break
+        # Find the matching variation (cached matrix lookup, live stock and price)
+        variation = resolve_for_sale(product, variation_attributes)
+        if variation and variation.stock < quantity:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Not enough stock available'
+            }, status=400)
         
         # Calculate price
         price = variation.get_price() if variation else product.get_price()
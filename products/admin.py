@@ -60,26 +60,59 @@ from .models import Brand, Category, Attribute, AttributeValue, Product, Product
     
 #     duplicate_product.short_description = "Duplicate selected products"
 
+from django import forms
 from django.contrib import admin
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.html import format_html
+from . import renditions
 from .models import Brand, Category, Attribute, AttributeValue, Product, ProductImage, ProductAttribute, ProductVariation
 
+class ProductImageForm(forms.ModelForm):
+    """Stores new uploads unprocessed; resizing/encoding runs in the background"""
+    
+    class Meta:
+        model = ProductImage
+        fields = ['image', 'alt_text', 'is_featured', 'display_order']
+    
+    def save(self, commit=True):
+        upload = self.cleaned_data.get('image')
+        if 'image' in self.changed_data and isinstance(upload, UploadedFile):
+            renditions.queue_upload(self.instance, upload)
+        return super().save(commit)
+
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
+    form = ProductImageForm
     extra = 1
-    fields = ['image_preview', 'image', 'alt_text', 'is_featured', 'display_order']
-    readonly_fields = ['image_preview']
+    fields = ['image_preview', 'image', 'processing_state', 'alt_text', 'is_featured', 'display_order']
+    readonly_fields = ['image_preview', 'processing_state']
     
     def image_preview(self, obj):
         if obj.id and obj.image:
             return format_html(
                 '<img src="{}" width="80" height="80" style="object-fit: cover; border-radius: 4px; border: 1px solid #ddd;" />',
-                obj.thumbnail.url
+                obj.rendition_url('thumbnail')
             )
         return format_html(
             '<div style="width:80px;height:80px;background:#f8f9fa;display:flex;align-items:center;justify-content:center;border-radius:4px;border:1px dashed #ddd;color:#6c757d;">No image</div>'
         )
     image_preview.short_description = 'Preview'
+    
+    def processing_state(self, obj):
+        if not obj.id or not obj.image:
+            return '-'
+        if obj.processing_given_up:
+            color, label = '#dc3545', 'Failed'
+        elif obj.processing_status == ProductImage.FAILED:
+            color, label = '#dc3545', 'Failed (retrying)'
+        elif obj.processing_status == ProductImage.QUEUED:
+            color, label = '#6c757d', 'Queued'
+        elif not obj.renditions_ready:
+            color, label = '#fd7e14', 'Processing'
+        else:
+            color, label = '#28a745', 'Ready'
+        return format_html('<span style="color:{};" title="{}">{}</span>', color, obj.processing_error, label)
+    processing_state.short_description = 'Status'
 
 class ProductAttributeInline(admin.TabularInline):
     model = ProductAttribute
@@ -115,18 +148,18 @@ class ProductAdmin(admin.ModelAdmin):
             'description': 'Add safety warnings, precautions, and usage guidelines for this product.'
         }),
         ('Statistics', {
-            'fields': ('view_count', 'created_at', 'updated_at'),
+            'fields': ('view_count', 'popularity_score', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
-    readonly_fields = ('view_count', 'created_at', 'updated_at', 'main_image_preview')
+    readonly_fields = ('view_count', 'popularity_score', 'created_at', 'updated_at', 'main_image_preview')
     
     def image_tag(self, obj):
         main_image = obj.get_main_image()
         if main_image:
             return format_html(
                 '<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 4px;" />',
-                main_image.thumbnail.url
+                main_image.rendition_url('thumbnail')
             )
         return format_html(
             '<div style="width:50px;height:50px;background:#f0f0f0;display:flex;align-items:center;justify-content:center;border-radius:4px;">📷</div>'
@@ -156,7 +189,7 @@ class ProductAdmin(admin.ModelAdmin):
         if main_image:
             return format_html(
                 '<img src="{}" style="max-width: 300px; max-height: 300px; border-radius: 8px; border: 1px solid #ddd;" />',
-                main_image.medium.url
+                main_image.rendition_url('medium')
             )
         return "No image uploaded"
     main_image_preview.short_description = 'Main Image Preview'
@@ -0,0 +1,156 @@
+"""
+ProductCard maintenance and lookups.
+
+Listing grids, home sections, infinite scroll, related/frequently bought
+and quick view all render the same handful of fields. Rather than joining
+brand, images, variations and attributes per card on every request, each
+product's card is built once when something it shows changes and read back
+as a single narrow row.
+"""
+from django.db import transaction
+from django.db.models import Prefetch
+
+from core import images
+
+from .models import Product, ProductCard, ProductImage, ProductAttribute, ProductVariation
+
+
+# Image URLs kept on the card for the quick view gallery
+CARD_IMAGE_LIMIT = 5
+# Attribute lines shown as quick view features
+CARD_FEATURE_LIMIT = 6
+# Rendition width used as the grid tile src
+CARD_THUMBNAIL_WIDTH = 400
+
+CARD_FIELDS = [
+    field.name for field in ProductCard._meta.concrete_fields
+    if field.name not in ('product', 'updated_at')
+]
+
+
+def _card_products(product_ids):
+    return Product.objects.filter(id__in=product_ids).select_related('brand').prefetch_related(
+        Prefetch(
+            'images',
+            queryset=ProductImage.objects.only('image', 'product', 'is_featured', 'display_order', 'rendition_info')
+            .order_by('display_order', 'id')
+        ),
+        Prefetch(
+            'variations',
+            queryset=ProductVariation.objects.only('product', 'stock')
+        ),
+        Prefetch(
+            'productattribute_set',
+            queryset=ProductAttribute.objects.select_related('attribute_value__attribute')
+            .order_by('attribute_value__attribute__name', 'attribute_value__value')
+        ),
+    )
+
+
+def _image_url(image):
+    try:
+        return image.rendition_url('image')
+    except ValueError:
+        # Row without a file
+        return ''
+
+
+def build_card(product):
+    """Unsaved ProductCard for a product loaded by _card_products"""
+    product_images = list(product.images.all())
+    featured = next((image for image in product_images if image.is_featured), None)
+    if featured:
+        product_images.remove(featured)
+        product_images.insert(0, featured)
+    product_images = [image for image in product_images[:CARD_IMAGE_LIMIT] if _image_url(image)]
+    image_urls = [_image_url(image) for image in product_images]
+
+    # Grid tiles show the card-width rendition, with the ladder as srcset
+    main = product_images[0] if product_images else None
+    thumbnail_url = main.rendition_url(f'{CARD_THUMBNAIL_WIDTH}.webp') if main else ''
+    thumbnail_srcset = {format: main.srcset(format) for format in images.FORMATS} if main else {}
+    thumbnail_info = (main.rendition(f'{CARD_THUMBNAIL_WIDTH}.webp') or main.rendition('image') or {}) if main else {}
+
+    features = [
+        f'{link.attribute_value.attribute.name}: {link.attribute_value.value}'
+        for link in list(product.productattribute_set.all())[:CARD_FEATURE_LIMIT]
+    ]
+
+    brand = product.brand
+    return ProductCard(
+        product_id=product.id,
+        name=product.name,
+        slug=product.slug,
+        sku=product.sku,
+        brand_name=brand.name if brand else '',
+        brand_slug=brand.slug if brand else '',
+        price=product.price,
+        discount_price=product.discount_price,
+        effective_price=product.get_price(),
+        discount_percentage=product.get_discount_percentage(),
+        thumbnail_url=thumbnail_url or (image_urls[0] if image_urls else ''),
+        thumbnail_srcset=thumbnail_srcset,
+        placeholder=main.placeholder if main else '',
+        thumbnail_width=thumbnail_info.get('width'),
+        thumbnail_height=thumbnail_info.get('height'),
+        image_urls=image_urls,
+        features=features,
+        short_description=product.get_short_description(),
+        rating_avg=product.rating_avg,
+        rating_count=product.rating_count,
+        in_stock=product.is_in_stock(),
+        is_active=product.is_active,
+        is_featured=product.is_featured,
+        created_at=product.created_at,
+        view_count=product.view_count,
+        popularity_score=product.popularity_score,
+    )
+
+
+def refresh_cards(product_ids):
+    """Rebuild (upsert) the cards of the given products"""
+    product_ids = sorted({pid for pid in product_ids if pid})
+    if not product_ids:
+        return []
+    cards = [build_card(product) for product in _card_products(product_ids)]
+    if cards:
+        ProductCard.objects.bulk_create(
+            cards,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=CARD_FIELDS + ['updated_at'],
+        )
+    return cards
+
+
+def schedule_refresh(product_ids):
+    """Rebuild cards once the surrounding transaction commits"""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: refresh_cards(product_ids))
+
+
+def get_cards(product_ids):
+    """Cards for the given ids in the same order, building any that are missing"""
+    product_ids = list(product_ids)
+    by_id = ProductCard.objects.in_bulk(product_ids)
+    missing = [pid for pid in product_ids if pid not in by_id]
+    if missing:
+        for card in refresh_cards(missing):
+            by_id[card.product_id] = card
+    return [by_id[pid] for pid in product_ids if pid in by_id]
+
+
+def get_card(product_id):
+    cards = get_cards([product_id])
+    return cards[0] if cards else None
+
+
+def cards_for(products):
+    """Cards for a sliced Product queryset or list, keeping its order"""
+    return get_cards([product.id for product in products])
+
+
+def hydrate_page(page):
+    """Swap a page's products for their cards in place and return it"""
+    page.object_list = cards_for(page.object_list)
+    return page
@@ -0,0 +1,384 @@
+"""
+One place that turns catalog request parameters into a product queryset.
+
+CatalogQuery normalizes the filters of every listing entry point (catalogue,
+product list/category/brand pages, infinite scroll, name search and the
+product list API) into a hashable spec. Equivalent requests therefore compile
+to the same SQL and share the same cache_key, whatever parameter spelling
+they arrived with.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Q, Prefetch
+
+from .cards import get_cards
+from .facets import ids_to_bits, current_version, INDEX_MAX_AGE
+from .models import Product, Category, ProductImage
+from .pagination import keyset_ordering, decode_cursor, encode_cursor, paginate_by_cursor, CursorPage
+
+
+# sort option -> ordering (keyset_ordering adds the id tie-breaker)
+SORT_ORDERINGS = {
+    '': ('-created_at',),
+    'newest': ('-created_at',),
+    'price_asc': ('effective_price',),
+    'price_desc': ('-effective_price',),
+    'rating': ('-rating_avg', '-rating_count'),
+    'popular': ('-popularity_score',),
+    'name': ('name',),
+}
+
+# Columns the listing cards, JSON responses and list serializer read
+LISTING_FIELDS = (
+    'id', 'name', 'slug', 'price', 'discount_price', 'effective_price',
+    'brand__id', 'brand__name', 'brand__slug', 'created_at', 'view_count', 'popularity_score',
+    'description', 'is_featured', 'sku', 'rating_avg', 'rating_count',
+)
+
+# Ordered id lists are cached per spec and catalog version; listings
+# longer than LISTING_CACHE_MAX_IDS only cache their head. The version only
+# moves across workers with a shared cache, so entries live no longer than
+# the facet index does (products.facets)
+LISTING_CACHE_TIMEOUT = INDEX_MAX_AGE
+LISTING_CACHE_MAX_IDS = 5000
+
+
+def _clean_text(value):
+    return (value or '').strip()
+
+
+def _clean_list(values):
+    return tuple(sorted({_clean_text(v) for v in values if _clean_text(v)}))
+
+
+def _clean_ids(values):
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (ValueError, TypeError):
+            continue
+    return tuple(sorted(ids))
+
+
+def _clean_price(value):
+    if value in (None, ''):
+        return None
+    try:
+        price = Decimal(str(value))
+        # nan/inf parse, but no price bucket or comparison can use them
+        if not price.is_finite():
+            return None
+        return price.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def _clean_rating(value):
+    if value in (None, ''):
+        return None
+    try:
+        return round(float(value), 2)
+    except (ValueError, TypeError):
+        return None
+
+
+def _clean_flag(value):
+    return str(value or '').lower() == 'true'
+
+
+class CatalogQuery:
+    """Normalized, hashable catalog filter + sort spec that compiles to a queryset"""
+
+    def __init__(self, categories=(), brand=None, brands=(), query='', name_only=False,
+                 min_price=None, max_price=None, rating=None, attributes=(),
+                 featured=False, sort=''):
+        self.categories = _clean_list(categories)
+        self.brand = _clean_text(brand) or None
+        self.brands = _clean_list(brands)
+        # icontains ignores case, so case variants are the same query
+        self.query = _clean_text(query).lower()
+        self.name_only = bool(name_only)
+        self.min_price = _clean_price(min_price)
+        self.max_price = _clean_price(max_price)
+        self.rating = _clean_rating(rating)
+        self.attributes = _clean_ids(attributes)
+        self.featured = bool(featured)
+        self.sort = sort if sort in SORT_ORDERINGS else ''
+        self._categories = None
+        self._search_bits = None
+
+    @classmethod
+    def from_params(cls, params, category_slug=None, brand_slug=None, **kwargs):
+        """Build from GET/query params (category, brand, q, min_price, ..., attribute, sort)"""
+        categories = [params.get('category', ''), category_slug or '']
+        options = dict(
+            categories=categories,
+            brand=brand_slug,
+            brands=params.getlist('brand'),
+            query=params.get('q', ''),
+            min_price=params.get('min_price'),
+            max_price=params.get('max_price'),
+            rating=params.get('rating'),
+            attributes=params.getlist('attribute'),
+            featured=_clean_flag(params.get('featured')),
+            sort=params.get('sort', ''),
+        )
+        options.update(kwargs)
+        return cls(**options)
+
+    @classmethod
+    def from_filters(cls, filters, **kwargs):
+        """Build from the JSON `filters` object the infinite-scroll POST sends"""
+        options = dict(
+            categories=[filters.get('category') or ''],
+            brands=filters.get('brands') or [],
+            query=filters.get('q') or '',
+            min_price=filters.get('min_price'),
+            max_price=filters.get('max_price'),
+            rating=filters.get('rating'),
+            attributes=filters.get('attributes') or [],
+            featured=_clean_flag(filters.get('featured')),
+            sort=filters.get('sort') or '',
+        )
+        options.update(kwargs)
+        return cls(**options)
+
+    # ------------------------------------------------------------------
+    # Identity
+    # ------------------------------------------------------------------
+
+    @property
+    def ordering(self):
+        return keyset_ordering(*SORT_ORDERINGS[self.sort])
+
+    @property
+    def spec(self):
+        """The normalized filters; two queries with equal specs return the same rows in the same order"""
+        return (
+            self.categories, self.brand, self.brands, self.query, self.name_only,
+            None if self.min_price is None else str(self.min_price),
+            None if self.max_price is None else str(self.max_price),
+            self.rating, self.attributes, self.featured, tuple(self.ordering),
+        )
+
+    @property
+    def cache_key(self):
+        digest = hashlib.md5(repr(self.spec).encode('utf-8')).hexdigest()
+        return f'catalog:{digest}'
+
+    def __eq__(self, other):
+        return isinstance(other, CatalogQuery) and self.spec == other.spec
+
+    def __hash__(self):
+        return hash(self.spec)
+
+    def __repr__(self):
+        return f'CatalogQuery{self.spec!r}'
+
+    # ------------------------------------------------------------------
+    # Compiling
+    # ------------------------------------------------------------------
+
+    def get_categories(self):
+        """Active categories named by the spec, keyed by slug (one query, cached)"""
+        if self._categories is None:
+            self._categories = {}
+            if self.categories:
+                self._categories = {
+                    category.slug: category
+                    for category in Category.objects.filter(
+                        slug__in=self.categories, is_active=True
+                    ).only('id', 'name', 'slug', 'parent_id', 'image')
+                }
+        return self._categories
+
+    def search_filter(self):
+        if self.name_only:
+            return Q(name__icontains=self.query)
+        return (
+            Q(name__icontains=self.query) |
+            Q(description__icontains=self.query) |
+            Q(sku__icontains=self.query)
+        )
+
+    def filter(self, products):
+        """Apply the spec's filters (not the ordering) to a Product queryset"""
+        products = products.filter(is_active=True)
+        if self.featured:
+            products = products.filter(is_featured=True)
+
+        categories = self.get_categories()
+        for slug in self.categories:
+            if slug not in categories:
+                return products.none()
+            products = products.in_category(categories[slug])
+
+        if self.brand:
+            products = products.filter(brand__slug=self.brand, brand__is_active=True)
+        if self.brands:
+            products = products.filter(brand__slug__in=self.brands)
+        if self.query:
+            products = products.filter(self.search_filter())
+        if self.min_price is not None:
+            products = products.filter(effective_price__gte=self.min_price)
+        if self.max_price is not None:
+            products = products.filter(effective_price__lte=self.max_price)
+        if self.rating is not None:
+            products = products.filter(rating_avg__gte=self.rating)
+        if self.attributes:
+            products = products.filter(attributes__id__in=self.attributes).distinct()
+        return products
+
+    def queryset(self):
+        """The ordered listing queryset with the columns and prefetches the listings use"""
+        return self.filter(listing_queryset()).order_by(*self.ordering)
+
+    def listing(self):
+        """The ordered results as a CachedListing (cached id list, hydrated per page)"""
+        key = f'{self.cache_key}:v{current_version()}'
+        entry = cache.get(key)
+        if entry is None:
+            ids = list(
+                self.filter(Product.objects.all()).order_by(*self.ordering)
+                .values_list('id', flat=True)[:LISTING_CACHE_MAX_IDS + 1]
+            )
+            if len(ids) > LISTING_CACHE_MAX_IDS:
+                ids = ids[:LISTING_CACHE_MAX_IDS]
+                total = self.filter(Product.objects.all()).count()
+            else:
+                total = len(ids)
+            entry = (ids, total)
+            cache.set(key, entry, LISTING_CACHE_TIMEOUT)
+        return CachedListing(self, *entry)
+
+    # ------------------------------------------------------------------
+    # Facet index masks
+    # ------------------------------------------------------------------
+
+    def search_bits(self):
+        """Bitset of products matching the text search (a DB id query), or None without one"""
+        if not self.query:
+            return None
+        if self._search_bits is None:
+            self._search_bits = ids_to_bits(
+                Product.objects.filter(self.search_filter(), is_active=True)
+                .order_by().values_list('id', flat=True)
+            )
+        return self._search_bits
+
+    def facet_mask(self, facet_index, with_db=True):
+        """
+        Bitset of the products this spec selects, answered by the facet index.
+        Text search and rating need an id query each; with_db=False skips
+        them for callers that only want the in-memory part.
+        """
+        bits = facet_index.all_bits
+        if self.featured:
+            bits &= facet_index.featured_bits
+
+        categories = self.get_categories()
+        for slug in self.categories:
+            category = categories.get(slug)
+            bits &= facet_index.category_mask(category.id) if category else 0
+
+        if self.brand:
+            brand_id = facet_index.brand_ids_by_slug.get(self.brand)
+            brand = facet_index.brands.get(brand_id)
+            bits &= facet_index.brand_bits.get(brand_id, 0) if brand and brand['is_active'] else 0
+        if self.brands:
+            bits &= facet_index.brand_mask(self.brands)
+        if self.min_price is not None:
+            bits &= facet_index.min_price_mask(self.min_price)
+        if self.max_price is not None:
+            bits &= facet_index.max_price_mask(self.max_price)
+        if self.attributes:
+            bits &= facet_index.attribute_mask(self.attributes)
+
+        if with_db:
+            if self.query:
+                bits &= self.search_bits()
+            if self.rating is not None:
+                bits &= ids_to_bits(
+                    Product.objects.filter(is_active=True, rating_avg__gte=self.rating)
+                    .order_by().values_list('id', flat=True)
+                )
+        return bits
+
+
+def listing_queryset():
+    """Product queryset with just the columns and prefetches the listing cards read"""
+    return Product.objects.select_related('brand').prefetch_related(
+        Prefetch(
+            'images',
+            queryset=ProductImage.objects.only(
+                'image', 'product_id', 'is_featured', 'rendition_info', 'renditions_source'
+            ).order_by('display_order', 'id')
+        )
+    ).only(*LISTING_FIELDS)
+
+
+class CachedListing:
+    """
+    Sequence view over a cached, ordered id list. Paginator slices it like
+    a queryset; each slice hydrates only its own ProductCards with one
+    in_bulk(). Slices past the cached head fall back to an id query.
+    """
+
+    def __init__(self, catalog, ids, total):
+        self.catalog = catalog
+        self.ids = ids
+        self.total = total
+        self._positions = None
+
+    def count(self):
+        return self.total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self.total)
+            if stop <= len(self.ids):
+                return self.hydrate(self.ids[start:stop])
+            return self.hydrate(self.id_queryset()[start:stop])
+        return self[index:index + 1][0]
+
+    def id_queryset(self):
+        return self.catalog.filter(Product.objects.all()).order_by(
+            *self.catalog.ordering
+        ).values_list('id', flat=True)
+
+    def hydrate(self, ids):
+        return get_cards(ids)
+
+    def cursor_page(self, cursor=None, per_page=12):
+        """
+        Same contract as pagination.paginate_by_cursor, served from the id
+        list: the cursor's trailing id gives the position to continue from.
+        """
+        ordering = self.catalog.ordering
+        payload = decode_cursor(cursor, ordering)
+        start, number = 0, 1
+        if payload:
+            if self._positions is None:
+                self._positions = {product_id: i for i, product_id in enumerate(self.ids)}
+            position = self._positions.get(payload['k'][-1])
+            if position is None:
+                # Cursor from before the catalog changed, or past the cached head
+                page = paginate_by_cursor(
+                    self.catalog.filter(Product.objects.only(*{f.lstrip('-') for f in ordering})),
+                    ordering, cursor, per_page
+                )
+                page.object_list = self.hydrate([product.id for product in page.object_list])
+                return page
+            start, number = position + 1, payload['p'] + 1
+
+        rows = self[start:start + per_page]
+        next_cursor = None
+        if rows and start + per_page < self.total:
+            next_cursor = encode_cursor(rows[-1], ordering, self.total, number)
+        return CursorPage(rows, number, self.total, next_cursor)
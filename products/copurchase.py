@@ -0,0 +1,177 @@
+"""
+Offline "frequently bought together" matrix.
+
+build() streams OrderItem rows of the orders placed since the last run,
+grouped by order, and adds every product pair of each basket to the sparse
+ProductPairCount table. For each product touched by those orders it then
+re-ranks its partners and stores the top K with their confidence and lift
+in ProductCoPurchase, which the panels and the API read by product id.
+
+Counting is plain Counter arithmetic over streamed baskets. The site has
+no NumPy dependency, and baskets are small, so a per-order
+combinations() loop is what batched counting comes down to here.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby
+
+from django.db import transaction
+from django.db.models import Q, F
+from django.utils import timezone
+
+from .models import ProductPairCount, ProductCoPurchase, CoPurchaseRun
+
+
+TOP_K = 8
+MIN_PAIR_COUNT = 1
+# Very large baskets (bulk/B2B orders) add n^2 pairs and little signal
+MAX_BASKET_SIZE = 50
+# Orders younger than this may still be receiving items in an open transaction
+GRACE_PERIOD = timedelta(minutes=10)
+BATCH_SIZE = 500
+
+
+def _baskets(after_order_id, cutoff):
+    """(order_id, sorted product ids) per order, streamed in order id order"""
+    from orders.models import OrderItem
+
+    rows = OrderItem.objects.filter(
+        order_id__gt=after_order_id, order__created_at__lte=cutoff
+    ).order_by('order_id').values_list('order_id', 'product_id').iterator(chunk_size=2000)
+    for order_id, items in groupby(rows, key=lambda row: row[0]):
+        yield order_id, sorted({product_id for _, product_id in items})
+
+
+def count_pairs(baskets):
+    """Count pairs over baskets; returns (pair Counter, orders seen, last order id)"""
+    counts = Counter()
+    orders = 0
+    last_order_id = None
+    for order_id, product_ids in baskets:
+        last_order_id = order_id
+        orders += 1
+        if len(product_ids) > MAX_BASKET_SIZE:
+            product_ids = product_ids[:MAX_BASKET_SIZE]
+        for product_id in product_ids:
+            counts[(product_id, product_id)] += 1
+        counts.update(combinations(product_ids, 2))
+    return counts, orders, last_order_id
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def merge_counts(deltas):
+    """Add pair count deltas into ProductPairCount"""
+    by_product = defaultdict(dict)
+    for (product_id, partner_id), delta in deltas.items():
+        by_product[product_id][partner_id] = delta
+
+    for product_ids in _chunks(by_product):
+        existing = {
+            (row.product_id, row.partner_id): row.count
+            for row in ProductPairCount.objects.filter(product_id__in=product_ids)
+        }
+        rows = [
+            ProductPairCount(
+                product_id=product_id,
+                partner_id=partner_id,
+                count=existing.get((product_id, partner_id), 0) + delta,
+            )
+            for product_id in product_ids
+            for partner_id, delta in by_product[product_id].items()
+        ]
+        ProductPairCount.objects.bulk_create(
+            rows,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['product', 'partner'],
+            update_fields=['count'],
+        )
+
+
+def rank_partners(product_ids, order_count, top_k=TOP_K):
+    """Recompute and store the top-K partners of the given products"""
+    updated = 0
+    for chunk in _chunks(product_ids):
+        chunk_set = set(chunk)
+        pairs = defaultdict(dict)
+        for row in ProductPairCount.objects.filter(
+            Q(product_id__in=chunk) | Q(partner_id__in=chunk)
+        ).values_list('product_id', 'partner_id', 'count'):
+            product_id, partner_id, count = row
+            if product_id in chunk_set:
+                pairs[product_id][partner_id] = count
+            if partner_id in chunk_set and partner_id != product_id:
+                pairs[partner_id][product_id] = count
+
+        # Orders containing each partner (the diagonal), for lift
+        partner_ids = {partner_id for partners in pairs.values() for partner_id in partners}
+        support = dict(ProductPairCount.objects.filter(
+            product_id__in=partner_ids, partner=F('product')
+        ).values_list('product_id', 'count')) if partner_ids else {}
+
+        rows = []
+        for product_id in chunk:
+            partners = pairs.get(product_id, {})
+            product_orders = partners.pop(product_id, 0)
+            if not product_orders:
+                continue
+            scored = []
+            for partner_id, count in partners.items():
+                if count < MIN_PAIR_COUNT:
+                    continue
+                confidence = count / product_orders
+                partner_share = support.get(partner_id, 0) / order_count if order_count else 0
+                lift = confidence / partner_share if partner_share else 0.0
+                scored.append((count, lift, partner_id, confidence))
+            scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+            for rank, (count, lift, partner_id, confidence) in enumerate(scored[:top_k], start=1):
+                rows.append(ProductCoPurchase(
+                    product_id=product_id, partner_id=partner_id, rank=rank,
+                    pair_count=count, confidence=confidence, lift=lift,
+                ))
+
+        ProductCoPurchase.objects.filter(product_id__in=chunk).delete()
+        ProductCoPurchase.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        updated += len(chunk)
+    return updated
+
+
+def build(rebuild=False, top_k=TOP_K, now=None):
+    """Fold orders placed since the last run into the matrix; returns the CoPurchaseRun"""
+    cutoff = (now or timezone.now()) - GRACE_PERIOD
+    with transaction.atomic():
+        previous = None if rebuild else CoPurchaseRun.objects.first()
+        if rebuild:
+            ProductPairCount.objects.all().delete()
+            ProductCoPurchase.objects.all().delete()
+        after_order_id = previous.last_order_id if previous else 0
+        order_count = previous.order_count if previous else 0
+
+        deltas, orders, last_order_id = count_pairs(_baskets(after_order_id, cutoff))
+        order_count += orders
+        if deltas:
+            merge_counts(deltas)
+
+        # Every product of the new baskets has its diagonal in deltas
+        touched = sorted({product_id for product_id, _ in deltas})
+        products_updated = rank_partners(touched, order_count, top_k) if touched else 0
+
+        return CoPurchaseRun.objects.create(
+            last_order_id=last_order_id or after_order_id,
+            order_count=order_count,
+            orders_processed=orders,
+            products_updated=products_updated,
+        )
+
+
+def partner_ids(product_id, limit=4):
+    """Ranked partner ids of a product (one indexed read)"""
+    return list(
+        ProductCoPurchase.objects.filter(product_id=product_id, partner__is_active=True)
+        .order_by('rank').values_list('partner_id', flat=True)[:limit]
+    )
@@ -0,0 +1,282 @@
+"""
+Product detail page data, cached as a compact dict per product.
+
+The page used to cache its whole template context (a Product instance with
+every prefetch, all approved reviews included) for five minutes. Instead
+the page data is flattened once into plain values: prices, stock, brand,
+categories, image URLs, specifications, the variation matrix, the rating
+summary and the first page of reviews. It is cached under a key that
+carries a per-product version. Every write that changes what the page
+shows bumps the version (see products/signals.py and reviews/signals.py).
+
+A bump only reaches other processes (web workers, management commands,
+the image thread pool) through a shared cache. Entries live for a day
+when one is configured. With the per-process LocMemCache, they keep the
+page's previous five minutes, which bounds how stale another worker's
+copy can be. Images still being processed when an entry was built are
+the exception: the entry is checked against the database on every read
+until their renditions exist, because they usually land from another
+process.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.urls import reverse
+
+from core.caching import SHARED_CACHE
+
+from .models import Product, ProductImage, ProductAttribute, ProductVariation, Category
+from .variations import build_matrix, matrix_for_client
+
+
+DETAIL_CACHE_TIMEOUT = 60 * 60 * 24 if SHARED_CACHE else 60 * 5
+REVIEW_PREVIEW_LIMIT = 5
+
+
+def _version_key(product_id):
+    return f'product_detail_version:{product_id}'
+
+
+def _slug_key(slug):
+    return f'product_detail_slug:{slug}'
+
+
+def get_version(product_id):
+    """Current detail version of a product; a fresh token if none is cached"""
+    key = _version_key(product_id)
+    version = cache.get(key)
+    if version is None:
+        # A timestamp rather than a counter: an evicted version can never
+        # come back as a number an older entry was cached under
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(product_ids):
+    cache.set_many({_version_key(product_id): time.time_ns() for product_id in set(product_ids) if product_id}, None)
+
+
+def schedule_bump(product_ids):
+    """Bump the detail version of the given products once the transaction commits"""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: bump_version(product_ids))
+
+
+def _image_data(image):
+    # URLs and sizes come from the rendition registry (products.renditions)
+    try:
+        url = image.rendition_url('image')
+    except ValueError:
+        return None
+    try:
+        thumbnail_url = image.rendition_url('thumbnail')
+    except Exception:
+        thumbnail_url = url
+    original = image.rendition('image') or {}
+    return {
+        'id': image.id,
+        'url': url,
+        'thumbnail_url': thumbnail_url,
+        'width': original.get('width'),
+        'height': original.get('height'),
+        # Width ladder for <picture>/srcset (core.images)
+        'srcset': image.srcset(),
+        'sources': image.sources(),
+        'placeholder': image.placeholder,
+        'alt_text': image.alt_text,
+        'is_featured': image.is_featured,
+    }
+
+
+def build_detail(product_id):
+    """Flatten one product's page data into plain values (None if it doesn't exist)"""
+    from reviews.models import Review
+
+    product = Product.objects.select_related('brand').prefetch_related(
+        Prefetch(
+            'images',
+            queryset=ProductImage.objects.only(
+                'id', 'image', 'product_id', 'is_featured', 'alt_text', 'display_order',
+                'rendition_info', 'renditions_source'
+            ).order_by('display_order', 'id')
+        ),
+        Prefetch(
+            'categories',
+            queryset=Category.objects.only('id', 'name', 'slug', 'parent_id', 'is_active')
+        ),
+        Prefetch(
+            'productattribute_set',
+            queryset=ProductAttribute.objects.select_related('attribute_value__attribute')
+        ),
+        Prefetch(
+            'variations',
+            queryset=ProductVariation.objects.filter(is_active=True).only('id', 'product_id', 'stock')
+        ),
+    ).filter(id=product_id).first()
+    if product is None:
+        return None
+
+    reviews = Review.objects.filter(
+        product_id=product_id, is_approved=True
+    ).select_related('user').only(
+        'id', 'product_id', 'user_id', 'rating', 'title', 'comment', 'created_at',
+        'user__username', 'user__first_name', 'user__last_name'
+    ).order_by('-created_at')[:REVIEW_PREVIEW_LIMIT]
+
+    # Built fresh rather than read from its own cache, which may not have
+    # been dropped yet when this version is rebuilt
+    matrix = build_matrix(product_id)
+
+    # Selector options: values of the in-stock variations, per attribute
+    options = {}
+    for entry in (matrix['entries'].values() if matrix else []):
+        if entry['stock'] <= 0:
+            continue
+        for name, value in entry['attributes'].items():
+            options.setdefault(name, set()).add(value)
+
+    total_stock = sum(variation.stock for variation in product.variations.all())
+    brand = product.brand
+
+    return {
+        'id': product.id,
+        'name': product.name,
+        'slug': product.slug,
+        'sku': product.sku,
+        'is_active': product.is_active,
+        'description': product.description,
+        'product_keywords': product.product_keywords,
+        'caution': product.caution,
+        'price': product.price,
+        'discount_price': product.discount_price,
+        'min_delivery_days': product.min_delivery_days,
+        'max_delivery_days': product.max_delivery_days,
+        'created_at': product.created_at,
+        'brand': {'name': brand.name, 'slug': brand.slug} if brand else None,
+        'categories': [
+            {
+                'id': category.id, 'name': category.name, 'slug': category.slug,
+                'url': category.get_absolute_url(), 'is_active': category.is_active,
+            }
+            for category in product.categories.all()
+        ],
+        'images': [data for data in map(_image_data, product.images.all()) if data],
+        # Shown with placeholders until their renditions exist (see _get_data)
+        'pending_image_ids': [image.id for image in product.images.all() if not image.renditions_ready],
+        'specifications': [
+            {'name': link.attribute_value.attribute.name, 'value': link.attribute_value.value}
+            for link in product.productattribute_set.all()
+        ],
+        'options': {name: sorted(values) for name, values in options.items()},
+        'variation_matrix': matrix_for_client(matrix),
+        'total_stock': total_stock,
+        'in_stock': any(variation.stock > 0 for variation in product.variations.all()),
+        'rating_avg': product.rating_avg,
+        'rating_count': product.rating_count,
+        'rating_histogram': product.rating_histogram,
+        'reviews': [
+            {
+                'id': review.id,
+                'rating': review.rating,
+                'title': review.title,
+                'comment': review.comment,
+                'created_at': review.created_at,
+                'user_name': review.user.get_full_name() or review.user.username,
+            }
+            for review in reviews
+        ],
+    }
+
+
+class ProductDetail:
+    """Template-facing wrapper around the cached detail dict"""
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+    @property
+    def main_image(self):
+        return self.images[0] if self.images else None
+
+    def get_absolute_url(self):
+        return reverse('product_detail', args=[self.slug])
+
+    def get_price(self):
+        return self.discount_price if self.discount_price else self.price
+
+    def get_discount_percentage(self):
+        if self.discount_price and self.price:
+            return round(((self.price - self.discount_price) / self.price) * 100)
+        return 0
+
+    def is_in_stock(self):
+        return self.in_stock
+
+    def get_total_stock(self):
+        return self.total_stock
+
+    @property
+    def review_count(self):
+        return self.rating_count
+
+    @property
+    def average_rating(self):
+        return self.rating_avg if self.rating_count else 0
+
+    @property
+    def avg_rating(self):
+        return round(self.rating_avg, 1) if self.rating_count else 0
+
+
+def _renditions_landed(image_ids):
+    return ProductImage.objects.filter(id__in=image_ids, renditions_source=F('image')).exists()
+
+
+def _get_data(product_id):
+    key = f'product_detail:{product_id}:v{get_version(product_id)}'
+    data = cache.get(key)
+    if data is not None and data.get('pending_image_ids') and _renditions_landed(data['pending_image_ids']):
+        # Processed by another process (thread pool, --watch worker) whose
+        # version bump this cache may not see
+        data = None
+    if data is None:
+        data = build_detail(product_id)
+        if data is not None:
+            cache.set(key, data, DETAIL_CACHE_TIMEOUT)
+    return data
+
+
+def get_product_detail_by_id(product_id):
+    """ProductDetail for an active product id, or None"""
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return None
+    data = _get_data(product_id)
+    if data is None or not data['is_active']:
+        return None
+    return ProductDetail(data)
+
+
+def get_product_detail(slug, _retry=True):
+    """ProductDetail for an active product's slug, or None"""
+    product_id = cache.get(_slug_key(slug))
+    cached_id = product_id is not None
+    if product_id is None:
+        product_id = Product.objects.filter(slug=slug, is_active=True).values_list('id', flat=True).first()
+        if product_id is None:
+            return None
+        cache.set(_slug_key(slug), product_id, DETAIL_CACHE_TIMEOUT)
+
+    data = _get_data(product_id)
+    if data is None or data['slug'] != slug or not data['is_active']:
+        # Product deleted, deactivated or renamed since the slug was cached
+        cache.delete(_slug_key(slug))
+        if cached_id and _retry:
+            return get_product_detail(slug, _retry=False)
+        return None
+    return ProductDetail(data)
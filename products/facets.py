@@ -0,0 +1,405 @@
+"""
+In-memory facet index for catalog sidebars.
+
+Every active product is one bit (its primary key) in a set of Python int
+bitsets: one per brand, per category, per attribute value and per price
+bucket. Sidebar counts ("all context" and "currently available") are then
+answered by AND + bit_count() instead of COUNT/JOIN aggregate queries.
+
+The index is built lazily per process and patched incrementally by the
+signals in products/signals.py. Each patch moves a version counter in the
+cache and logs the changed product ids under that version, so a process
+whose index is behind re-reads just those products. It rebuilds in full
+only when the log doesn't cover the gap (an invalidate(), an evicted
+entry, or more than MAX_PATCH_VERSIONS changes), or when the index gets
+older than INDEX_MAX_AGE.
+
+Other processes only see the version and log through a cache they share
+(Redis, Memcached, the database cache). With a per-process backend such
+as the default LocMemCache, each process sees only its own changes, so
+INDEX_MAX_AGE bounds how long the other workers drift.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Width of one price bucket, in store currency units
+PRICE_BUCKET_SIZE = 100
+
+# Rebuild at least this often, so processes that never see the signals
+# (other workers with a per-process cache) do not drift for long
+INDEX_MAX_AGE = 300
+
+VERSION_CACHE_KEY = 'facet_index_version'
+CHANGES_CACHE_KEY = 'facet_index_changes:{}'
+# Longest gap a stale index catches up on by patching instead of rebuilding
+MAX_PATCH_VERSIONS = 200
+
+
+def iter_bits(bits):
+    """Yield the positions (product ids) of the set bits, lowest first"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def ids_to_bits(ids):
+    """Build a bitset from an iterable of product ids"""
+    bits = 0
+    for product_id in ids:
+        bits |= 1 << product_id
+    return bits
+
+
+def _bucket(price):
+    return int(price // PRICE_BUCKET_SIZE)
+
+
+class FacetIndex:
+    """Bitsets of active product ids keyed by brand, category, attribute value and price bucket"""
+
+    def __init__(self):
+        self.version = None
+        self.built_at = 0
+        self.all_bits = 0
+        self.featured_bits = 0
+
+        # product id -> (brand_id, effective_price, is_featured)
+        self.products = {}
+        self.product_categories = {}
+        self.product_attributes = {}
+
+        self.brand_bits = {}
+        self.category_bits = {}
+        self.attribute_bits = {}
+        self.price_buckets = {}
+
+        # Lookup tables for rendering the sidebar without extra queries
+        self.brands = {}
+        self.brand_ids_by_slug = {}
+        self.category_children = {}
+        self.attribute_values = {}
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    def build(self):
+        from .models import Product, Brand, Category, AttributeValue, ProductAttribute
+
+        self.__init__()
+
+        for brand_id, name, slug, logo, is_active in Brand.objects.values_list(
+            'id', 'name', 'slug', 'logo', 'is_active'
+        ):
+            self.brands[brand_id] = {
+                'id': brand_id, 'name': name, 'slug': slug, 'logo': logo, 'is_active': is_active,
+            }
+            self.brand_ids_by_slug[slug] = brand_id
+
+        for category_id, parent_id in Category.objects.values_list('id', 'parent_id'):
+            self.category_children.setdefault(category_id, [])
+            if parent_id:
+                self.category_children.setdefault(parent_id, []).append(category_id)
+
+        for value_id, value, attribute_name in AttributeValue.objects.values_list(
+            'id', 'value', 'attribute__name'
+        ):
+            self.attribute_values[value_id] = {'id': value_id, 'value': value, 'attribute': attribute_name}
+
+        rows = Product.objects.filter(is_active=True).order_by().values_list(
+            'id', 'brand_id', 'effective_price', 'is_featured'
+        )
+        for product_id, brand_id, price, is_featured in rows:
+            self._add_product(product_id, brand_id, price, is_featured)
+
+        category_links = Product.categories.through.objects.filter(
+            product__is_active=True
+        ).values_list('product_id', 'category_id')
+        for product_id, category_id in category_links:
+            self._link(product_id, category_id, self.product_categories, self.category_bits)
+
+        attribute_links = ProductAttribute.objects.filter(
+            product__is_active=True
+        ).values_list('product_id', 'attribute_value_id')
+        for product_id, value_id in attribute_links:
+            self._link(product_id, value_id, self.product_attributes, self.attribute_bits)
+
+        self.built_at = time.time()
+        return self
+
+    def _add_product(self, product_id, brand_id, price, is_featured):
+        bit = 1 << product_id
+        self.products[product_id] = (brand_id, price, is_featured)
+        self.all_bits |= bit
+        if is_featured:
+            self.featured_bits |= bit
+        if brand_id:
+            self.brand_bits[brand_id] = self.brand_bits.get(brand_id, 0) | bit
+        if price is not None:
+            key = _bucket(price)
+            self.price_buckets[key] = self.price_buckets.get(key, 0) | bit
+
+    def _link(self, product_id, key, links, bitsets):
+        if product_id not in self.products:
+            return
+        links.setdefault(product_id, set()).add(key)
+        bitsets[key] = bitsets.get(key, 0) | (1 << product_id)
+
+    def remove_product(self, product_id):
+        """Clear every bit owned by one product"""
+        if product_id not in self.products:
+            return
+        mask = ~(1 << product_id)
+        brand_id, price, is_featured = self.products.pop(product_id)
+
+        self.all_bits &= mask
+        self.featured_bits &= mask
+        if brand_id in self.brand_bits:
+            self.brand_bits[brand_id] &= mask
+        if price is not None:
+            self.price_buckets[_bucket(price)] &= mask
+        for category_id in self.product_categories.pop(product_id, ()):
+            self.category_bits[category_id] &= mask
+        for value_id in self.product_attributes.pop(product_id, ()):
+            self.attribute_bits[value_id] &= mask
+
+    def refresh_product(self, product_id):
+        """Re-read one product and its links from the database"""
+        from .models import Product, ProductAttribute
+
+        self.remove_product(product_id)
+
+        row = Product.objects.filter(id=product_id, is_active=True).values_list(
+            'brand_id', 'effective_price', 'is_featured'
+        ).first()
+        if row is None:
+            return
+
+        self._add_product(product_id, *row)
+        category_ids = Product.categories.through.objects.filter(
+            product_id=product_id
+        ).values_list('category_id', flat=True)
+        for category_id in category_ids:
+            self._link(product_id, category_id, self.product_categories, self.category_bits)
+        value_ids = ProductAttribute.objects.filter(
+            product_id=product_id
+        ).values_list('attribute_value_id', flat=True)
+        for value_id in value_ids:
+            self._link(product_id, value_id, self.product_attributes, self.attribute_bits)
+
+    # ------------------------------------------------------------------
+    # Masks
+    # ------------------------------------------------------------------
+
+    def category_mask(self, category_id):
+        """Products in a category or any of its descendants"""
+        bits = 0
+        stack = [category_id]
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            bits |= self.category_bits.get(current, 0)
+            stack.extend(self.category_children.get(current, ()))
+        return bits
+
+    def brand_mask(self, brand_slugs):
+        bits = 0
+        for slug in brand_slugs:
+            brand_id = self.brand_ids_by_slug.get(slug)
+            if brand_id:
+                bits |= self.brand_bits.get(brand_id, 0)
+        return bits
+
+    def attribute_mask(self, attribute_ids):
+        bits = 0
+        for value_id in attribute_ids:
+            try:
+                bits |= self.attribute_bits.get(int(value_id), 0)
+            except (ValueError, TypeError):
+                continue
+        return bits
+
+    def _price_bound_mask(self, value, lower):
+        """Products whose effective price is >= value (lower) or <= value (upper)"""
+        edge = _bucket(value)
+        bits = 0
+        for key, bucket_bits in self.price_buckets.items():
+            if (lower and key > edge) or (not lower and key < edge):
+                bits |= bucket_bits
+            elif key == edge:
+                for product_id in iter_bits(bucket_bits):
+                    price = self.products[product_id][1]
+                    if (price >= value) if lower else (price <= value):
+                        bits |= 1 << product_id
+        return bits
+
+    def min_price_mask(self, value):
+        return self._price_bound_mask(value, True)
+
+    def max_price_mask(self, value):
+        return self._price_bound_mask(value, False)
+
+    def context_mask(self, category_id=None, featured=False):
+        bits = self.all_bits
+        if category_id:
+            bits &= self.category_mask(category_id)
+        if featured:
+            bits &= self.featured_bits
+        return bits
+
+    # ------------------------------------------------------------------
+    # Facet counts
+    # ------------------------------------------------------------------
+
+    def count(self, mask):
+        return mask.bit_count()
+
+    def brand_counts(self, mask, active_only=True):
+        """Brands present in mask, most products first"""
+        result = []
+        for brand_id, bits in self.brand_bits.items():
+            brand = self.brands.get(brand_id)
+            if not brand or (active_only and not brand['is_active']):
+                continue
+            product_count = (bits & mask).bit_count()
+            if product_count:
+                result.append(dict(brand, product_count=product_count))
+        result.sort(key=lambda b: (-b['product_count'], b['name']))
+        return result
+
+    def attribute_counts(self, mask):
+        """Attribute values present in mask, ordered by attribute name then value"""
+        result = []
+        for value_id, bits in self.attribute_bits.items():
+            attr = self.attribute_values.get(value_id)
+            if not attr:
+                continue
+            product_count = (bits & mask).bit_count()
+            if product_count:
+                result.append(dict(attr, product_count=product_count))
+        result.sort(key=lambda a: (a['attribute'], a['value']))
+        return result
+
+    def price_range(self, mask):
+        """Min and max effective price within mask, scanning only the edge buckets"""
+        min_price = max_price = None
+        keys = sorted(self.price_buckets)
+        for key in keys:
+            hit = self.price_buckets[key] & mask
+            if hit:
+                min_price = min(self.products[pid][1] for pid in iter_bits(hit))
+                break
+        for key in reversed(keys):
+            hit = self.price_buckets[key] & mask
+            if hit:
+                max_price = max(self.products[pid][1] for pid in iter_bits(hit))
+                break
+        return {'min_price': min_price, 'max_price': max_price}
+
+
+_index = None
+_lock = threading.RLock()
+
+
+def current_version():
+    """Catalog version; moves whenever products, prices or the category tree change"""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def _changes_since(since, version):
+    """Product ids changed after `since` up to `version`, or None if the log doesn't cover it"""
+    if since is None or not since < version <= since + MAX_PATCH_VERSIONS:
+        return None
+    keys = [CHANGES_CACHE_KEY.format(v) for v in range(since + 1, version + 1)]
+    logged = cache.get_many(keys)
+    if len(logged) != len(keys):
+        return None
+    return {product_id for product_ids in logged.values() for product_id in product_ids}
+
+
+def _is_fresh(index, version):
+    return index is not None and index.version == version and time.time() - index.built_at < INDEX_MAX_AGE
+
+
+def get_facet_index():
+    """Return this process's facet index, catching up or rebuilding when stale"""
+    global _index
+    version = current_version()
+    index = _index
+    if _is_fresh(index, version):
+        return index
+
+    with _lock:
+        index = _index
+        if _is_fresh(index, version):
+            return index
+        changed = None
+        if index is not None and time.time() - index.built_at < INDEX_MAX_AGE:
+            changed = _changes_since(index.version, version)
+        if changed is None:
+            index = FacetIndex().build()
+        else:
+            for product_id in changed:
+                index.refresh_product(product_id)
+        index.version = version
+        _index = index
+    return index
+
+
+def _bump_version():
+    try:
+        return cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(VERSION_CACHE_KEY, version, None)
+        return version
+
+
+def refresh_products(product_ids):
+    """Patch the local index for the given products and log them for other processes"""
+    global _index
+    product_ids = list(product_ids)
+    with _lock:
+        version = _bump_version()
+        # Until this lands, a process seeing the new version rebuilds instead
+        cache.set(CHANGES_CACHE_KEY.format(version), product_ids, INDEX_MAX_AGE)
+        if _index is None:
+            return
+        changed = _changes_since(_index.version, version - 1)
+        if changed is None and _index.version != version - 1:
+            # Missed changes from elsewhere that the log can't replay
+            _index = None
+            return
+        for product_id in set(product_ids) | (changed or set()):
+            _index.refresh_product(product_id)
+        _index.version = version
+
+
+def schedule_refresh(product_ids):
+    """Refresh products once the surrounding transaction commits"""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: refresh_products(product_ids))
+
+
+def invalidate():
+    """Drop the index everywhere, e.g. after brand/category/attribute edits (nothing is logged)"""
+    global _index
+    with _lock:
+        _bump_version()
+        _index = None
+
+
+def schedule_invalidate():
+    transaction.on_commit(invalidate)
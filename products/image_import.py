@@ -0,0 +1,274 @@
+"""
+Bulk import of product photos (import_product_images).
+
+Sources are a directory, a zip, or a CSV manifest:
+
+- In a directory or zip, files are named by SKU: ABC-123.jpg is the
+  first image of the product (or variation) with that SKU, and
+  ABC-123_2.jpg / ABC-123-2.jpg are further images, in that order.
+- A CSV manifest has the columns sku and file (relative to the CSV).
+  It may also have alt_text, is_featured and display_order.
+
+Each file is hashed, run through the ProductImage.image processors
+(core.images.Ingest) and stored in content-addressed storage, all inside
+a process pool. The parent then creates the rows with bulk_create, a
+batch at a time, and the renditions are pre-generated afterwards
+(products.renditions).
+
+An image whose source hash is already attached to its product is skipped
+before any decoding. Re-running the same import is therefore a no-op,
+and an interrupted run resumes after its last committed batch.
+"""
+import csv
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import Max
+from imagekit.utils import generate, suggest_extension
+
+from .models import Product, ProductImage, ProductVariation
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+BATCH_SIZE = 500
+# SKU followed by an image number: ABC-123_2, ABC-123-2
+NUMBERED_NAME_RE = re.compile(r'^(?P<sku>.+)[_-](?P<number>\d+)$')
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+def sku_index():
+    """{sku: product_id} for products and their variations (product SKUs win)"""
+    index = dict(ProductVariation.objects.values_list('sku', 'product_id'))
+    index.update(Product.objects.values_list('sku', 'id'))
+    return index
+
+
+def _match(stem, skus):
+    """(sku, image number) of a file stem, or None"""
+    if stem in skus:
+        return stem, 1
+    match = NUMBERED_NAME_RE.match(stem)
+    if match and match.group('sku') in skus:
+        return match.group('sku'), int(match.group('number'))
+    return None
+
+
+def _is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def read_source(source, skus):
+    """
+    Entries to import from a directory, zip or CSV manifest, plus the names
+    that matched no SKU. An entry is a dict with sku, path, member (zip
+    member or None), number, alt_text, is_featured and display_order.
+    """
+    entries, unmatched = [], []
+
+    def add(name, path, member):
+        stem = os.path.splitext(os.path.basename(name))[0]
+        matched = _match(stem, skus)
+        if matched is None:
+            unmatched.append(name)
+            return
+        sku, number = matched
+        entries.append({
+            'sku': sku, 'path': path, 'member': member, 'number': number,
+            'alt_text': '', 'is_featured': None, 'display_order': None,
+        })
+
+    if source.lower().endswith('.csv'):
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, newline='', encoding='utf-8-sig') as fh:
+            for row in csv.DictReader(fh):
+                sku = (row.get('sku') or '').strip()
+                name = (row.get('file') or '').strip()
+                if sku not in skus or not name:
+                    unmatched.append(name or sku)
+                    continue
+                featured = (row.get('is_featured') or '').strip().lower()
+                order = (row.get('display_order') or '').strip()
+                entries.append({
+                    'sku': sku, 'path': os.path.join(base, name), 'member': None,
+                    'number': int(order) if order.isdigit() else len(entries) + 1,
+                    'alt_text': (row.get('alt_text') or '').strip()[:100],
+                    'is_featured': featured in TRUE_VALUES if featured else None,
+                    'display_order': int(order) if order.isdigit() else None,
+                })
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.namelist():
+                if not member.endswith('/') and _is_image(member):
+                    add(member, source, member)
+    elif os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if _is_image(name):
+                    add(name, os.path.join(root, name), None)
+    else:
+        raise ValueError(f'{source} is not a directory, zip or CSV manifest')
+
+    entries.sort(key=lambda entry: (entry['sku'], entry['number'], entry['path'], entry['member'] or ''))
+    return entries, unmatched
+
+
+# Per worker: (product_id, source hash) already imported, open zips
+_known = set()
+_archives = {}
+
+
+def _init_worker(known):
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    _known.clear()
+    _known.update(known)
+
+
+def _read(path, member):
+    if member is None:
+        with open(path, 'rb') as fh:
+            return fh.read()
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = zipfile.ZipFile(path)
+    return archive.read(member)
+
+
+def process_entry(index, entry, product_id):
+    """
+    Hash, process and store one file like an upload to ProductImage.image.
+    Returns (index, source hash, stored name, input bytes, error); the
+    stored name is None when the image is already imported.
+    """
+    data = b''
+    source_hash = None
+    try:
+        data = _read(entry['path'], entry['member'])
+        source_hash = hashlib.sha256(data).hexdigest()
+        if (product_id, source_hash) in _known:
+            return index, source_hash, None, len(data), None
+        field = ProductImage._meta.get_field('image')
+        basename = os.path.basename(entry['member'] or entry['path'])
+        # ImageKit treats a source without a name as missing
+        spec = field.get_spec(source=File(io.BytesIO(data), name=basename))
+        content = generate(spec)
+        # suggest_extension returns just the extension, as ProcessedImageField uses it
+        filename = os.path.splitext(basename)[0] + suggest_extension(basename, spec.format)
+        name = field.storage.save(field.generate_filename(None, filename), content)
+        return index, source_hash, name, len(data), None
+    except Exception as e:
+        return index, source_hash, None, len(data), str(e)
+
+
+def _create_rows(rows):
+    with transaction.atomic():
+        ProductImage.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def _feature_first_images(product_ids):
+    """Feature the first image of products left without one (their chosen file failed or was skipped)"""
+    missing = set(product_ids) - set(ProductImage.objects.filter(
+        product_id__in=product_ids, is_featured=True
+    ).values_list('product_id', flat=True))
+    first = {}
+    for image_id, product_id in ProductImage.objects.filter(product_id__in=missing).order_by(
+        'product_id', 'display_order', 'id'
+    ).values_list('id', 'product_id'):
+        first.setdefault(product_id, image_id)
+    if first:
+        ProductImage.objects.filter(id__in=first.values()).update(is_featured=True)
+
+
+def import_entries(entries, skus, workers=None, progress=None):
+    """
+    Process entries in a pool of `workers` processes and create their
+    ProductImage rows. Returns stats with created, skipped, failed, bytes,
+    seconds and the touched product_ids.
+    """
+    stats = {'created': 0, 'skipped': 0, 'failed': [], 'bytes': 0, 'seconds': 0.0, 'product_ids': set()}
+    product_ids = {skus[entry['sku']] for entry in entries}
+    existing = ProductImage.objects.filter(product_id__in=product_ids)
+    known = set(existing.exclude(source_hash='').values_list('product_id', 'source_hash'))
+    # Pool results arrive in any order: positions are fixed up front, per
+    # product (its own SKU's files, then its variations'), after its current images
+    base_order = {
+        product_id: last + 1
+        for product_id, last in existing.values('product_id').annotate(last=Max('display_order'))
+        .values_list('product_id', 'last')
+    }
+    featured = set(existing.filter(is_featured=True).values_list('product_id', flat=True))
+    own_skus = set(Product.objects.filter(id__in=product_ids).values_list('sku', flat=True))
+    by_product = {}
+    for index, entry in enumerate(entries):
+        by_product.setdefault(skus[entry['sku']], []).append(index)
+    position = {}
+    featured_index = {}
+    for product_id, indexes in by_product.items():
+        indexes.sort(key=lambda i: (entries[i]['sku'] not in own_skus, entries[i]['number'], entries[i]['sku'], i))
+        for offset, index in enumerate(indexes):
+            position[index] = offset
+        if product_id not in featured:
+            # The first image marked featured, else the first image
+            featured_index[product_id] = next(
+                (i for i in indexes if entries[i]['is_featured']),
+                next((i for i in indexes if entries[i]['is_featured'] is None), None)
+            )
+    pending = []
+    started = time.perf_counter()
+
+    def collect(result):
+        index, source_hash, name, size, error = result
+        entry = entries[index]
+        product_id = skus[entry['sku']]
+        stats['bytes'] += size
+        if error:
+            stats['failed'].append((entry['member'] or entry['path'], error))
+        elif name is None or (product_id, source_hash) in known:
+            stats['skipped'] += 1
+        else:
+            # Also dedupes the same file listed twice in one run
+            known.add((product_id, source_hash))
+            display_order = entry['display_order']
+            if display_order is None:
+                display_order = base_order.get(product_id, 0) + position[index]
+            pending.append(ProductImage(
+                product_id=product_id, image=name, source_hash=source_hash, alt_text=entry['alt_text'],
+                is_featured=featured_index.get(product_id) == index, display_order=display_order,
+            ))
+            stats['product_ids'].add(product_id)
+        if len(pending) >= BATCH_SIZE:
+            _create_rows(pending)
+            stats['created'] += len(pending)
+            pending.clear()
+        if progress:
+            progress(entry, error)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(entries) <= 1:
+        _known.clear()
+        _known.update(known)
+        for index, entry in enumerate(entries):
+            collect(process_entry(index, entry, skus[entry['sku']]))
+    else:
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(known,)) as pool:
+            futures = [
+                pool.submit(process_entry, index, entry, skus[entry['sku']])
+                for index, entry in enumerate(entries)
+            ]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    if pending:
+        _create_rows(pending)
+        stats['created'] += len(pending)
+    _feature_first_images(stats['product_ids'])
+    stats['seconds'] = time.perf_counter() - started
+    return stats
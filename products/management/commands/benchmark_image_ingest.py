@@ -0,0 +1,134 @@
+import argparse
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from imagekit.processors import ProcessorPipeline, ResizeToFit, Transpose
+from PIL import Image
+from core import images
+
+class LegacyPreserveColor:
+    # The first processor of ProductImage.image before draft-mode ingestion
+    def process(self, img):
+        if img.mode in ('RGBA', 'LA'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else img)
+            img = background
+        elif img.mode == 'P':
+            img = img.convert('RGB')
+        return img
+
+
+PIPELINES = {
+    'before': lambda: [LegacyPreserveColor(), ResizeToFit(1200, 1200), Transpose()],
+    'after': lambda: [images.Ingest(1200, 1200)],
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare peak RSS and time per upload of the old and the draft-mode ProductImage ingestion'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Images to ingest (default: a synthetic phone photo)')
+        parser.add_argument('--synthetic', default='8000x6000', help='Size of the synthetic JPEG (WxH)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per image and pipeline')
+        # Internal: one measured run in a fresh process
+        parser.add_argument('--measure', nargs=2, metavar=('PIPELINE', 'PATH'), help=argparse.SUPPRESS)
+    
+    def handle(self, *args, **options):
+        if options['measure']:
+            pipeline, path = options['measure']
+            self.stdout.write(json.dumps(measure(pipeline, path)))
+            return
+        
+        workdir = None
+        paths = options['paths']
+        if not paths:
+            workdir = tempfile.mkdtemp()
+            paths = [synthetic_photo(options['synthetic'], workdir)]
+        try:
+            for path in paths:
+                with Image.open(path) as image:
+                    width, height = image.size
+                self.stdout.write(f'{os.path.basename(path)} ({width}x{height}, {width * height / 1e6:.1f} MP)')
+                for pipeline in PIPELINES:
+                    runs = [self.run_child(pipeline, path) for _ in range(options['repeat'])]
+                    errors = [run['error'] for run in runs if run['error']]
+                    if errors:
+                        self.stdout.write(f'  {pipeline:<7} failed: {errors[0]}')
+                        continue
+                    self.stdout.write(
+                        f"  {pipeline:<7} {statistics.median(run['seconds'] for run in runs) * 1000:8.1f} ms  "
+                        f"+{max(run['peak_mb'] for run in runs):7.1f} MB peak RSS"
+                    )
+        finally:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+    
+    def run_child(self, pipeline, path):
+        # A fresh interpreter per run, so each peak RSS is that run's alone
+        result = subprocess.run(
+            [sys.executable, '-m', 'django', 'benchmark_image_ingest', '--measure', pipeline, path],
+            cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'benchmark run failed')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def peak_rss_mb():
+    # VmHWM starts afresh with each exec; ru_maxrss carries the parent's peak
+    # (here, generating the synthetic photo) over into the child
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(pipeline, path):
+    """Ingest one file like ProcessedImageField does; returns time and RSS growth"""
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    error = None
+    try:
+        with open(path, 'rb') as fh:
+            img = ProcessorPipeline(PIPELINES[pipeline]()).process(Image.open(fh))
+            img.save(io.BytesIO(), 'WEBP', quality=85)
+    except Exception as e:
+        error = str(e)
+    return {
+        'seconds': time.perf_counter() - started,
+        'peak_mb': peak_rss_mb() - baseline,
+        'error': error,
+    }
+
+
+def synthetic_photo(size, directory):
+    """A noisy JPEG with a rotated EXIF orientation, like a portrait phone shot"""
+    try:
+        width, height = (int(value) for value in size.lower().split('x'))
+    except ValueError:
+        raise CommandError(f'Invalid --synthetic size: {size}')
+    path = os.path.join(directory, f'synthetic-{width}x{height}.jpg')
+    image = Image.merge('RGB', [
+        Image.effect_noise((width, height), sigma).point(lambda value: value // 2 + offset)
+        for sigma, offset in ((40, 64), (60, 32), (30, 96))
+    ])
+    exif = Image.Exif()
+    exif[images.ORIENTATION_TAG] = 6
+    image.save(path, 'JPEG', quality=90, exif=exif)
+    return path
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from products import copurchase
+
+class Command(BaseCommand):
+    help = 'Fold new orders into the "frequently bought together" matrix (run from cron)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop the counts and recount every order')
+        parser.add_argument('--top-k', type=int, default=copurchase.TOP_K, help='Partners kept per product')
+    
+    def handle(self, *args, **options):
+        run = copurchase.build(rebuild=options['rebuild'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {run.orders_processed} orders (up to #{run.last_order_id}), '
+            f're-ranked {run.products_updated} products'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products import related
+
+class Command(BaseCommand):
+    help = 'Rebuild the content-based related-products index (run from cron)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=related.TOP_K, help='Neighbours kept per product')
+        parser.add_argument('--product', type=int, action='append', dest='products', help='Only re-index these product ids')
+    
+    def handle(self, *args, **options):
+        def progress(done, total):
+            if done % (related.BATCH_SIZE * 20) == 0 or done == total:
+                self.stdout.write(f'  {done}/{total}')
+        
+        started = time.perf_counter()
+        count, timings = related.build(top_k=options['top_k'], product_ids=options['products'], progress=progress)
+        elapsed = time.perf_counter() - started
+        
+        for phase, seconds in timings.items():
+            self.stdout.write(f'  {phase:<11} {seconds:.1f}s')
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed related products for {count} products in {elapsed:.1f}s '
+            f"({timings['neighbours'] / count * 1000 if count else 0:.1f} ms/product scoring)"
+        ))
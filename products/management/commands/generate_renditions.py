@@ -0,0 +1,94 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from products import renditions
+from products.models import ProductImage
+
+class Command(BaseCommand):
+    help = 'Pre-generate ImageKit renditions of product images (resumable; only pending images unless --force)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only images changed since this date/datetime (ISO 8601)')
+        parser.add_argument('--product', type=int, action='append', dest='products', help='Only images of these product ids')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Regenerate images whose renditions are up to date')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Also retry images that failed MAX_PROCESSING_ATTEMPTS times')
+        parser.add_argument('--watch', type=int, metavar='SECONDS', default=0,
+                            help='Keep running as the image worker, polling for queued uploads every SECONDS')
+    
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                day = parse_date(options['since'])
+                if day is None:
+                    raise CommandError(f"Invalid --since value: {options['since']}")
+                since = datetime.combine(day, datetime.min.time())
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        
+        if options['watch'] and options['force']:
+            raise CommandError('--force would regenerate every image on each poll; drop it with --watch')
+        if options['watch'] and options['retry_failed']:
+            raise CommandError('--retry-failed would retry broken files on every poll; drop it with --watch')
+        
+        while True:
+            self.generate_pending(since, options)
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
+    
+    def generate_pending(self, since, options):
+        image_ids = list(renditions.pending_images(
+            since=since, product_ids=options['products'], force=options['force'],
+            retry_failed=options['retry_failed']
+        ).values_list('id', flat=True))
+        total = len(image_ids)
+        if not options['watch'] and not options['retry_failed']:
+            given_up = renditions.pending_images(
+                since=since, product_ids=options['products'], retry_failed=True
+            ).filter(processing_attempts__gte=ProductImage.MAX_PROCESSING_ATTEMPTS).count()
+            if given_up:
+                self.stderr.write(
+                    f'Skipping {given_up} images that failed {ProductImage.MAX_PROCESSING_ATTEMPTS} times '
+                    f'(see their processing_error; --retry-failed to try again)'
+                )
+        if not total:
+            if not options['watch']:
+                self.stdout.write(self.style.SUCCESS('No images pending'))
+            return
+        self.stdout.write(f'Generating renditions for {total} images...')
+        
+        done = [0]
+        def progress(image_id, error):
+            done[0] += 1
+            if error:
+                self.stderr.write(f'Image {image_id}: {error}')
+            if done[0] % 100 == 0 or done[0] == total:
+                self.stdout.write(f'  {done[0]}/{total}')
+        
+        started = time.perf_counter()
+        stats, failures = renditions.generate(
+            image_ids, workers=options['workers'], force=options['force'], progress=progress
+        )
+        elapsed = time.perf_counter() - started
+        
+        # Per-spec throughput; seconds are summed over workers (CPU time spent per spec)
+        for name in sorted(stats, key=lambda key: (key not in renditions.SPEC_NAMES, key)):
+            spec = stats[name]
+            if not spec['count']:
+                continue
+            self.stdout.write(
+                f"  {name:<12} {spec['count']} images, {spec['seconds'] / spec['count'] * 1000:.1f} ms/image, "
+                f"{spec['count'] / spec['seconds'] if spec['seconds'] else 0:.1f} images/s per worker"
+            )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total - len(failures)} of {total} images in {elapsed:.1f}s '
+            f'({total / elapsed if elapsed else 0:.1f} images/s), {len(failures)} failed'
+        ))
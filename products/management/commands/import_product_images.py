@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from products import image_import, renditions
+
+class Command(BaseCommand):
+    help = 'Import product photos named by SKU from a directory or zip, or listed in a CSV manifest (resumable)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory, .zip, or .csv manifest (sku,file[,alt_text,is_featured,display_order])')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--skip-renditions', action='store_true', help='Leave rendition generation to generate_renditions')
+    
+    def handle(self, *args, **options):
+        skus = image_import.sku_index()
+        try:
+            entries, unmatched = image_import.read_source(options['source'], skus)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        for name in unmatched[:20]:
+            self.stderr.write(f'No product or variation SKU for {name}')
+        if len(unmatched) > 20:
+            self.stderr.write(f'... and {len(unmatched) - 20} more unmatched files')
+        total = len(entries)
+        if not total:
+            self.stdout.write(self.style.WARNING('Nothing to import'))
+            return
+        self.stdout.write(f'Importing {total} images for {len({entry["sku"] for entry in entries})} SKUs...')
+        
+        done = [0]
+        def progress(entry, error):
+            done[0] += 1
+            if error:
+                self.stderr.write(f"{entry['member'] or entry['path']}: {error}")
+            if done[0] % 250 == 0 or done[0] == total:
+                self.stdout.write(f'  {done[0]}/{total}')
+        
+        stats = image_import.import_entries(entries, skus, workers=options['workers'], progress=progress)
+        seconds = stats['seconds'] or 1e-9
+        self.stdout.write(
+            f"Processed {total} files ({stats['bytes'] / 1024 / 1024:.1f} MB) in {seconds:.1f}s: "
+            f"{total / seconds:.1f} files/s, {stats['bytes'] / 1024 / 1024 / seconds:.1f} MB/s; "
+            f"{stats['created']} created, {stats['skipped']} already imported, {len(stats['failed'])} failed"
+        )
+        
+        # Includes images created by an earlier, interrupted run
+        image_ids = [] if options['skip_renditions'] else list(renditions.pending_images(
+            product_ids=sorted({skus[entry['sku']] for entry in entries})
+        ).values_list('id', flat=True))
+        if image_ids:
+            self.stdout.write(f'Generating renditions for {len(image_ids)} images...')
+            started = time.perf_counter()
+            _, failures = renditions.generate(image_ids, workers=options['workers'])
+            elapsed = time.perf_counter() - started
+            for image_id, error in failures:
+                self.stderr.write(f'Image {image_id}: {error}')
+            self.stdout.write(
+                f'Generated renditions for {len(image_ids) - len(failures)} images in {elapsed:.1f}s '
+                f'({len(image_ids) / elapsed if elapsed else 0:.1f} images/s)'
+            )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['created']} images for {len(stats['product_ids'])} products"
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.models import Category, CategoryClosure
+
+class Command(BaseCommand):
+    help = 'Rebuild the category closure table from the parent links'
+    
+    def handle(self, *args, **options):
+        parents = dict(Category.objects.values_list('id', 'parent_id'))
+        
+        rows = []
+        for category_id in parents:
+            # Walk up to the root, guarding against broken (cyclic) parent links
+            current, depth, seen = category_id, 0, set()
+            while current and current not in seen:
+                seen.add(current)
+                rows.append(CategoryClosure(ancestor_id=current, descendant_id=category_id, depth=depth))
+                current = parents.get(current)
+                depth += 1
+        
+        with transaction.atomic():
+            CategoryClosure.objects.all().delete()
+            CategoryClosure.objects.bulk_create(rows, batch_size=1000)
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(rows)} closure rows for {len(parents)} categories'))
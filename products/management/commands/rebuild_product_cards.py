@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from products.models import Product, ProductCard
+from products.cards import refresh_cards
+
+class Command(BaseCommand):
+    help = 'Rebuild the ProductCard row of every product (run after adding the table)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        built = 0
+        for start in range(0, len(product_ids), batch_size):
+            built += len(refresh_cards(product_ids[start:start + batch_size]))
+        
+        # Cards whose product is gone (only possible if rows were removed outside the ORM)
+        stale, _ = ProductCard.objects.exclude(product__in=Product.objects.all()).delete()
+        self.stdout.write(self.style.SUCCESS(f'Built {built} product cards, removed {stale} stale'))
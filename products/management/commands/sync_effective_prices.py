@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products import facets
+
+class Command(BaseCommand):
+    help = 'Recompute Product.effective_price for every product (run after adding the column)'
+    
+    def handle(self, *args, **options):
+        updated = Product.objects.all().sync_effective_price()
+        facets.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Updated effective price on {updated} products'))
@@ -1,12 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils.text import slugify
-from django.db.models import Sum, Avg, Count
+from django.db.models import Sum, Avg, Count, Case, When, F, Value, Exists, OuterRef
+from django.db.models.lookups import GreaterThan
 from imagekit.models import ProcessedImageField, ImageSpecField
 from imagekit.processors import ResizeToFill, ResizeToFit, SmartResize
-from imagekit.processors import ResizeToFit, ResizeToFill, Transpose
+from imagekit.processors import ResizeToFit, ResizeToFill
 from imagekit import ImageSpec
-from PIL import Image
+from core import images
+from core.storage import content_storage
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 
 
@@ -15,7 +18,9 @@ class Brand(models.Model):
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     logo = ProcessedImageField(
         upload_to='brands/',
-        processors=[ResizeToFill(200, 200)],  # Resize to 200x200
+        storage=content_storage,
+        processors=[images.Ingest(200, 200, fill=True)],  # Resize to 200x200
+        validators=[images.validate_pixel_budget],
         format='WEBP',
         options={'quality': 85},
         blank=True
@@ -55,7 +60,9 @@ class Category(models.Model):
     # Regular image - will be converted to WebP automatically
     image = ProcessedImageField(
         upload_to='categories/image/',
-        processors=[ResizeToFill(400, 400)],  # Square 400x400
+        storage=content_storage,
+        processors=[images.Ingest(400, 400, fill=True)],  # Square 400x400
+        validators=[images.validate_pixel_budget],
         format='WEBP',
         options={'quality': 85},
         blank=True
@@ -64,7 +71,9 @@ class Category(models.Model):
     # Banner image - different dimensions
     banner = ProcessedImageField(
         upload_to='categories/banner/',
-        processors=[ResizeToFit(1200, 400)],  # Wide banner 1200x400
+        storage=content_storage,
+        processors=[images.Ingest(1200, 400)],  # Wide banner 1200x400
+        validators=[images.validate_pixel_budget],
         format='WEBP',
         options={'quality': 85},
         blank=True,
@@ -85,10 +94,58 @@ class Category(models.Model):
             models.Index(fields=['display_order']),
         ]
     
+    def clean(self):
+        super().clean()
+        # Same rule _relink_subtree enforces on save, as a form error
+        if self.pk and self.parent_id and CategoryClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=self.parent_id
+        ).exists():
+            raise ValidationError({'parent': "A category can't be moved under itself or one of its descendants."})
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            is_new = self._state.adding
+            previous_parent_id = None
+            if not is_new:
+                previous_parent_id = Category.objects.filter(
+                    pk=self.pk
+                ).values_list('parent_id', flat=True).first()
+            super().save(*args, **kwargs)
+            # Keep the closure table in step with the tree
+            if is_new:
+                CategoryClosure.objects.get_or_create(ancestor=self, descendant=self, defaults={'depth': 0})
+                self._relink_subtree()
+            elif previous_parent_id != self.parent_id:
+                self._relink_subtree()
+    
+    def _relink_subtree(self):
+        """Point the closure rows of this category's subtree at its current ancestors"""
+        subtree = list(CategoryClosure.objects.filter(
+            ancestor=self
+        ).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        if self.parent_id in subtree_ids:
+            raise ValueError("A category can't be moved under itself or one of its descendants")
+        
+        CategoryClosure.objects.filter(
+            descendant_id__in=subtree_ids
+        ).exclude(ancestor_id__in=subtree_ids).delete()
+        
+        if self.parent_id:
+            ancestors = CategoryClosure.objects.filter(
+                descendant_id=self.parent_id
+            ).values_list('ancestor_id', 'depth')
+            CategoryClosure.objects.bulk_create([
+                CategoryClosure(
+                    ancestor_id=ancestor_id,
+                    descendant_id=descendant_id,
+                    depth=ancestor_depth + descendant_depth + 1
+                )
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, descendant_depth in subtree
+            ])
     
     def __str__(self):
         return self.name
@@ -98,14 +155,15 @@ class Category(models.Model):
     
     def get_descendants(self):
         """Get all descendant categories including self"""
-        descendants = [self]
-        for child in self.children.all():
-            descendants.extend(child.get_descendants())
-        return descendants
+        return list(Category.objects.filter(
+            ancestor_links__ancestor=self
+        ).order_by('ancestor_links__depth', 'display_order', 'name'))
     
     def get_descendant_ids(self):
         """Get all descendant category IDs including self"""
-        return [cat.id for cat in self.get_descendants()]
+        return list(CategoryClosure.objects.filter(
+            ancestor=self
+        ).values_list('descendant_id', flat=True))
     
     def to_dict(self):
         return {
@@ -119,6 +177,26 @@ class Category(models.Model):
     
 
 
+class CategoryClosure(models.Model):
+    """
+    Every (ancestor, descendant) pair of the category tree, including each
+    category paired with itself at depth 0. Maintained by Category.save();
+    rows go away with either category through the cascades.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+    
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+    
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
 class Attribute(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -145,6 +223,76 @@ class AttributeValue(models.Model):
         return f"{self.attribute.name}: {self.value}"
 
 
+def effective_price_expression(price=None, discount_price=None):
+    """
+    SQL version of Product.get_price(): the discount price when it is set
+    and positive, else the list price. Values passed in replace the
+    current columns, so an UPDATE can compute it from the new prices.
+    """
+    price = F('price') if price is None else price
+    discount_price = F('discount_price') if discount_price is None else discount_price
+    if not hasattr(price, 'resolve_expression'):
+        price = Value(price)
+    if not hasattr(discount_price, 'resolve_expression'):
+        discount_price = Value(discount_price)
+    return Case(
+        When(GreaterThan(discount_price, 0), then=discount_price),
+        default=price,
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+PRICE_FIELDS = ('price', 'discount_price')
+
+
+class ProductQuerySet(models.QuerySet):
+    """Product queries: category subtree filtering, and keeping effective_price in sync on bulk writes"""
+
+    def update(self, **kwargs):
+        if 'effective_price' not in kwargs and any(f in kwargs for f in PRICE_FIELDS):
+            if 'discount_price' in kwargs and kwargs['discount_price'] is None:
+                kwargs['effective_price'] = kwargs.get('price', F('price'))
+            else:
+                kwargs['effective_price'] = effective_price_expression(
+                    kwargs.get('price'), kwargs.get('discount_price')
+                )
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.effective_price = obj.get_price()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if any(f in fields for f in PRICE_FIELDS) and 'effective_price' not in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.effective_price = obj.get_price()
+            fields.append('effective_price')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def in_category(self, category):
+        """
+        Products in category (a Category or its id) or any of its
+        descendants. One EXISTS semi-join on the closure table, so the
+        result has no duplicates and needs no DISTINCT.
+        """
+        category_id = getattr(category, 'pk', category)
+        subtree = CategoryClosure.objects.filter(ancestor_id=category_id).values('descendant_id')
+        return self.filter(Exists(
+            Product.categories.through.objects.filter(
+                product_id=OuterRef('pk'),
+                category_id__in=subtree
+            )
+        ))
+
+    def sync_effective_price(self):
+        """Recompute effective_price in one UPDATE, e.g. after raw SQL or a backfill"""
+        return super().update(effective_price=effective_price_expression())
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
@@ -153,6 +301,9 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Price the customer actually pays (see get_price), stored so listings
+    # can filter and sort on an indexed column instead of a CASE expression
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
 
     # estimate_delivery_days = models.PositiveIntegerField(
     #     default=3,
@@ -169,6 +320,19 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     view_count = models.PositiveIntegerField(default=0)
+    # Time-decayed view count in log space, maintained by products.popularity
+    popularity_score = models.FloatField(default=0, editable=False)
+
+    # Approved-review rollup, maintained by reviews.ratings.refresh_product_ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
     product_keywords = models.TextField(default=None, blank=True, null=True)
 
     caution = models.TextField(
@@ -176,6 +340,8 @@ class Product(models.Model):
         null=True,
         help_text="Safety warnings, precautions, and usage guidelines for this product"
     )
+
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Product'
@@ -187,6 +353,9 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['sku']),
             models.Index(fields=['price']),
+            models.Index(fields=['is_active', 'effective_price']),
+            models.Index(fields=['is_active', 'rating_avg', 'rating_count']),
+            models.Index(fields=['is_active', 'popularity_score']),
             models.Index(fields=['brand']),
             models.Index(fields=['created_at']),
             models.Index(fields=['is_active', 'name']),  # This helps our search
@@ -196,6 +365,12 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.effective_price = self.get_price()
+        elif any(f in update_fields for f in PRICE_FIELDS):
+            self.effective_price = self.get_price()
+            kwargs['update_fields'] = set(update_fields) | {'effective_price'}
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -238,7 +413,7 @@ class Product(models.Model):
             'discount_price': str(self.discount_price) if self.discount_price else None,
             'discount_percentage': self.get_discount_percentage(),
             'brand': self.brand.to_dict() if self.brand else None,
-            'image_url': main_image.thumbnail.url if main_image else '/static/img/no-image.jpg',
+            'image_url': main_image.rendition_url('thumbnail') if main_image else '/static/img/no-image.jpg',
             'url': self.get_absolute_url(),
             'is_in_stock': self.is_in_stock(),
             'sku': self.sku,
@@ -250,11 +425,13 @@ class Product(models.Model):
         """Optimized method to get main image URL without extra queries"""
         # Try to get from prefetched images first
         if hasattr(self, 'images'):
-            for image in self.images.all():
+            # One pass over the (prefetched) images; URLs come from the rendition registry
+            product_images = list(self.images.all())
+            for image in product_images:
                 if image.is_featured:
-                    return image.thumbnail.url  # Changed to use thumbnail
-            if self.images.first():
-                return self.images.first().thumbnail.url
+                    return image.rendition_url('thumbnail')
+            if product_images:
+                return product_images[0].rendition_url('thumbnail')
         return '/static/img/no-image.jpg'
     
     def get_price_display(self):
@@ -290,62 +467,45 @@ class Product(models.Model):
     
     @property
     def average_rating(self):
-        """Calculate average rating"""
-        try:
-            from reviews.models import Review
-            reviews = Review.objects.filter(product=self, is_approved=True)
-            if reviews.exists():
-                return reviews.aggregate(models.Avg('rating'))['rating__avg']
-            return 0
-        except:
-            return 0
+        """Average approved rating (from the rollup columns)"""
+        return self.rating_avg if self.rating_count else 0
     
     @property
     def review_count(self):
         """Count of approved reviews"""
-        try:
-            from reviews.models import Review
-            return Review.objects.filter(product=self, is_approved=True).count()
-        except:
-            return 0
+        return self.rating_count
     
     @property
     def avg_rating(self):
         """Return average approved rating rounded to 1 decimal"""
-        try:
-            from reviews.models import Review
-            result = Review.objects.filter(
-                product=self,
-                is_approved=True
-            ).aggregate(avg=Avg('rating'))['avg']
-
-            return round(result, 1) if result else 0
-        except Exception:
-            return 0
-
-
-
-
-
-# First, create a custom processor to handle color properly
-class PreserveColorProcessor:
-    def process(self, img):
-        # Convert RGBA to RGB if needed (removes alpha channel)
-        if img.mode in ('RGBA', 'LA'):
-            # Create a white background
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            # Paste the image on white background
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else img)
-            img = background
-        elif img.mode == 'P':
-            img = img.convert('RGB')
-        return img
-
+        return round(self.rating_avg, 1) if self.rating_count else 0
 
-    
+    @property
+    def rating_histogram(self):
+        """Approved review count per star, 5 first"""
+        return {
+            5: self.rating_5,
+            4: self.rating_4,
+            3: self.rating_3,
+            2: self.rating_2,
+            1: self.rating_1,
+        }
 
 
 class ProductImage(models.Model):
+    QUEUED = 'queued'
+    READY = 'ready'
+    FAILED = 'failed'
+    PROCESSING_STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+    # Served in place of renditions that aren't generated yet
+    PENDING_IMAGE_URL = '/static/img/placeholder.webp'
+    # Failed processing runs before an image is no longer retried automatically
+    MAX_PROCESSING_ATTEMPTS = 3
+    
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     
     # Original image - converted to WebP and resized
@@ -359,11 +519,10 @@ class ProductImage(models.Model):
     
     image = ProcessedImageField(
         upload_to='products/',
-        processors=[
-            PreserveColorProcessor(),  # Add this processor first
-            ResizeToFit(1200, 1200),   # Then resize
-            Transpose(),               # Auto-rotate based on EXIF
-        ],
+        storage=content_storage,
+        # Drafted decode, EXIF rotation and white background (core.images)
+        processors=[images.Ingest(1200, 1200)],
+        validators=[images.validate_pixel_budget],
         format='WEBP',
         options={'quality': 85}
     )
@@ -371,21 +530,21 @@ class ProductImage(models.Model):
     # Image specifications - generated on the fly
     thumbnail = ImageSpecField(
         source='image',
-        # processors=[SmartResize(400, 400)],  # Square 400x400 thumbnail
+        processors=[ResizeToFit(400, 400)],
         format='WEBP',
         options={'quality': 80}
     )
     
     small = ImageSpecField(
         source='image',
-        # processors=[SmartResize(200, 200)],  # Small 200x200
+        processors=[ResizeToFit(200, 200)],
         format='WEBP',
         options={'quality': 75}
     )
     
     medium = ImageSpecField(
         source='image',
-        # processors=[SmartResize(800, 800)],  # Medium 800x800
+        processors=[ResizeToFit(800, 800)],
         format='WEBP',
         options={'quality': 85}
     )
@@ -401,23 +560,95 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=100, blank=True)
     is_featured = models.BooleanField(default=False)
     display_order = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+    # Source file the specs above were last generated for (products.renditions)
+    renditions_source = models.CharField(max_length=255, blank=True, editable=False)
+    # Rendition registry filled at generation time: {'image' | spec | '<width>.<format>':
+    # {url, width, height, size}} plus 'placeholder' (LQIP data URI), so rendering
+    # never asks storage or ImageKit
+    rendition_info = models.JSONField(default=dict, blank=True, editable=False)
+    # SHA-256 of the file as supplied, before processing (products.image_import)
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    # Admin uploads store the original as-is and are processed in the background
+    # (products.renditions); `image` holds the unprocessed original until READY
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUS_CHOICES, default=READY, editable=False)
+    processing_error = models.CharField(max_length=255, blank=True, editable=False)
+    processing_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['display_order', 'id']
         indexes = [
             models.Index(fields=['product', 'is_featured', 'display_order']),
             models.Index(fields=['product', 'display_order']),
+            models.Index(fields=['processing_status']),
         ]
     
     def __str__(self):
         return f"Image of {self.product.name}"
     
+    def rendition(self, spec):
+        """Registry entry {url, width, height, size} of 'image', a spec or a ladder key, if generated"""
+        return (self.rendition_info or {}).get(spec)
+    
+    @property
+    def renditions_ready(self):
+        return bool(self.image) and self.renditions_source == self.image.name
+    
+    @property
+    def processing_given_up(self):
+        return self.processing_attempts >= self.MAX_PROCESSING_ATTEMPTS
+    
+    def rendition_url(self, spec='thumbnail'):
+        info = self.rendition(spec)
+        if info:
+            return info['url']
+        if spec == 'image':
+            return self.image.url
+        if not self.renditions_ready:
+            # Queued upload or new file: its renditions don't exist yet
+            return self.PENDING_IMAGE_URL
+        # Not registered yet: compute the name (no storage call either way)
+        if '.' in spec:
+            width, format = spec.split('.')
+            return images.rendition_url(self.image, int(width), format.upper())
+        return getattr(self, spec).url
+    
+    @property
+    def placeholder(self):
+        """Inline LQIP data URI ('' until generated)"""
+        return (self.rendition_info or {}).get('placeholder', '')
+    
+    def srcset(self, format='WEBP'):
+        """Width-ladder srcset using the registered (actual) widths"""
+        suffix = f'.{format.lower()}'
+        entries = {}
+        ladder = [(key, info) for key, info in (self.rendition_info or {}).items() if key.endswith(suffix)]
+        for key, info in sorted(ladder, key=lambda item: item[1].get('width') or 0):
+            if info.get('width'):
+                # Small sources yield several same-width renditions; keep one
+                entries.setdefault(info['width'], info['url'])
+        if not entries:
+            return images.srcset(self.image, format) if self.renditions_ready else ''
+        return ', '.join(f'{url} {width}w' for width, url in entries.items())
+    
+    def sources(self):
+        """<picture> sources, best format first"""
+        return [
+            {'type': images.MIME_TYPES[format], 'srcset': value}
+            for format in images.FORMATS
+            for value in [self.srcset(format)]
+            if value
+        ]
+    
     def to_dict(self):
+        thumbnail = self.rendition('thumbnail') or {}
         return {
             'id': self.id,
-            'image_url': self.image.url,
-            'thumbnail_url': self.thumbnail.url,  # Added thumbnail URL
-            'medium_url': self.medium.url,        # Added medium URL
+            'image_url': self.rendition_url('image'),
+            'thumbnail_url': self.rendition_url('thumbnail'),
+            'medium_url': self.rendition_url('medium'),
+            'width': thumbnail.get('width'),
+            'height': thumbnail.get('height'),
             'alt_text': self.alt_text,
             'is_featured': self.is_featured,
         }
@@ -425,7 +656,7 @@ class ProductImage(models.Model):
     # Optional: Add a property for backward compatibility
     @property
     def image_url(self):
-        return self.image.url
+        return self.rendition_url('image')
 
 
 class ProductAttribute(models.Model):
@@ -489,4 +720,204 @@ class ProductVariation(models.Model):
         """Return comma-separated string of attribute IDs"""
         return ','.join([str(attr.id) for attr in self.attributes.all()])
 
-    
\ No newline at end of file
+    
+
+class ProductCard(models.Model):
+    """
+    Denormalized listing card for one product: everything the product grids,
+    home sections, infinite scroll JSON and quick view render, in one narrow
+    row. Kept in sync by products.cards (see products/signals.py).
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200)
+    sku = models.CharField(max_length=50, blank=True)
+    brand_name = models.CharField(max_length=100, blank=True)
+    brand_slug = models.CharField(max_length=100, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount_percentage = models.PositiveIntegerField(default=0)
+    thumbnail_url = models.CharField(max_length=500, blank=True)
+    # Width-ladder srcset of the thumbnail per format ({'WEBP': ..., 'AVIF': ...})
+    thumbnail_srcset = models.JSONField(default=dict, blank=True)
+    # Inline LQIP and intrinsic size of the thumbnail, painted before it loads
+    placeholder = models.TextField(blank=True)
+    thumbnail_width = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_height = models.PositiveIntegerField(null=True, blank=True)
+    image_urls = models.JSONField(default=list, blank=True)
+    features = models.JSONField(default=list, blank=True)
+    short_description = models.TextField(blank=True)
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    in_stock = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    is_featured = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    view_count = models.PositiveIntegerField(default=0)
+    # Sort key of the popular listing; kept in step by products.popularity
+    popularity_score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Product card'
+        verbose_name_plural = 'Product cards'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def id(self):
+        # Cards stand in for products in templates and cursors
+        return self.product_id
+
+    def get_absolute_url(self):
+        return reverse('product_detail', args=[self.slug])
+
+    def get_price(self):
+        return self.discount_price if self.discount_price else self.price
+
+    def get_discount_percentage(self):
+        return self.discount_percentage
+
+    def is_in_stock(self):
+        return self.in_stock
+
+    @property
+    def image_url(self):
+        return self.thumbnail_url or '/static/img/no-image.jpg'
+
+    def get_main_image_url(self):
+        return self.image_url
+
+    @property
+    def image_srcset(self):
+        return self.thumbnail_srcset.get('WEBP', '')
+
+    @property
+    def image_srcset_avif(self):
+        return self.thumbnail_srcset.get('AVIF', '')
+
+    @property
+    def average_rating(self):
+        return self.rating_avg if self.rating_count else 0
+
+    @property
+    def review_count(self):
+        return self.rating_count
+
+    @property
+    def avg_rating(self):
+        return round(self.rating_avg, 1) if self.rating_count else 0
+
+    def to_dict(self):
+        """Card data for the infinite-scroll and search JSON responses"""
+        return {
+            'id': self.product_id,
+            'name': self.name,
+            'slug': self.slug,
+            'price': str(self.price),
+            'discount_price': str(self.discount_price) if self.discount_price else None,
+            'discount_percentage': self.discount_percentage,
+            'brand_name': self.brand_name,
+            'brand_slug': self.brand_slug,
+            'image_url': self.image_url,
+            'image_srcset': self.image_srcset,
+            'placeholder': self.placeholder,
+            'width': self.thumbnail_width,
+            'height': self.thumbnail_height,
+            'url': self.get_absolute_url(),
+            'avg_rating': self.avg_rating,
+            'review_count': self.rating_count,
+            'is_in_stock': self.in_stock,
+        }
+
+    def to_quick_view_dict(self):
+        """Payload the quick view modal (base.html) fills itself from"""
+        return {
+            'id': self.product_id,
+            'name': self.name,
+            'brand': {
+                'name': self.brand_name,
+                'url': reverse('products_by_brand', args=[self.brand_slug]) if self.brand_slug else '',
+            },
+            'price': str(self.price),
+            'discount_price': str(self.discount_price) if self.discount_price else None,
+            'average_rating': self.average_rating,
+            'review_count': self.rating_count,
+            'features': self.features,
+            'images': self.image_urls or [self.image_url],
+            'url': self.get_absolute_url(),
+        }
+
+
+class ProductPairCount(models.Model):
+    """
+    Sparse co-purchase counts: number of orders containing both products,
+    stored once per pair with product_id <= partner_id. The diagonal
+    (product == partner) holds the number of orders containing the product.
+    Maintained by the build_copurchase_matrix command.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    partner = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'partner')
+        indexes = [
+            models.Index(fields=['partner']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.partner_id}: {self.count}"
+
+
+class ProductCoPurchase(models.Model):
+    """Top-K "frequently bought together" partners of a product, ranked"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='copurchase_partners')
+    partner = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    pair_count = models.PositiveIntegerField()
+    # P(partner in order | product in order)
+    confidence = models.FloatField()
+    # confidence / P(partner in order); > 1 means bought together more than by chance
+    lift = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.partner_id} (#{self.rank})"
+
+
+class CoPurchaseRun(models.Model):
+    """One build_copurchase_matrix run; the latest row is the incremental watermark"""
+    last_order_id = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0, help_text="Orders counted so far (lift denominator)")
+    orders_processed = models.PositiveIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"Co-purchase run up to order {self.last_order_id}"
+
+
+class ProductRelated(models.Model):
+    """Top-K content-similar products of a product (built by build_related_index)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    # Cosine similarity of the two products' feature vectors
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.related_id} (#{self.rank})"
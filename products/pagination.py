@@ -0,0 +1,133 @@
+"""
+Keyset (cursor) pagination for the infinite-scroll catalog endpoints.
+
+Instead of OFFSET + COUNT(*) on every scroll, the client gets an opaque
+`next_cursor` holding the sort key of the last product it received plus
+the total computed on the first page. The next page is a plain
+"WHERE (sort key, id) after cursor ORDER BY ... LIMIT n" so page 50 costs
+the same as page 1.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q
+
+
+CURSOR_SALT = 'products.catalog-cursor'
+
+
+def keyset_ordering(*fields):
+    """Append the primary key as a tie-breaker so the ordering is total"""
+    fields = list(fields)
+    if fields and fields[-1].lstrip('-') in ('id', 'pk'):
+        return fields
+    descending = bool(fields) and fields[0].startswith('-')
+    return fields + ['-id' if descending else 'id']
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(obj, ordering, total, page_number):
+    """Build the opaque cursor pointing just after obj"""
+    payload = {
+        'o': ordering,
+        'k': [_dump_value(getattr(obj, field.lstrip('-'))) for field in ordering],
+        't': total,
+        'p': page_number,
+    }
+    return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, ordering):
+    """Return the cursor payload, or None if it's missing, forged or for another sort"""
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if payload.get('o') != list(ordering) or len(payload.get('k', [])) != len(ordering):
+        return None
+    return payload
+
+
+def _after(ordering, values):
+    """Q object selecting rows strictly after values in the given ordering"""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        branch = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            branch &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= branch
+    return condition
+
+
+class CursorPage:
+    """Page of results in the same shape the views use from Paginator pages"""
+
+    def __init__(self, object_list, number, total, next_cursor):
+        self.object_list = object_list
+        self.number = number
+        self.total = total
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def next_page_number(self):
+        return self.number + 1
+
+
+def paginate_by_cursor(queryset, ordering, cursor=None, per_page=12, total=None, count=True):
+    """
+    Return one CursorPage of queryset ordered by `ordering`.
+
+    `ordering` must already include a unique tie-breaker (see keyset_ordering)
+    and every field in it must be readable as an attribute on the rows.
+    The total is counted once, on the first page, and carried in the cursor;
+    pass count=False for endpoints that never show it.
+    """
+    queryset = queryset.order_by(*ordering)
+    payload = decode_cursor(cursor, ordering)
+
+    if payload:
+        queryset = queryset.filter(_after(ordering, payload['k']))
+        total = payload['t']
+        number = payload['p'] + 1
+    else:
+        number = 1
+        if total is None and count:
+            total = queryset.count()
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1], ordering, total, number)
+
+    return CursorPage(rows, number, total, next_cursor)
+
+
+def cursor_after_page(page, ordering, total):
+    """Cursor continuing after a regular Paginator page, for handing off to cursor mode"""
+    if not page.has_next():
+        return None
+    object_list = list(page.object_list)
+    if not object_list:
+        return None
+    return encode_cursor(object_list[-1], ordering, total, page.number)
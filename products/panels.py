@@ -0,0 +1,157 @@
+"""
+Secondary panels of the product detail page (frequently bought, related
+products, specifications, reviews, caution).
+
+Each panel renders from the cached product detail DTO (products.detail)
+into its own fragment cache, so the product_panels endpoint can return any
+subset of them in one response. Product-local panels are keyed by the
+detail version and live as long as the DTO; panels listing other products
+keep a short TTL since their contents change without this product changing.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from . import copurchase, related
+from .cards import cards_for, get_cards
+from .detail import DETAIL_CACHE_TIMEOUT, get_version
+from .models import Product
+from .pagination import paginate_by_cursor
+
+
+PANELS = ('frequently_bought', 'related', 'specifications', 'reviews', 'caution')
+CROSS_PRODUCT_PANEL_TIMEOUT = 60 * 5
+REVIEW_PAGE_SIZE = 5
+# Newest first; the id makes the keyset total
+REVIEW_ORDERING = ['-created_at', '-id']
+
+PANEL_ERROR_HTML = {
+    'frequently_bought': '<div class="text-center py-4"><p class="text-muted">Unable to load frequently bought items.</p></div>',
+    'related': '<div class="text-center py-4"><p class="text-muted">Unable to load related products.</p></div>',
+    'reviews': '''
+            <div class="text-center py-4">
+                <i class="fa fa-comments fa-3x text-muted mb-3"></i>
+                <p class="text-muted">Unable to load reviews at this time.</p>
+            </div>
+            ''',
+}
+DEFAULT_ERROR_HTML = '<div class="text-center py-4"><p class="text-muted">Unable to load content.</p></div>'
+
+
+def parse_panels(value):
+    """Known panel names from a comma-separated `panels=` value (all if empty)"""
+    if not value:
+        return list(PANELS)
+    requested = [name.strip() for name in value.split(',')]
+    return [name for name in PANELS if name in requested]
+
+
+def frequently_bought_products(product_id, limit=4):
+    # Ranked partners precomputed by build_copurchase_matrix
+    return get_cards(copurchase.partner_ids(product_id, limit))
+
+
+def related_products(detail, limit=8):
+    # Content-similar neighbours precomputed by build_related_index
+    ids = related.related_ids(detail.id, limit)
+    if ids:
+        return get_cards(ids)
+    # Not indexed yet: newest products of the first category
+    category = next((c for c in detail.categories if c['is_active']), None)
+    if category is None:
+        return []
+    return cards_for(Product.objects.filter(
+        categories__id=category['id'],
+        is_active=True
+    ).exclude(id=detail.id).only('id', 'created_at').order_by('-created_at')[:limit])
+
+
+def render_frequently_bought(detail):
+    return render_to_string('shop/partials/frequently_bought.html', {
+        'products': frequently_bought_products(detail.id),
+    })
+
+
+def render_related(detail):
+    return render_to_string('shop/partials/related_products.html', {
+        'products': related_products(detail),
+    })
+
+
+def render_specifications(detail):
+    return render_to_string('shop/partials/specifications.html', {
+        'product': detail,
+        'specifications': detail.specifications,
+    })
+
+
+def review_page(product_id, cursor=None):
+    """One keyset page of a product's approved reviews (next_cursor on the page)"""
+    from reviews.models import Review
+
+    return paginate_by_cursor(
+        Review.objects.filter(product_id=product_id, is_approved=True).select_related('user'),
+        REVIEW_ORDERING, cursor, REVIEW_PAGE_SIZE, count=False
+    )
+
+
+def render_reviews(detail):
+    # Summary comes from the rating rollup; only the first page of rows is loaded
+    page = review_page(detail.id)
+    histogram = detail.rating_histogram
+    return render_to_string('shop/partials/reviews.html', {
+        'product': detail,
+        'reviews': page.object_list,
+        'next_cursor': page.next_cursor,
+        'review_count': detail.review_count,
+        'avg_rating': detail.avg_rating,
+        'five_star_count': histogram[5],
+        'four_star_count': histogram[4],
+        'three_star_count': histogram[3],
+        'two_star_count': histogram[2],
+        'one_star_count': histogram[1],
+        'total_reviews': detail.review_count,
+    })
+
+
+def render_caution(detail):
+    return render_to_string('partials/caution.html', {
+        'product': detail,
+        'caution_text': detail.caution or 'No specific cautions or warnings available for this product.'
+    })
+
+
+RENDERERS = {
+    'frequently_bought': render_frequently_bought,
+    'related': render_related,
+    'specifications': render_specifications,
+    'reviews': render_reviews,
+    'caution': render_caution,
+}
+
+# Panels whose content depends on other products too
+CROSS_PRODUCT_PANELS = {'frequently_bought', 'related'}
+
+
+def _cache_key(name, detail):
+    if name in CROSS_PRODUCT_PANELS:
+        return f'product_panel:{name}:{detail.id}'
+    return f'product_panel:{name}:{detail.id}:v{get_version(detail.id)}'
+
+
+def render_panel(name, detail):
+    """Fragment-cached HTML of one panel"""
+    key = _cache_key(name, detail)
+    html = cache.get(key)
+    if html is None:
+        try:
+            html = RENDERERS[name](detail)
+        except Exception as e:
+            print(f"Error rendering {name} panel: {e}")
+            return PANEL_ERROR_HTML.get(name, DEFAULT_ERROR_HTML)
+        timeout = CROSS_PRODUCT_PANEL_TIMEOUT if name in CROSS_PRODUCT_PANELS else DETAIL_CACHE_TIMEOUT
+        cache.set(key, html, timeout)
+    return html
+
+
+def render_panels(detail, names):
+    return {name: render_panel(name, detail) for name in names}
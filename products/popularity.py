@@ -0,0 +1,100 @@
+"""
+Buffered product view counting and a time-decayed popularity score.
+
+record_view() only bumps an in-process counter. Every FLUSH_INTERVAL
+seconds, or once FLUSH_THRESHOLD views are pending, the buffer is
+written back in one transaction. Each product gets a single
+UPDATE ... SET view_count = view_count + n, and its ProductCard the same
+UPDATE, since listings hydrate cards and the popular sort's cursor reads
+the score from them. A process also flushes when it exits.
+
+popularity_score is kept in log space, as ln(sum of e^((t - EPOCH) / TAU))
+over all views. A flush folds n new views in with a logaddexp. Old
+scores never need rewriting as time passes, because ordering by the
+stored value is the same as ordering by the exponentially decayed view
+count. That count has a half-life of HALF_LIFE.
+"""
+import atexit
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Value, FloatField
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+
+from .models import Product, ProductCard
+
+
+FLUSH_INTERVAL = 30
+FLUSH_THRESHOLD = 500
+HALF_LIFE = timedelta(days=7)
+TAU = HALF_LIFE.total_seconds() / math.log(2)
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+
+
+def score_offset(now=None):
+    """Log-space weight of one view at `now`"""
+    now = now or datetime.now(dt_timezone.utc)
+    return (now - EPOCH).total_seconds() / TAU
+
+
+def record_view(product_id):
+    """Count one view of a product; flushes the buffer when it's due"""
+    global _last_flush
+    with _lock:
+        _pending[product_id] += 1
+        due = (
+            sum(_pending.values()) >= FLUSH_THRESHOLD
+            or time.monotonic() - _last_flush >= FLUSH_INTERVAL
+        )
+        if not due:
+            return
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    _write(batch)
+
+
+def flush():
+    """Write every pending view now; returns the number of products updated"""
+    global _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    return _write(batch)
+
+
+def _write(batch, now=None):
+    if not batch:
+        return 0
+    offset = score_offset(now)
+    try:
+        with transaction.atomic():
+            for product_id, views in batch.items():
+                # logaddexp(score, ln(views) + offset) in SQL, so concurrent flushes add up
+                added = Value(math.log(views) + offset, output_field=FloatField())
+                changes = dict(
+                    view_count=F('view_count') + views,
+                    popularity_score=Greatest(F('popularity_score'), added)
+                    + Ln(1 + Exp(-Abs(F('popularity_score') - added))),
+                )
+                Product.objects.filter(id=product_id).update(**changes)
+                ProductCard.objects.filter(product_id=product_id).update(**changes)
+    except Exception as e:
+        print(f"Error flushing view counts: {e}")
+        # Keep the views for the next flush rather than losing them
+        with _lock:
+            _pending.update(batch)
+        return 0
+    return len(batch)
+
+
+atexit.register(flush)
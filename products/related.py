@@ -0,0 +1,244 @@
+"""
+Content-based related-products index.
+
+Each active product gets a sparse, L2-normalized feature vector. The
+vector is built from feature groups: its categories and their ancestors,
+its brand, its attribute values, its price band, and TF-IDF weighted
+tokens of the name, keywords and description. Each group is scaled to a
+fixed share of the vector so no group drowns the others. build() then
+stores the top-K cosine neighbours of every product in ProductRelated.
+
+Neighbours are found through an inverted index (feature -> products)
+rather than an all-pairs matrix product. The site has no NumPy
+dependency, and the vectors are sparse. Candidates are collected from a
+bounded slice of each posting list, most viewed first, and then scored
+with the exact cosine. Cost therefore grows with products x features,
+not products squared.
+
+Scoring is interpreted Python. On synthetic data of 100,000 products
+with about 25 features each, it took about 8 ms per product: roughly 14
+minutes for a full build on one core, plus the database reads and writes.
+build_related_index prints the time spent in each phase.
+"""
+import math
+import re
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import Product, ProductAttribute, CategoryClosure, ProductRelated
+
+
+TOP_K = 8
+BATCH_SIZE = 500
+# Candidates taken from each posting list (most viewed products first)
+MAX_POSTING_CANDIDATES = 200
+# Tokens in more than this share of products carry no signal
+MAX_TOKEN_DOCUMENT_SHARE = 0.5
+MIN_SCORE = 0.05
+
+# Share of each feature group in a product's vector
+GROUP_WEIGHTS = {
+    'cat': 1.0,
+    'text': 1.0,
+    'attr': 0.7,
+    'brand': 0.5,
+    'price': 0.4,
+}
+# Name tokens count more than keyword/description tokens
+NAME_TOKEN_WEIGHT = 3
+KEYWORD_TOKEN_WEIGHT = 2
+
+TOKEN_RE = re.compile(r'[^\W\d_]{3,}')
+STOPWORDS = {
+    'and', 'the', 'for', 'with', 'this', 'that', 'from', 'are', 'you', 'your',
+    'our', 'has', 'have', 'its', 'all', 'can', 'will', 'not', 'but', 'any',
+    'more', 'use', 'made', 'into', 'per', 'also', 'very', 'each', 'one',
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+def price_band(price):
+    """Log-scale price band: each band spans a factor of 1.5"""
+    if not price or price <= 0:
+        return None
+    return int(math.log(float(price), 1.5))
+
+
+def _scaled(weights, share):
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    if not norm:
+        return {}
+    return {feature: share * w / norm for feature, w in weights.items()}
+
+
+def _normalized(vector):
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if not norm:
+        return {}
+    return {feature: w / norm for feature, w in vector.items()}
+
+
+def build_vectors():
+    """{product_id: sparse unit vector} for every active product, plus view counts"""
+    products = list(
+        Product.objects.filter(is_active=True).values_list(
+            'id', 'name', 'product_keywords', 'description', 'brand_id', 'effective_price', 'view_count'
+        ).iterator(chunk_size=2000)
+    )
+
+    # Category features include ancestors, weighted down by depth
+    ancestors = defaultdict(list)
+    for descendant_id, ancestor_id, depth in CategoryClosure.objects.filter(
+        ancestor__is_active=True
+    ).values_list('descendant_id', 'ancestor_id', 'depth').iterator(chunk_size=5000):
+        ancestors[descendant_id].append((ancestor_id, depth))
+    categories = defaultdict(dict)
+    for product_id, category_id in Product.categories.through.objects.values_list(
+        'product_id', 'category_id'
+    ).iterator(chunk_size=5000):
+        for ancestor_id, depth in ancestors.get(category_id, ()):
+            weight = 1.0 / (1 + depth)
+            feature = f'cat:{ancestor_id}'
+            categories[product_id][feature] = max(categories[product_id].get(feature, 0), weight)
+
+    attributes = defaultdict(dict)
+    for product_id, value_id in ProductAttribute.objects.values_list(
+        'product_id', 'attribute_value_id'
+    ).iterator(chunk_size=5000):
+        attributes[product_id][f'attr:{value_id}'] = 1.0
+
+    # Term frequencies, then document frequencies for the IDF
+    term_counts = {}
+    document_frequency = Counter()
+    for product_id, name, keywords, description, *_ in products:
+        counts = Counter()
+        for token in tokenize(name):
+            counts[token] += NAME_TOKEN_WEIGHT
+        for token in tokenize(keywords):
+            counts[token] += KEYWORD_TOKEN_WEIGHT
+        counts.update(tokenize(description))
+        term_counts[product_id] = counts
+        document_frequency.update(counts.keys())
+
+    total = len(products) or 1
+    max_df = max(2, int(total * MAX_TOKEN_DOCUMENT_SHARE))
+    idf = {
+        token: math.log(total / df)
+        for token, df in document_frequency.items()
+        if 1 < df <= max_df
+    }
+
+    vectors = {}
+    view_counts = {}
+    for product_id, _, _, _, brand_id, effective_price, view_count in products:
+        view_counts[product_id] = view_count
+        vector = {}
+        vector.update(_scaled(categories.get(product_id, {}), GROUP_WEIGHTS['cat']))
+        vector.update(_scaled(attributes.get(product_id, {}), GROUP_WEIGHTS['attr']))
+        if brand_id:
+            vector[f'brand:{brand_id}'] = GROUP_WEIGHTS['brand']
+        band = price_band(effective_price)
+        if band is not None:
+            vector.update(_scaled(
+                {f'price:{band}': 1.0, f'price:{band - 1}': 0.5, f'price:{band + 1}': 0.5},
+                GROUP_WEIGHTS['price']
+            ))
+        text = {
+            f'tok:{token}': (1 + math.log(count)) * idf[token]
+            for token, count in term_counts[product_id].items()
+            if token in idf
+        }
+        vector.update(_scaled(text, GROUP_WEIGHTS['text']))
+        vector = _normalized(vector)
+        if vector:
+            vectors[product_id] = vector
+    return vectors, view_counts
+
+
+def build_postings(vectors, view_counts):
+    """Inverted index feature -> [product ids], most viewed first"""
+    postings = defaultdict(list)
+    for product_id, vector in vectors.items():
+        for feature in vector:
+            postings[feature].append(product_id)
+    for product_ids in postings.values():
+        product_ids.sort(key=lambda pid: (-view_counts.get(pid, 0), pid))
+    return postings
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b[feature] for feature, w in a.items() if feature in b)
+
+
+def neighbours(product_id, vectors, postings, top_k=TOP_K):
+    """[(score, related_id)] best first"""
+    vector = vectors[product_id]
+    candidates = set()
+    for feature in vector:
+        candidates.update(postings[feature][:MAX_POSTING_CANDIDATES])
+    candidates.discard(product_id)
+
+    scored = []
+    for candidate_id in candidates:
+        score = cosine(vector, vectors[candidate_id])
+        if score >= MIN_SCORE:
+            scored.append((score, candidate_id))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return scored[:top_k]
+
+
+def build(top_k=TOP_K, product_ids=None, progress=None):
+    """
+    Rebuild the index (for product_ids only, if given). Returns the number
+    of products indexed and the seconds spent per phase: {'vectors',
+    'postings', 'neighbours', 'writes'}. progress(done, total) is called
+    after each batch.
+    """
+    timings = {'vectors': 0.0, 'postings': 0.0, 'neighbours': 0.0, 'writes': 0.0}
+    started = time.perf_counter()
+    vectors, view_counts = build_vectors()
+    timings['vectors'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    postings = build_postings(vectors, view_counts)
+    timings['postings'] = time.perf_counter() - started
+
+    targets = sorted(vectors if product_ids is None else set(product_ids) & set(vectors))
+    for start in range(0, len(targets), BATCH_SIZE):
+        chunk = targets[start:start + BATCH_SIZE]
+        started = time.perf_counter()
+        rows = [
+            ProductRelated(product_id=product_id, related_id=related_id, rank=rank, score=score)
+            for product_id in chunk
+            for rank, (score, related_id) in enumerate(neighbours(product_id, vectors, postings, top_k), start=1)
+        ]
+        timings['neighbours'] += time.perf_counter() - started
+        started = time.perf_counter()
+        with transaction.atomic():
+            ProductRelated.objects.filter(product_id__in=chunk).delete()
+            ProductRelated.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        timings['writes'] += time.perf_counter() - started
+        if progress:
+            progress(start + len(chunk), len(targets))
+
+    if product_ids is None:
+        # Products no longer active keep no neighbours of their own
+        started = time.perf_counter()
+        ProductRelated.objects.exclude(product_id__in=Product.objects.filter(is_active=True)).delete()
+        timings['writes'] += time.perf_counter() - started
+    return len(targets), timings
+
+
+def related_ids(product_id, limit=8):
+    """Ranked related product ids of a product (one indexed read)"""
+    return list(
+        ProductRelated.objects.filter(product_id=product_id, related__is_active=True)
+        .order_by('rank').values_list('related_id', flat=True)[:limit]
+    )
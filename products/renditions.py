@@ -0,0 +1,281 @@
+"""
+Eager generation of the ProductImage ImageKit renditions.
+
+The thumbnail/small/medium/gallery specs and the responsive width
+ladder (core.images) are generated ahead of time, rather than on the
+first request that reads their URL. A newly uploaded
+or replaced image gets them from a post-commit hook (products/signals.py).
+The generate_renditions command covers the backlog and re-runs in a
+process pool.
+
+ProductImage.renditions_source records the source file the renditions
+were last generated for. An image is pending whenever that differs from
+its current file, so an interrupted run simply resumes where it stopped.
+The same write stores ProductImage.rendition_info: the URL, dimensions
+and byte size of the original and of every rendition, plus an inline LQIP
+placeholder. Pages, serializers and sitemaps read those values instead of
+asking storage.
+
+Admin uploads are not processed inside the request. queue_upload stores
+the original as-is and marks the row QUEUED. Its ProcessedImageField
+processing (core.images.Ingest) then runs first in generate_image, which
+marks the row READY or, on an error, FAILED (retried). Until the
+renditions are registered, pages serve the file itself for 'image' and
+ProductImage.PENDING_IMAGE_URL for every rendition.
+
+Work scheduled after commit runs on a small in-process thread pool
+(PRODUCT_IMAGE_BACKGROUND_THREADS), so the response doesn't wait for it.
+Anything that pool loses, for example to a restart, is still pending.
+`generate_renditions --watch` can run as a standalone worker, and the
+thread pool can then be turned off by setting the value to 0. Either way
+the results land in the database: cards are rebuilt there, and detail
+pages re-check images that were pending when they were cached
+(products.detail), so no shared cache is needed for them to show up.
+
+An image that fails MAX_PROCESSING_ATTEMPTS times is no longer pending.
+It is retried when its row is saved again, or by
+`generate_renditions --retry-failed`.
+
+PregeneratedStrategy is the default ImageKit cache file strategy, set by
+IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY. It makes reading a spec URL a pure
+string operation: there is no storage existence check and no inline
+generation. Site images without this bookkeeping opt out of it
+(core.images.REGISTERED_FIELDS).
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from imagekit.utils import generate as generate_file, suggest_extension
+
+from core import images
+
+from . import cards, detail
+from .models import ProductImage
+
+
+SPEC_NAMES = ('thumbnail', 'small', 'medium', 'gallery')
+BACKGROUND_THREADS = getattr(settings, 'PRODUCT_IMAGE_BACKGROUND_THREADS', 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PregeneratedStrategy:
+    """Cache file strategy for renditions generated ahead of time"""
+
+    def on_existence_required(self, file):
+        # URLs are served as if generated; generation happens off the request path
+        pass
+
+    def on_content_required(self, file):
+        # Reading pixels/dimensions still needs the file itself
+        file.generate()
+
+    def on_source_saved(self, file):
+        # Handled after commit by schedule_generate
+        pass
+
+
+def pending_images(since=None, product_ids=None, force=False, retry_failed=False):
+    """ProductImages whose renditions are missing or stale (not those that keep failing, unless retry_failed)"""
+    queryset = ProductImage.objects.exclude(image='')
+    if not force:
+        queryset = queryset.filter(
+            ~Q(renditions_source=F('image')) | ~Q(rendition_info__has_key='placeholder')
+        )
+        if not retry_failed:
+            queryset = queryset.filter(processing_attempts__lt=ProductImage.MAX_PROCESSING_ATTEMPTS)
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    if product_ids:
+        queryset = queryset.filter(product_id__in=product_ids)
+    return queryset.order_by('id')
+
+
+def queue_upload(image, upload):
+    """
+    Store an uploaded file unprocessed as `image`'s original and queue its
+    processing (call before saving the row)
+    """
+    field = ProductImage._meta.get_field('image')
+    image.image = field.storage.save(field.generate_filename(image, upload.name), upload)
+    image.processing_status = ProductImage.QUEUED
+    image.processing_error = ''
+    image.processing_attempts = 0
+
+
+def ingest(image):
+    """
+    Run the ProductImage.image processors over a queued original and point
+    the row at the result; returns the processed file name
+    """
+    field = ProductImage._meta.get_field('image')
+    original = image.image.name
+    with image.image.open('rb'):
+        spec = field.get_spec(source=image.image)
+        content = generate_file(spec)
+    # suggest_extension returns just the extension, as ProcessedImageField uses it
+    basename = os.path.basename(original)
+    filename = os.path.splitext(basename)[0] + suggest_extension(basename, spec.format)
+    name = field.storage.save(field.generate_filename(image, filename), content)
+    # Unless a newer upload replaced the original meanwhile
+    if not ProductImage.objects.filter(id=image.id, image=original).update(
+        image=name, processing_status=ProductImage.READY, processing_error=''
+    ):
+        raise ValueError('image was replaced while it was being processed')
+    image.image = name
+    return name
+
+
+def generate_image(image_id, force=False):
+    """
+    Generate every spec of one image (processing a queued original first);
+    returns (image_id, source name, {spec: seconds}, rendition info, error).
+    Runs in the pool workers as well.
+    """
+    timings = {}
+    try:
+        image = ProductImage.objects.get(id=image_id)
+        if image.processing_status != ProductImage.READY:
+            started = time.perf_counter()
+            ingest(image)
+            timings['ingest'] = time.perf_counter() - started
+        if not force:
+            # Same content already registered for another row (core.storage)
+            twin_info = ProductImage.objects.filter(
+                image=image.image.name, renditions_source=image.image.name,
+                rendition_info__has_key='placeholder'
+            ).exclude(id=image_id).values_list('rendition_info', flat=True).first()
+            if twin_info:
+                return image_id, image.image.name, timings, twin_info, None
+        info = {'image': images.describe(image.image), 'placeholder': images.placeholder(image.image)}
+        for name in SPEC_NAMES:
+            started = time.perf_counter()
+            spec = getattr(image, name)
+            spec.generate(force=force)
+            timings[name] = time.perf_counter() - started
+            info[name] = images.describe(spec)
+        # Responsive width ladder (core.images)
+        timings.update(images.generate_ladder(image.image, force=force))
+        info.update(images.describe_ladder(image.image))
+        return image_id, image.image.name, timings, info, None
+    except Exception as e:
+        return image_id, None, timings, None, str(e)
+
+
+def mark_generated(image_id, source_name, info):
+    # Only if the image wasn't replaced while its renditions were being built
+    ProductImage.objects.filter(id=image_id, image=source_name).update(
+        renditions_source=source_name, rendition_info=info, processing_error='', processing_attempts=0
+    )
+
+
+def mark_failed(image_id, error):
+    rows = ProductImage.objects.filter(id=image_id)
+    # Counted so a permanently broken file stops being retried (pending_images)
+    rows.update(processing_error=error[:255], processing_attempts=F('processing_attempts') + 1)
+    # An original that couldn't be processed is retried from the original
+    rows.filter(processing_status=ProductImage.QUEUED).update(processing_status=ProductImage.FAILED)
+
+
+def refresh_products(image_ids):
+    """Rebuild cards and detail DTOs of the images' products with the registered renditions"""
+    product_ids = sorted(set(
+        ProductImage.objects.filter(id__in=image_ids).values_list('product_id', flat=True)
+    ))
+    for start in range(0, len(product_ids), 500):
+        cards.refresh_cards(product_ids[start:start + 500])
+    detail.bump_version(product_ids)
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def generate(image_ids, workers=None, force=False, progress=None):
+    """
+    Generate renditions of image_ids in a pool of `workers` processes
+    (CPU count by default). Returns per-spec stats:
+    {spec: {'count': n, 'seconds': total}}, plus the list of failures.
+    """
+    image_ids = list(image_ids)
+    stats = defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+    failures = []
+
+    def collect(result):
+        image_id, source_name, timings, info, error = result
+        for name, seconds in timings.items():
+            stats[name]['count'] += 1
+            stats[name]['seconds'] += seconds
+        if error:
+            failures.append((image_id, error))
+            mark_failed(image_id, error)
+        else:
+            mark_generated(image_id, source_name, info)
+        if progress:
+            progress(image_id, error)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(image_ids) <= 1:
+        for image_id in image_ids:
+            collect(generate_image(image_id, force))
+    else:
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(generate_image, image_id, force) for image_id in image_ids]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    failed = {image_id for image_id, _ in failures}
+    refresh_products([image_id for image_id in image_ids if image_id not in failed])
+    return dict(stats), failures
+
+
+def generate_now(image_ids):
+    """Generate renditions inline (post-upload hook)"""
+    generated = []
+    for image_id in image_ids:
+        image_id, source_name, _, info, error = generate_image(image_id)
+        if error:
+            print(f"Error generating renditions for image {image_id}: {error}")
+            mark_failed(image_id, error)
+        else:
+            mark_generated(image_id, source_name, info)
+            generated.append(image_id)
+    if generated:
+        refresh_products(generated)
+
+
+def _generate_in_background(image_ids):
+    try:
+        generate_now(image_ids)
+    except Exception as e:
+        print(f"Error processing images {image_ids}: {e}")
+    finally:
+        # This thread's own connections
+        connections.close_all()
+
+
+def submit(image_ids):
+    """Process images on the background thread pool (left pending if it's disabled)"""
+    global _executor
+    if not BACKGROUND_THREADS:
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BACKGROUND_THREADS, thread_name_prefix='product-images')
+    _executor.submit(_generate_in_background, image_ids)
+
+
+def schedule_generate(image_ids):
+    """Process/generate renditions in the background once the current transaction commits"""
+    image_ids = list(image_ids)
+    if image_ids:
+        transaction.on_commit(lambda: submit(image_ids))
@@ -14,22 +14,31 @@ class BrandSerializer(serializers.ModelSerializer):
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
     thumbnail_url = serializers.SerializerMethodField()
+    width = serializers.SerializerMethodField()
+    height = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_url', 'thumbnail_url', 'alt_text', 'is_featured', 'display_order']
+        fields = ['id', 'image_url', 'thumbnail_url', 'width', 'height', 'alt_text', 'is_featured', 'display_order']
     
+    # URLs and sizes come from the rendition registry, without storage calls
     def get_image_url(self, obj):
         request = self.context.get('request')
         if obj.image and request:
-            return request.build_absolute_uri(obj.image.url)
+            return request.build_absolute_uri(obj.rendition_url('image'))
         return None
     
     def get_thumbnail_url(self, obj):
         request = self.context.get('request')
-        if obj.thumbnail and request:
-            return request.build_absolute_uri(obj.thumbnail.url)
+        if obj.image and request:
+            return request.build_absolute_uri(obj.rendition_url('thumbnail'))
         return None
+    
+    def get_width(self, obj):
+        return (obj.rendition('image') or {}).get('width')
+    
+    def get_height(self, obj):
+        return (obj.rendition('image') or {}).get('height')
 
 class AttributeValueSerializer(serializers.ModelSerializer):
     attribute_name = serializers.CharField(source='attribute.name')
@@ -79,7 +88,7 @@ class ProductListSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         main_image = obj.get_main_image()
         if main_image and main_image.image and request:
-            return request.build_absolute_uri(main_image.image.url)
+            return request.build_absolute_uri(main_image.rendition_url('image'))
         return None
     
     def get_discount_percentage(self, obj):
@@ -95,27 +104,11 @@ class ProductListSerializer(serializers.ModelSerializer):
         return obj.is_in_stock()
     
     def get_average_rating(self, obj):
-        """Calculate average rating on the fly"""
-        try:
-            from reviews.models import Review
-            avg = Review.objects.filter(
-                product=obj, 
-                is_approved=True
-            ).aggregate(avg=Avg('rating'))['avg']
-            return round(avg, 1) if avg else 0
-        except:
-            return 0
+        """Average approved rating from the product's rollup columns"""
+        return obj.avg_rating
     
     def get_review_count(self, obj):
-        """Count reviews on the fly"""
-        try:
-            from reviews.models import Review
-            return Review.objects.filter(
-                product=obj, 
-                is_approved=True
-            ).count()
-        except:
-            return 0
+        return obj.review_count
             
 
 class ProductDetailSerializer(serializers.ModelSerializer):
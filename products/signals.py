@@ -1,6 +1,10 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import ProductVariation
+from .models import (
+    Product, ProductVariation, ProductAttribute, ProductImage,
+    Brand, Category, Attribute, AttributeValue
+)
+from . import facets, cards, variations, detail, renditions
 from orders.models import OrderItem
 @receiver(post_save, sender=OrderItem)
 def update_stock_on_order(sender, instance, created, **kwargs):
@@ -12,4 +16,169 @@ def update_stock_on_order(sender, instance, created, **kwargs):
 def restore_stock_on_order_item_delete(sender, instance, **kwargs):
     if instance.variation:
         instance.variation.stock += instance.quantity
-        instance.variation.save()
\ No newline at end of file
+        instance.variation.save()
+
+
+# Facet index maintenance
+
+# Saves that only touch these don't change any listing or facet
+UNINDEXED_PRODUCT_FIELDS = {'view_count', 'popularity_score'}
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_facets_for_product(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= UNINDEXED_PRODUCT_FIELDS:
+        return
+    facets.schedule_refresh([instance.id])
+
+# No facet or listing reads variations, so stock and variation edits don't
+# touch the index
+@receiver([post_save, post_delete], sender=ProductAttribute)
+def refresh_facets_for_product_child(sender, instance, **kwargs):
+    facets.schedule_refresh([instance.product_id])
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def refresh_facets_for_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Category side of the relation: pk_set holds product ids
+        if pk_set:
+            facets.schedule_refresh(pk_set)
+        else:
+            facets.schedule_invalidate()
+    else:
+        facets.schedule_refresh([instance.id])
+
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Attribute)
+@receiver([post_save, post_delete], sender=AttributeValue)
+def invalidate_facets(sender, **kwargs):
+    facets.schedule_invalidate()
+
+
+# ProductCard maintenance
+
+@receiver(post_save, sender=Product)
+def refresh_card_for_product(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= UNINDEXED_PRODUCT_FIELDS:
+        # products.popularity updates the card's copy of these itself
+        return
+    cards.schedule_refresh([instance.id])
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductAttribute)
+@receiver([post_save, post_delete], sender=ProductVariation)
+def refresh_card_for_product_child(sender, instance, **kwargs):
+    cards.schedule_refresh([instance.product_id])
+
+@receiver(post_save, sender=Brand)
+def refresh_cards_for_brand(sender, instance, **kwargs):
+    cards.schedule_refresh(
+        Product.objects.filter(brand=instance).values_list('id', flat=True)
+    )
+
+@receiver(post_save, sender=AttributeValue)
+def refresh_cards_for_attribute_value(sender, instance, **kwargs):
+    cards.schedule_refresh(
+        ProductAttribute.objects.filter(attribute_value=instance).values_list('product_id', flat=True)
+    )
+
+@receiver(post_save, sender=Attribute)
+def refresh_cards_for_attribute(sender, instance, **kwargs):
+    cards.schedule_refresh(
+        ProductAttribute.objects.filter(attribute_value__attribute=instance).values_list('product_id', flat=True)
+    )
+
+
+# Variation matrix invalidation
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_variation_matrix_for_product(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= UNINDEXED_PRODUCT_FIELDS:
+        return
+    variations.schedule_invalidate([instance.id])
+
+@receiver([post_save, post_delete], sender=ProductVariation)
+def invalidate_variation_matrix_for_variation(sender, instance, **kwargs):
+    variations.schedule_invalidate([instance.product_id])
+
+@receiver(m2m_changed, sender=ProductVariation.attributes.through)
+def invalidate_variation_matrix_for_attributes(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # AttributeValue side: pk_set holds variation ids
+        product_ids = ProductVariation.objects.filter(
+            id__in=pk_set or []
+        ).values_list('product_id', flat=True)
+        variations.schedule_invalidate(product_ids)
+    else:
+        variations.schedule_invalidate([instance.product_id])
+
+@receiver(post_save, sender=AttributeValue)
+@receiver(post_save, sender=Attribute)
+def invalidate_variation_matrix_for_attribute(sender, instance, **kwargs):
+    lookup = 'attributes' if sender is AttributeValue else 'attributes__attribute'
+    variations.schedule_invalidate(
+        ProductVariation.objects.filter(**{lookup: instance}).values_list('product_id', flat=True)
+    )
+
+
+# Product detail cache versioning
+
+@receiver([post_save, post_delete], sender=Product)
+def bump_detail_for_product(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= UNINDEXED_PRODUCT_FIELDS:
+        return
+    detail.schedule_bump([instance.id])
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductAttribute)
+@receiver([post_save, post_delete], sender=ProductVariation)
+def bump_detail_for_product_child(sender, instance, **kwargs):
+    detail.schedule_bump([instance.product_id])
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def bump_detail_for_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    detail.schedule_bump(pk_set or [] if reverse else [instance.id])
+
+@receiver(m2m_changed, sender=ProductVariation.attributes.through)
+def bump_detail_for_variation_attributes(sender, instance, action, reverse, **kwargs):
+    if action.startswith('post_') and not reverse:
+        detail.schedule_bump([instance.product_id])
+
+@receiver(post_save, sender=Brand)
+def bump_detail_for_brand(sender, instance, **kwargs):
+    detail.schedule_bump(Product.objects.filter(brand=instance).values_list('id', flat=True))
+
+@receiver(post_save, sender=Category)
+def bump_detail_for_category(sender, instance, **kwargs):
+    detail.schedule_bump(instance.products.values_list('id', flat=True))
+
+@receiver(post_save, sender=AttributeValue)
+@receiver(post_save, sender=Attribute)
+def bump_detail_for_attribute(sender, instance, **kwargs):
+    lookup = 'attribute_value' if sender is AttributeValue else 'attribute_value__attribute'
+    product_ids = set(ProductAttribute.objects.filter(**{lookup: instance}).values_list('product_id', flat=True))
+    variation_lookup = 'attributes' if sender is AttributeValue else 'attributes__attribute'
+    product_ids.update(ProductVariation.objects.filter(**{variation_lookup: instance}).values_list('product_id', flat=True))
+    detail.schedule_bump(product_ids)
+
+
+# Image renditions
+
+@receiver(post_save, sender=ProductImage)
+def generate_renditions_for_image(sender, instance, **kwargs):
+    # New or replaced file: build its specs now instead of on the first page view
+    if instance.image and instance.renditions_source != instance.image.name:
+        if instance.processing_attempts:
+            # Saving the row again (e.g. with a new file) retries it afresh
+            ProductImage.objects.filter(id=instance.id).update(processing_attempts=0)
+        renditions.schedule_generate([instance.id])
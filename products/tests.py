@@ -1,3 +1,189 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.core.paginator import Paginator
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from . import image_import, popularity
+from .catalog import CatalogQuery, _clean_price
+from .models import Product, ProductCard, ProductImage, ProductVariation
+from .pagination import cursor_after_page, decode_cursor, encode_cursor, keyset_ordering, paginate_by_cursor
+
+
+class CleanPriceTests(SimpleTestCase):
+    def test_rounds_to_cents(self):
+        self.assertEqual(_clean_price('12.345'), Decimal('12.34'))
+        self.assertEqual(_clean_price(99), Decimal('99.00'))
+
+    def test_blank_is_no_bound(self):
+        self.assertIsNone(_clean_price(None))
+        self.assertIsNone(_clean_price(''))
+
+    def test_rejects_garbage(self):
+        for value in ('abc', '1,50', '1e30', [1]):
+            with self.subTest(value=value):
+                self.assertIsNone(_clean_price(value))
+
+    def test_rejects_non_finite(self):
+        for value in ('nan', 'NaN', 'snan', 'inf', '-Infinity'):
+            with self.subTest(value=value):
+                self.assertIsNone(_clean_price(value))
+
+    def test_non_finite_bound_is_dropped_from_the_spec(self):
+        self.assertEqual(CatalogQuery(min_price='nan', max_price='inf'), CatalogQuery())
+
+
+class CursorTests(SimpleTestCase):
+    ordering = keyset_ordering('-effective_price')
+
+    def row(self):
+        return SimpleNamespace(effective_price=Decimal('19.90'), id=42, created_at=datetime(2026, 1, 2, 3, 4, 5))
+
+    def test_keyset_ordering_adds_id_tie_breaker(self):
+        self.assertEqual(keyset_ordering('-effective_price'), ['-effective_price', '-id'])
+        self.assertEqual(keyset_ordering('name'), ['name', 'id'])
+        self.assertEqual(keyset_ordering('name', 'id'), ['name', 'id'])
+
+    def test_round_trip(self):
+        token = encode_cursor(self.row(), self.ordering, total=120, page_number=3)
+        payload = decode_cursor(token, self.ordering)
+        self.assertEqual(payload['k'], ['19.90', 42])
+        self.assertEqual((payload['t'], payload['p']), (120, 3))
+
+    def test_datetime_keys_round_trip_as_iso(self):
+        ordering = keyset_ordering('-created_at')
+        payload = decode_cursor(encode_cursor(self.row(), ordering, 10, 1), ordering)
+        self.assertEqual(payload['k'], ['2026-01-02T03:04:05', 42])
+
+    def test_rejects_other_sort(self):
+        token = encode_cursor(self.row(), self.ordering, 120, 3)
+        self.assertIsNone(decode_cursor(token, keyset_ordering('effective_price')))
+
+    def test_rejects_missing_or_tampered(self):
+        token = encode_cursor(self.row(), self.ordering, 120, 3)
+        self.assertIsNone(decode_cursor('', self.ordering))
+        self.assertIsNone(decode_cursor(None, self.ordering))
+        self.assertIsNone(decode_cursor(token[:-2] + 'xx', self.ordering))
+
+
+class CursorPaginationTests(TestCase):
+    def test_walks_every_row_once_across_ties(self):
+        for i in range(7):
+            # Three price ties, so pages split inside a run of equal keys
+            Product.objects.create(name=f'P{i}', sku=f'P{i}', price=Decimal(10 + i // 3))
+        ordering = keyset_ordering('-effective_price')
+        seen, cursor, numbers = [], None, []
+        while True:
+            page = paginate_by_cursor(Product.objects.all(), ordering, cursor, per_page=2)
+            seen.extend(product.id for product in page)
+            numbers.append(page.number)
+            self.assertEqual(page.total, 7)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+
+        expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(numbers, [1, 2, 3, 4])
+
+
+class PopularListingTests(TestCase):
+    def setUp(self):
+        for i in range(30):
+            product = Product.objects.create(name=f'P{i}', sku=f'P{i}', price=10)
+            # Ten-way ties, so pages split inside a run of equal scores
+            Product.objects.filter(id=product.id).update(popularity_score=i // 10)
+        self.catalog = CatalogQuery(sort='popular')
+        self.expected = list(
+            Product.objects.order_by(*self.catalog.ordering).values_list('id', flat=True)
+        )
+
+    def test_pages_past_the_first_in_page_mode(self):
+        paginator = Paginator(self.catalog.listing(), 12)
+        seen = []
+        for number in paginator.page_range:
+            page = paginator.page(number)
+            seen.extend(card.id for card in page)
+            cursor = cursor_after_page(page, self.catalog.ordering, paginator.count)
+            self.assertEqual(cursor is None, not page.has_next())
+        self.assertEqual(seen, self.expected)
+
+    def test_pages_past_the_first_in_cursor_mode(self):
+        listing = self.catalog.listing()
+        seen, cursor = [], None
+        while True:
+            page = listing.cursor_page(cursor, per_page=12)
+            seen.extend(card.id for card in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+
+    def test_flush_moves_the_card_score_with_the_product(self):
+        product_id = self.expected[-1]
+        self.catalog.listing()[:30]
+        popularity._write({product_id: 3})
+        card = ProductCard.objects.get(product_id=product_id)
+        product = Product.objects.get(id=product_id)
+        self.assertEqual((card.view_count, card.popularity_score), (3, product.popularity_score))
+        self.assertGreater(card.popularity_score, 2)
+
+
+class ListingQuerysetTests(TestCase):
+    def test_main_image_urls_need_no_query_per_image(self):
+        for i in range(3):
+            product = Product.objects.create(name=f'P{i}', sku=f'P{i}', price=10)
+            ProductImage.objects.bulk_create([ProductImage(
+                product=product, image=f'cas/aa/bb/{i}.webp', renditions_source=f'cas/aa/bb/{i}.webp',
+                rendition_info={'thumbnail': {'url': f'/media/{i}.webp'}}, is_featured=True
+            )])
+        products = list(CatalogQuery().queryset())
+
+        with self.assertNumQueries(0):
+            urls = [product.get_main_image_url() for product in products]
+        self.assertEqual(sorted(urls), ['/media/0.webp', '/media/1.webp', '/media/2.webp'])
+
+
+class ImportProductImagesTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.addCleanup(shutil.rmtree, self.source)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = Product.objects.create(name='Mug', sku='MUG', price=10)
+        ProductVariation.objects.create(product=self.product, sku='MUG-RED', price=12)
+
+    def write(self, *names):
+        for shade, name in enumerate(names):
+            Image.new('RGB', (40, 30), (shade * 50, 80, 120)).save(os.path.join(self.source, name))
+
+    def run_import(self):
+        skus = image_import.sku_index()
+        entries, _ = image_import.read_source(self.source, skus)
+        return image_import.import_entries(entries, skus, workers=1)
+
+    def test_numbers_images_per_product_across_skus(self):
+        self.write('MUG.jpg', 'MUG_2.jpg', 'MUG-RED.jpg', 'MUG-RED_2.jpg')
+        stats = self.run_import()
+
+        self.assertEqual(stats['created'], 4)
+        images = list(ProductImage.objects.filter(product=self.product).order_by('display_order'))
+        self.assertEqual([image.display_order for image in images], [0, 1, 2, 3])
+        self.assertEqual([image.is_featured for image in images], [True, False, False, False])
+        self.assertTrue(all(image.image.name.endswith('.webp') for image in images))
+
+    def test_rerun_skips_imported_files_and_keeps_one_featured(self):
+        self.write('MUG.jpg', 'MUG-RED.jpg')
+        self.run_import()
+        stats = self.run_import()
+
+        self.assertEqual((stats['created'], stats['skipped']), (0, 2))
+        self.assertEqual(ProductImage.objects.filter(product=self.product, is_featured=True).count(), 1)
@@ -23,11 +23,13 @@ urlpatterns = [
 
     path('categories/', views.category_list, name='category_list'),
     path('brands/', views.brand_list, name='brand_list'),
+    path('<int:product_id>/quickview/', views.product_quick_view, name='product_quick_view'),
     path('<slug:slug>/', views.product_detail, name='product_detail'),
 
     # AJAX endpoints
     path('ajax/frequently-bought/', views.get_frequently_bought, name='get_frequently_bought'),
     path('ajax/related-products/', views.get_related_products, name='get_related_products'),
+    path('ajax/panels/', views.product_panels, name='product_panels'),
     path('ajax/tab-content/', views.get_tab_content, name='get_tab_content'),
     path('ajax/variation-price/', views.get_product_variation_price, name='get_product_variation_price'),
     path('ajax/quick-add-to-cart/', views.quick_add_to_cart, name='quick_add_to_cart'),
@@ -0,0 +1,184 @@
+"""
+Per-product variation matrix: normalized attribute combination -> variation.
+
+The product page, the variation price/variant AJAX endpoints, add to cart
+and buy now all resolve "which variation did the customer pick" from a
+{attribute name: value} selection. The matrix is built once per product
+(one query for the variations and their attribute values), cached, and
+dropped whenever a variation, its stock or the product's price changes, so
+each resolution is a dict lookup. That drop only reaches other processes
+through a shared cache, so add to cart and buy now take just the variation
+id from the matrix and read stock and price from the row (resolve_for_sale).
+
+Attribute names are compared by slug (the form fields post
+`attribute_<slugified name>` while the JSON endpoints send the display
+name) and values case-insensitively.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.text import slugify
+
+from .models import Product, ProductVariation, AttributeValue
+
+
+VARIATION_MATRIX_TIMEOUT = 60 * 60
+ATTRIBUTE_FIELD_PREFIX = 'attribute_'
+
+
+def normalize_name(name):
+    return slugify(str(name)).replace('_', '-')
+
+
+def normalize_value(value):
+    return str(value).strip().lower()
+
+
+def variation_key(attributes):
+    """Canonical, order-independent key for an {attribute name: value} selection"""
+    return tuple(sorted(
+        (normalize_name(name), normalize_value(value))
+        for name, value in attributes.items()
+        if normalize_name(name)
+    ))
+
+
+def key_string(key):
+    """The key as a string, for the client-side copy of the matrix"""
+    return '|'.join(f'{name}={value}' for name, value in key)
+
+
+def attributes_from_post(data):
+    """{attribute name: value} from `attribute_<name>` form fields"""
+    return {
+        key[len(ATTRIBUTE_FIELD_PREFIX):]: value
+        for key, value in data.items()
+        if key.startswith(ATTRIBUTE_FIELD_PREFIX)
+    }
+
+
+def _cache_key(product_id):
+    return f'variation_matrix:{product_id}'
+
+
+def build_matrix(product_id):
+    """Build the matrix dict for one product, or None if it doesn't exist"""
+    product = Product.objects.filter(id=product_id).only('id', 'price', 'discount_price').first()
+    if product is None:
+        return None
+
+    variations = ProductVariation.objects.filter(
+        product_id=product_id, is_active=True
+    ).prefetch_related(
+        Prefetch(
+            'attributes',
+            queryset=AttributeValue.objects.select_related('attribute').only('id', 'value', 'attribute__name')
+        )
+    ).only('id', 'price', 'sku', 'stock').order_by('id')
+
+    base_price = product.get_price()
+    entries = {}
+    total_stock = 0
+    for variation in variations:
+        attributes = {attr.attribute.name: attr.value for attr in variation.attributes.all()}
+        total_stock += variation.stock
+        key = variation_key(attributes)
+        if key in entries:
+            # Duplicate combination: the oldest variation wins
+            continue
+        entries[key] = {
+            'id': variation.id,
+            'price': variation.price if variation.price else base_price,
+            'stock': variation.stock,
+            'sku': variation.sku,
+            'attributes': attributes,
+        }
+
+    return {
+        'product_id': product.id,
+        'price': base_price,
+        'original_price': product.price if product.discount_price else None,
+        'total_stock': total_stock,
+        'entries': entries,
+    }
+
+
+def get_variation_matrix(product_id):
+    """Cached matrix for a product (None if the product doesn't exist)"""
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return None
+    matrix = cache.get(_cache_key(product_id))
+    if matrix is None:
+        matrix = build_matrix(product_id)
+        if matrix is not None:
+            cache.set(_cache_key(product_id), matrix, VARIATION_MATRIX_TIMEOUT)
+    return matrix
+
+
+def resolve_variation(product_id, attributes):
+    """Matrix entry (id, price, stock, sku, attributes) for a selection, or None"""
+    if not attributes:
+        return None
+    matrix = get_variation_matrix(product_id)
+    if matrix is None:
+        return None
+    return matrix['entries'].get(variation_key(attributes))
+
+
+def resolve_for_sale(product, attributes):
+    """
+    The ProductVariation a selection picks, read from the database, or None.
+    The cached matrix (per process, up to VARIATION_MATRIX_TIMEOUT old) only
+    supplies the id; stock and price come from the row, so carts and orders
+    never take a stale price or stock level.
+    """
+    entry = resolve_variation(product.id, attributes)
+    if entry is None:
+        return None
+    variation = ProductVariation.objects.filter(
+        id=entry['id'], product_id=product.id, is_active=True
+    ).only('id', 'product_id', 'price', 'stock').first()
+    if variation is None:
+        # Deactivated or deleted since the matrix was cached
+        invalidate([product.id])
+        return None
+    variation.product = product
+    return variation
+
+
+def matrix_for_client(matrix):
+    """JSON-safe copy of the matrix embedded in the product page"""
+    if matrix is None:
+        return {}
+    names = {
+        name: normalize_name(name)
+        for entry in matrix['entries'].values()
+        for name in entry['attributes']
+    }
+    return {
+        'names': names,
+        'price': str(matrix['price']),
+        'original_price': str(matrix['original_price']) if matrix['original_price'] else None,
+        'total_stock': matrix['total_stock'],
+        'variations': {
+            key_string(key): {
+                'id': entry['id'],
+                'price': str(entry['price']),
+                'stock': entry['stock'],
+                'sku': entry['sku'],
+            }
+            for key, entry in matrix['entries'].items()
+        },
+    }
+
+
+def invalidate(product_ids):
+    cache.delete_many([_cache_key(product_id) for product_id in set(product_ids) if product_id])
+
+
+def schedule_invalidate(product_ids):
+    """Drop the cached matrices once the surrounding transaction commits"""
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: invalidate(product_ids))
@@ -3,7 +3,7 @@ import json
 import time
 from django.db import connection
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.db.models import Q, Count, Avg, Min, Max, Prefetch
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
@@ -19,6 +19,14 @@ from .models import (
 )
 
 from products.models import Product, Category, Brand, AttributeValue
+from products.facets import get_facet_index
+from products.catalog import CatalogQuery
+from products.cards import cards_for, get_card
+from products.variations import get_variation_matrix, resolve_variation
+from products.detail import get_product_detail, get_product_detail_by_id
+from products.panels import parse_panels, render_panel, render_panels, review_page
+from products.pagination import cursor_after_page
+from products.popularity import record_view
 from reviews.models import Review
 from orders.models import (
     PaymentMethod, Order, OrderItem,
@@ -446,50 +454,27 @@ def Catalogue(request, category_slug=None, brand_slug=None):
     # Get only page parameter
     page = request.GET.get('page', 1)
     
-    # Base queryset with optimizations
-    products = Product.objects.filter(is_active=True).select_related('brand').prefetch_related(
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('display_order', 'id')
-        ),
-        Prefetch(
-            'categories',
-            queryset=Category.objects.only('id', 'name', 'slug', 'parent_id')
-        ),
-        Prefetch(
-            'reviews',
-            queryset=Review.objects.only('product_id', 'rating', 'created_at')
-        )
-    ).only(
-        'id', 'name', 'slug', 'price', 'discount_price', 'brand__name',
-        'brand__slug', 'brand__id', 'created_at', 'view_count', 'description', 'is_featured', 'sku'
-    ).order_by('created_at')
+    # Category/brand from the URL, sorted A-Z
+    catalog = CatalogQuery(
+        categories=[category_slug or ''],
+        brand=brand_slug,
+        sort='name',
+    )
     
     # Category handling
-    category = None
     current_category = None
-    
-    # Category from URL parameter
     if category_slug:
-        try:
-            category = get_object_or_404(Category, slug=category_slug, is_active=True)
-            current_category = category
-            # Get all descendant category IDs
-            descendant_ids = category.get_descendant_ids()
-            products = products.filter(categories__id__in=descendant_ids)
-        except Category.DoesNotExist:
-            pass
+        current_category = catalog.get_categories().get(category_slug)
+        if current_category is None:
+            raise Http404("No Category matches the given query.")
     
     # Brand from URL parameter
+    brand = None
     if brand_slug:
-        try:
-            brand = get_object_or_404(Brand, slug=brand_slug, is_active=True)
-            products = products.filter(brand=brand)
-        except Brand.DoesNotExist:
-            pass
+        brand = get_object_or_404(Brand, slug=brand_slug, is_active=True)
     
-    # Sort A-Z
-    products = products.order_by('name')
+    # Ordered ids come from the listing cache; pages hydrate just their products
+    products = catalog.listing()
     
     # Pagination for infinite scroll
     per_page = 12
@@ -502,31 +487,8 @@ def Catalogue(request, category_slug=None, brand_slug=None):
     
     # If it's an AJAX request, return JSON
     if is_ajax:
-        products_data = []
-        for product in products_page:
-            # Get main image
-            main_image = product.images.filter(is_featured=True).first()
-            if not main_image and product.images.exists():
-                main_image = product.images.first()
-            
-            # Calculate discount percentage
-            discount_percentage = 0
-            if product.discount_price and product.price and product.price > 0:
-                discount_percentage = ((product.price - product.discount_price) / product.price) * 100
-                discount_percentage = round(discount_percentage)
-            
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'slug': product.slug,
-                'price': str(product.price),
-                'discount_price': str(product.discount_price) if product.discount_price else None,
-                'discount_percentage': discount_percentage,
-                'brand_name': product.brand.name if product.brand else '',
-                'brand_slug': product.brand.slug if product.brand else '',
-                'image_url': main_image.image.url if main_image else '/static/img/no-image.jpg',
-                'url': product.get_absolute_url(),
-            })
+        # Cards carry everything the JSON needs (one narrow query per page)
+        products_data = [product.to_dict() for product in products_page]
         
         return JsonResponse({
             'success': True,
@@ -543,12 +505,8 @@ def Catalogue(request, category_slug=None, brand_slug=None):
     page_title = "All Products"
     if current_category:
         page_title = f"{current_category.name} - Products"
-    elif brand_slug:
-        try:
-            brand = Brand.objects.get(slug=brand_slug)
-            page_title = f"{brand.name} - Products"
-        except:
-            pass
+    elif brand:
+        page_title = f"{brand.name} - Products"
     
     
     
@@ -591,198 +549,74 @@ def _product_list_base(request, category_slug=None, brand_slug=None):
     sort = request.GET.get('sort', '')
     featured = request.GET.get('featured', '')
     
-    # Base queryset with optimizations
-    products = Product.objects.filter(is_active=True).select_related('brand').prefetch_related(
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('display_order', 'id')
-        ),
-        Prefetch(
-            'categories',
-            queryset=Category.objects.only('id', 'name', 'slug', 'parent_id')
-        ),
-        Prefetch(
-            'reviews',
-            queryset=Review.objects.only('product_id', 'rating', 'created_at')
-        )
-    ).only(
-        'id', 'name', 'slug', 'price', 'discount_price', 'brand__name',
-        'brand__slug', 'brand__id', 'created_at', 'view_count', 'description', 'is_featured', 'sku'
-    ).distinct().order_by('created_at')
-    
-    # Featured filter (for deals)
-    if featured.lower() == 'true':
-        products = products.filter(is_featured=True)
+    # Normalized filter spec shared with the other listing entry points
+    catalog = CatalogQuery.from_params(request.GET, category_slug=category_slug, brand_slug=brand_slug)
     
-    # Category handling
+    # Category handling (the GET category wins over the URL one for display)
     subcategory_list = None
-    category = None
     current_category = None
-    
-    # Category from URL parameter
-    if category_slug:
-        try:
-            category = get_object_or_404(Category, slug=category_slug, is_active=True)
-            current_category = category
-            # Get all descendant category IDs
-            descendant_ids = category.get_descendant_ids()
-            products = products.filter(categories__id__in=descendant_ids)
-            subcategory_list = Category.objects.filter(
-                parent=category, 
-                is_active=True
-            ).only('id', 'name', 'slug', 'image').order_by('display_order', 'name')
-        except Category.DoesNotExist:
-            pass
-    
-    # Category from GET parameter
-    if category_slug_get:
-        try:
-            category = get_object_or_404(Category, slug=category_slug_get, is_active=True)
-            current_category = category
-            descendant_ids = category.get_descendant_ids()
-            products = products.filter(categories__id__in=descendant_ids)
-            subcategory_list = Category.objects.filter(
-                parent=category, 
-                is_active=True
-            ).only('id', 'name', 'slug', 'image').order_by('display_order', 'name')
-        except Category.DoesNotExist:
-            pass
+    categories = catalog.get_categories()
+    for slug in (category_slug, category_slug_get):
+        if not slug:
+            continue
+        if slug not in categories:
+            raise Http404("No Category matches the given query.")
+        current_category = categories[slug]
+        subcategory_list = Category.objects.filter(
+            parent=current_category, 
+            is_active=True
+        ).only('id', 'name', 'slug', 'image').order_by('display_order', 'name')
     
     # Brand from URL parameter
+    brand = None
     if brand_slug:
-        try:
-            brand = get_object_or_404(Brand, slug=brand_slug, is_active=True)
-            products = products.filter(brand=brand)
-        except Brand.DoesNotExist:
-            pass
-    
-    # Apply filters
-    if query:
-        products = products.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(sku__icontains=query)
-        )
+        brand = get_object_or_404(Brand, slug=brand_slug, is_active=True)
     
-    if brand_slugs:
-        products = products.filter(brand__slug__in=brand_slugs)
+    products = catalog.listing()
+    ordering = catalog.ordering
     
-    # Price filter - handle both price and discount_price
-    if min_price:
-        try:
-            min_price_val = float(min_price)
-            # Complex query to handle both price and discount_price
-            products = products.filter(
-                Q(price__gte=min_price_val) |
-                Q(discount_price__gte=min_price_val) |
-                Q(price__gte=min_price_val, discount_price__isnull=True)
-            )
-        except (ValueError, TypeError):
-            pass
-    
-    if max_price:
-        try:
-            max_price_val = float(max_price)
-            # Complex query to handle both price and discount_price
-            products = products.filter(
-                Q(price__lte=max_price_val) |
-                Q(discount_price__lte=max_price_val) |
-                Q(price__lte=max_price_val, discount_price__isnull=True)
-            )
-        except (ValueError, TypeError):
-            pass
-    
-    if rating:
-        try:
-            rating_val = float(rating)
-            # Get products with average rating >= selected rating
-            products_with_rating = Review.objects.values('product').annotate(
-                avg_rating=Avg('rating')
-            ).filter(avg_rating__gte=rating_val).values_list('product', flat=True)
-            products = products.filter(id__in=products_with_rating)
-        except (ValueError, TypeError):
-            pass
-    
-    if attribute_values:
-        products = products.filter(attributes__id__in=attribute_values).distinct()
-    
-    # Get price range for the filter
-    price_range = products.aggregate(
-        min_price=Min('price'),
-        max_price=Max('price')
-    )
+    # Sidebar facets from the in-memory index
+    # (infinite-scroll requests don't render the sidebar, so skip the id queries)
+    facet_index = get_facet_index()
+    available_mask = catalog.facet_mask(facet_index, with_db=not is_ajax)
     
-    # BASE CONTEXT: Get products for determining available options
+    # BASE CONTEXT: products for determining available options
     # This is the initial filtered set BEFORE brand/attribute/price filters
-    base_context_products = Product.objects.filter(is_active=True).order_by('created_at')
-    
-    # Apply the same category filter to base context
-    if current_category:
-        descendant_ids = current_category.get_descendant_ids()
-        base_context_products = base_context_products.filter(categories__id__in=descendant_ids)
-    
-    # Apply search query to base context
-    if query:
-        base_context_products = base_context_products.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(sku__icontains=query)
-        )
+    base_context_mask = facet_index.context_mask(
+        category_id=current_category.id if current_category else None,
+        featured=catalog.featured,
+    )
+    if catalog.query and not is_ajax:
+        base_context_mask &= catalog.search_bits()
     
-    # Apply featured filter to base context
-    if featured.lower() == 'true':
-        base_context_products = base_context_products.filter(is_featured=True)
+    # Get price range for the filter
+    price_range = facet_index.price_range(available_mask)
     
     # Get ALL brands for the current context (category + search + featured)
-    all_context_brands = Brand.objects.filter(
-        product__in=base_context_products.values('id'),
-        is_active=True
-    ).annotate(
-        product_count=Count('product')
-    ).filter(product_count__gt=0).order_by('-product_count')
-    
-    # Get brands for the CURRENT filtered products (to know which are available)
-    if products.exists():
-        available_brands = Brand.objects.filter(
-            product__in=products.values('id')
-        ).annotate(
-            product_count=Count('product')
-        ).filter(product_count__gt=0).order_by('-product_count')
-        available_brand_slugs = set(available_brands.values_list('slug', flat=True))
-    else:
-        available_brand_slugs = set()
+    all_context_brands = facet_index.brand_counts(base_context_mask)
+    available_brand_slugs = {
+        option['slug'] for option in facet_index.brand_counts(available_mask, active_only=False)
+    }
     
     # Get ALL attributes for the current context (category + search + featured)
-    all_context_attributes = AttributeValue.objects.filter(
-        product__in=base_context_products.values('id')
-    ).annotate(
-        product_count=Count('product')
-    ).filter(product_count__gt=0).select_related('attribute').order_by('attribute__name', 'value')
-    
-    # Get attributes for the CURRENT filtered products (to know which are available)
-    if products.exists():
-        available_attributes = AttributeValue.objects.filter(
-            product__in=products.values('id')
-        ).annotate(
-            product_count=Count('product')
-        ).filter(product_count__gt=0).select_related('attribute').order_by('attribute__name', 'value')
-        available_attribute_ids = set(available_attributes.values_list('id', flat=True))
-    else:
-        available_attribute_ids = set()
+    all_context_attributes = facet_index.attribute_counts(base_context_mask)
+    available_attribute_ids = {
+        attr['id'] for attr in facet_index.attribute_counts(available_mask)
+    }
     
     # Group ALL context attributes by their type
     attribute_groups = {}
     for attr in all_context_attributes:
-        attr_name = attr.attribute.name
+        attr_name = attr['attribute']
         if attr_name not in attribute_groups:
             attribute_groups[attr_name] = []
         
         # Add attribute with availability info
         attr_dict = {
-            'id': attr.id,
-            'value': attr.value,
-            'product_count': attr.product_count,
-            'is_available': attr.id in available_attribute_ids
+            'id': attr['id'],
+            'value': attr['value'],
+            'product_count': attr['product_count'],
+            'is_available': attr['id'] in available_attribute_ids
         }
         attribute_groups[attr_name].append(attr_dict)
     
@@ -811,49 +645,6 @@ def _product_list_base(request, category_slug=None, brand_slug=None):
     # Determine selected category
     selected_category = category_slug or category_slug_get
     
-     # Sorting
-    if sort == 'price_asc':
-        # Sort by actual price (minimum of price and discount_price)
-        # Use Case/When to handle null discount_price
-        from django.db.models import Case, When, F, Value, FloatField
-        
-        products = products.annotate(
-            actual_price=Case(
-                When(discount_price__isnull=False, discount_price__gt=0, 
-                     then=F('discount_price')),
-                default=F('price'),
-                output_field=FloatField()
-            )
-        ).order_by('actual_price')
-        
-    elif sort == 'price_desc':
-        # Sort by actual price (minimum of price and discount_price) descending
-        from django.db.models import Case, When, F, Value, FloatField
-        
-        products = products.annotate(
-            actual_price=Case(
-                When(discount_price__isnull=False, discount_price__gt=0, 
-                     then=F('discount_price')),
-                default=F('price'),
-                output_field=FloatField()
-            )
-        ).order_by('-actual_price')
-        
-    elif sort == 'rating':
-        # Annotate with average rating and review count
-        products = products.annotate(
-            avg_rating=Avg('reviews__rating'),
-            review_count=Count('reviews')
-        ).order_by('-avg_rating', '-review_count')
-        
-    elif sort == 'newest':
-        products = products.order_by('-created_at')
-        
-    elif sort == 'popular':
-        products = products.order_by('-view_count')
-        
-    else:
-        products = products.order_by('-created_at')
 
     # Calculate average ratings for products (if not already done in rating sort)
     # if sort != 'rating':
@@ -873,58 +664,37 @@ def _product_list_base(request, category_slug=None, brand_slug=None):
     
     
     # Pagination for infinite scroll
+    # Opt-in cursor mode (?cursor=...) skips OFFSET and re-counting on every scroll
     per_page = 12
-    paginator = Paginator(products, per_page)
-    
-    try:
-        products_page = paginator.page(page)
-    except:
-        products_page = paginator.page(1)
+    if is_ajax and 'cursor' in request.GET:
+        products_page = products.cursor_page(request.GET.get('cursor'), per_page)
+        total_products = products_page.total
+        next_cursor = products_page.next_cursor
+    else:
+        paginator = Paginator(products, per_page)
+        
+        try:
+            products_page = paginator.page(page)
+        except:
+            products_page = paginator.page(1)
+        
+        total_products = paginator.count
+        next_cursor = cursor_after_page(products_page, ordering, total_products)
     
     # If it's an AJAX request, return JSON
     if is_ajax:
-        products_data = []
-        for product in products_page:
-            # Get main image
-            main_image = product.images.filter(is_featured=True).first()
-            if not main_image and product.images.exists():
-                main_image = product.images.first()
-            
-            # Calculate discount percentage
-            discount_percentage = 0
-            if product.discount_price and product.price and product.price > 0:
-                discount_percentage = ((product.price - product.discount_price) / product.price) * 100
-                discount_percentage = round(discount_percentage)
-            
-            # Get average rating
-            avg_rating = product.avg_rating or 0
-            review_count = product.review_count or 0
-            
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'slug': product.slug,
-                'price': str(product.price),
-                'discount_price': str(product.discount_price) if product.discount_price else None,
-                'discount_percentage': discount_percentage,
-                'brand_name': product.brand.name if product.brand else '',
-                'image_url': main_image.image.url if main_image else '/static/img/no-image.jpg',
-                'url': product.get_absolute_url(),
-                'avg_rating': round(avg_rating, 1) if avg_rating else 0,
-                'review_count': review_count,
-            })
+        # Cards carry everything the JSON needs (one narrow query per page)
+        products_data = [product.to_dict() for product in products_page]
         
         return JsonResponse({
             'success': True,
             'products': products_data,
             'has_next': products_page.has_next(),
             'next_page': products_page.next_page_number() if products_page.has_next() else None,
-            'total_products': paginator.count,
+            'next_cursor': next_cursor,
+            'total_products': total_products,
         })
     
-    # For normal request, prepare context
-    total_products = paginator.count
-    
     # Page title
     page_title = "All Products"
     if current_category:
@@ -933,12 +703,8 @@ def _product_list_base(request, category_slug=None, brand_slug=None):
         page_title = "Deals of the Day"
     elif sort == 'newest':
         page_title = "New Arrivals"
-    elif brand_slug:
-        try:
-            brand = Brand.objects.get(slug=brand_slug)
-            page_title = f"{brand.name} - Products"
-        except:
-            pass
+    elif brand:
+        page_title = f"{brand.name} - Products"
     
     # Get active currency
     try:
@@ -975,6 +741,7 @@ def _product_list_base(request, category_slug=None, brand_slug=None):
         'subcategory_list': subcategory_list,
         'category': current_category,
         'total_products': total_products,
+        'next_cursor': next_cursor,
         'page_title': page_title,
         'currency_symbol': currency_symbol,
         'is_featured_filter': featured.lower() == 'true',
@@ -996,158 +763,38 @@ def load_more_products(request):
             page = data.get('page', 1)
             
             # Recreate the filtered queryset
-            products = Product.objects.filter(is_active=True).select_related('brand').prefetch_related(
-                Prefetch(
-                    'images',
-                    queryset=ProductImage.objects.only('image', 'product_id', 'is_featured').order_by('id')
-                ),
-                Prefetch(
-                    'categories',
-                    queryset=Category.objects.only('id', 'name', 'slug')
-                ),
-                Prefetch(
-                    'reviews',
-                    queryset=Review.objects.only('product_id', 'rating', 'created_at')
-                )
-            ).only(
-                'id', 'name', 'slug', 'price', 'discount_price', 'brand__name',
-                'brand__slug', 'created_at', 'view_count', 'description'
-            ).order_by('created_at')
-            
-            # Apply filters from AJAX request
-            # Category filter
-            if filters.get('category'):
-                try:
-                    category = Category.objects.get(slug=filters['category'], is_active=True)
-                    descendant_ids = category.get_descendant_ids()
-                    products = products.filter(categories__id__in=descendant_ids)
-                except Category.DoesNotExist:
-                    pass
-            
-            # Brand filter
-            if filters.get('brands'):
-                products = products.filter(brand__slug__in=filters['brands'])
-            
-            # Search query
-            if filters.get('q'):
-                query = filters['q']
-                products = products.filter(
-                    Q(name__icontains=query) | 
-                    Q(description__icontains=query) |
-                    Q(sku__icontains=query)
-                )
-            
-            # Price filter
-            if filters.get('min_price'):
-                try:
-                    min_price_val = float(filters['min_price'])
-                    products = products.filter(
-                        Q(price__gte=min_price_val) | 
-                        Q(discount_price__gte=min_price_val) |
-                        Q(price__isnull=False, discount_price__isnull=True, price__gte=min_price_val) |
-                        Q(discount_price__isnull=False, price__gte=min_price_val)
-                    )
-                except (ValueError, TypeError):
-                    pass
-            
-            if filters.get('max_price'):
-                try:
-                    max_price_val = float(filters['max_price'])
-                    products = products.filter(
-                        Q(price__lte=max_price_val) | 
-                        Q(discount_price__lte=max_price_val) |
-                        Q(price__isnull=False, discount_price__isnull=True, price__lte=max_price_val) |
-                        Q(discount_price__isnull=False, price__lte=max_price_val)
-                    )
-                except (ValueError, TypeError):
-                    pass
-            
-            # Rating filter
-            if filters.get('rating'):
-                try:
-                    rating_val = float(filters['rating'])
-                    product_ids = Review.objects.values('product').annotate(
-                        avg_rating=Avg('rating')
-                    ).filter(avg_rating__gte=rating_val).values_list('product', flat=True)
-                    products = products.filter(id__in=product_ids)
-                except (ValueError, TypeError):
-                    pass
+            catalog = CatalogQuery.from_filters(filters)
+            products = catalog.listing()
+            ordering = catalog.ordering
             
-            # Attribute filter
-            if filters.get('attributes'):
-                products = products.filter(attributes__id__in=filters['attributes']).distinct()
-            
-            # Featured filter
-            if filters.get('featured', '').lower() == 'true':
-                products = products.filter(is_featured=True)
-            
-            # Sorting
-            sort_option = filters.get('sort', '')
-            if sort_option == 'price_asc':
-                products = products.annotate(
-                    actual_price=Min('discount_price', 'price')
-                ).order_by('actual_price')
-            elif sort_option == 'price_desc':
-                products = products.annotate(
-                    actual_price=Min('discount_price', 'price')
-                ).order_by('-actual_price')
-            elif sort_option == 'rating':
-                products = products.annotate(
-                    avg_rating=Avg('reviews__rating')
-                ).order_by('-avg_rating')
-            elif sort_option == 'newest':
-                products = products.order_by('-created_at')
-            elif sort_option == 'popular':
-                products = products.order_by('-view_count')
-            else:
-                products = products.order_by('-created_at')
-            
-            # Pagination
+            # Pagination - send "cursor" (empty for the first page) to use keyset mode
             per_page = 12
-            paginator = Paginator(products, per_page)
-            
-            try:
-                products_page = paginator.page(page)
-            except:
-                products_page = paginator.page(1)
-            
-            # Prepare product data
-            products_data = []
-            for product in products_page:
-                # Get main image
-                main_image = product.images.filter(is_featured=True).first()
-                if not main_image and product.images.exists():
-                    main_image = product.images.first()
-                
-                # Calculate discount percentage
-                discount_percentage = 0
-                if product.discount_price and product.price and product.price > 0:
-                    discount_percentage = ((product.price - product.discount_price) / product.price) * 100
-                    discount_percentage = round(discount_percentage)
+            if 'cursor' in data:
+                products_page = products.cursor_page(data.get('cursor'), per_page)
+                total_products = products_page.total
+                next_cursor = products_page.next_cursor
+            else:
+                paginator = Paginator(products, per_page)
                 
-                # Get average rating
-                avg_rating = product.reviews.aggregate(avg=Avg('rating'))['avg'] or 0
+                try:
+                    products_page = paginator.page(page)
+                except:
+                    products_page = paginator.page(1)
                 
-                products_data.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'slug': product.slug,
-                    'price': str(product.price),
-                    'discount_price': str(product.discount_price) if product.discount_price else None,
-                    'discount_percentage': discount_percentage,
-                    'brand_name': product.brand.name if product.brand else '',
-                    'image_url': main_image.image.url if main_image else '/static/img/no-image.jpg',
-                    'url': product.get_absolute_url(),
-                    'avg_rating': round(avg_rating, 1) if avg_rating else 0,
-                    'review_count': product.reviews.count(),
-                })
+                total_products = paginator.count
+                next_cursor = cursor_after_page(products_page, ordering, total_products)
+            
+            # Prepare product data
+            # Cards carry everything the JSON needs (one narrow query per page)
+            products_data = [product.to_dict() for product in products_page]
             
             return JsonResponse({
                 'success': True,
                 'products': products_data,
                 'has_next': products_page.has_next(),
                 'next_page': products_page.next_page_number() if products_page.has_next() else None,
-                'total_products': paginator.count,
+                'next_cursor': next_cursor,
+                'total_products': total_products,
             })
             
         except Exception as e:
@@ -1434,111 +1081,30 @@ def load_more_products(request):
 
 def product_detail(request, slug):
     """
-    Optimized product detail view with minimal queries
-    Uses select_related, prefetch_related and caching strategically
+    Product detail page rendered from the versioned detail cache
+    (products.detail); a cache hit costs no product queries at all
     """
     start_time = time.time()
     
-    # Try to get product from cache first (cache by slug)
-    cache_key = f'product_detail_{slug}'
-    cached_data = cache.get(cache_key)
+    product = get_product_detail(slug)
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    record_view(product.id)
     
-    if cached_data:
-        # Cache hit - return cached context
-        context = cached_data
-    else:
-        # Cache miss - query database with optimized joins
-        
-        # 1. Get product with all necessary related data in minimal queries
-        # IMPORTANT: Don't slice in Prefetch - do it after retrieving
-        product = get_object_or_404(
-            Product.objects.select_related('brand')
-                          .prefetch_related(
-                              # Images - only needed fields
-                              Prefetch(
-                                  'images',
-                                  queryset=ProductImage.objects.only(
-                                      'id', 'image', 'product_id', 'is_featured', 'alt_text', 'display_order'
-                                  ).order_by('display_order', 'id')
-                              ),
-                              # Categories - only for breadcrumbs
-                              Prefetch(
-                                  'categories',
-                                  queryset=Category.objects.only('id', 'name', 'slug', 'parent_id')
-                              ),
-                              # Variations with attributes - for variant selection
-                              Prefetch(
-                                  'variations',
-                                  queryset=ProductVariation.objects.filter(
-                                      is_active=True, stock__gt=0
-                                  ).prefetch_related(
-                                      Prefetch(
-                                          'attributes',
-                                          queryset=AttributeValue.objects.select_related('attribute').only(
-                                              'id', 'value', 'attribute__name'
-                                          )
-                                      )
-                                  ).only('id', 'product_id', 'price', 'stock', 'sku')
-                              ),
-                              # Specifications - for tab content
-                              Prefetch(
-                                  'productattribute_set',
-                                  queryset=ProductAttribute.objects.select_related(
-                                      'attribute_value__attribute'
-                                  ).only(
-                                      'id', 'product_id', 
-                                      'attribute_value__value', 
-                                      'attribute_value__attribute__name'
-                                  )
-                              ),
-                              # Approved reviews - DON'T slice here, get all and slice in template or view
-                              Prefetch(
-                                  'reviews',
-                                  queryset=Review.objects.filter(is_approved=True)
-                                                .select_related('user')
-                                                .only(
-                                                    'id', 'product_id', 'user_id', 'rating', 
-                                                    'title', 'comment', 'created_at',
-                                                    'user__username', 'user__first_name', 'user__last_name'
-                                                ).order_by('-created_at')  # Order but don't slice
-                              )
-                          ),
-            slug=slug,
-            is_active=True
-        )
-        
-        # 2. Process variations into template-friendly format
-        variations_dict = {}
-        for variation in product.variations.all():
-            for attr in variation.attributes.all():
-                attr_name = attr.attribute.name
-                if attr_name not in variations_dict:
-                    variations_dict[attr_name] = set()
-                variations_dict[attr_name].add(attr.value)
-        
-        # Convert sets to lists and sort
-        variations = {
-            attr_name: sorted(list(values)) 
-            for attr_name, values in variations_dict.items()
-        }
-        
-        # 3. Get payment methods (cached separately)
-        payment_methods = cache.get('payment_methods')
-        if not payment_methods:
-            payment_methods = list(PaymentMethod.objects.filter(is_active=True).only('id', 'name', 'icon', 'description'))
-            cache.set('payment_methods', payment_methods, 3600)  # Cache for 1 hour
-        
-        # 4. Build context with all data
-        context = {
-            'product': product,
-            'variations': variations,
-            'payment_methods': payment_methods,
-            
-            'caution_text': product.caution,
-        }
+    # Payment methods (cached separately)
+    payment_methods = cache.get('payment_methods')
+    if not payment_methods:
+        payment_methods = list(PaymentMethod.objects.filter(is_active=True).only('id', 'name', 'icon', 'description'))
+        cache.set('payment_methods', payment_methods, 3600)  # Cache for 1 hour
+    
+    context = {
+        'product': product,
+        'variations': product.options,
+        'variation_matrix': product.variation_matrix,
+        'payment_methods': payment_methods,
         
-        # Cache the complete context
-        cache.set(cache_key, context, 300)  # Cache for 5 minutes
+        'caution_text': product.caution,
+    }
     
     load_time = time.time() - start_time
     print(f"Product detail page loaded in {load_time:.2f} seconds")
@@ -1547,102 +1113,41 @@ def product_detail(request, slug):
 
 
 def get_frequently_bought(request):
-    """Optimized AJAX endpoint for frequently bought together"""
-    product_id = request.GET.get('product_id')
-    
-    if not product_id:
+    """Frequently bought together panel (see product_panels)"""
+    detail = get_product_detail_by_id(request.GET.get('product_id'))
+    if detail is None:
         return JsonResponse({'html': ''})
-    
-    cache_key = f'frequently_bought_{product_id}'
-    html = cache.get(cache_key)
-    
-    if not html:
-        try:
-            # Optimized query with only needed fields
-            from orders.models import OrderItem
-            
-            frequently_bought = list(Product.objects.filter(
-                orderitem__order__items__product_id=product_id,
-                is_active=True
-            ).exclude(id=product_id).select_related('brand').distinct()[:4])
-            
-            if frequently_bought:
-                # Prefetch images for these products
-                product_ids = [p.id for p in frequently_bought]
-                images = ProductImage.objects.filter(
-                    product_id__in=product_ids, 
-                    is_featured=True
-                ).select_related('product')
-                
-                # Create image lookup dict
-                image_dict = {img.product_id: img for img in images}
-                
-                context = {
-                    'products': frequently_bought,
-                    'image_dict': image_dict,
-                }
-            else:
-                context = {'products': []}
-            
-            html = render_to_string('shop/partials/frequently_bought.html', context)
-            cache.set(cache_key, html, 300)  # Cache for 5 minutes
-            
-        except Exception as e:
-            print(f"Error in get_frequently_bought: {e}")
-            html = render_to_string('shop/partials/frequently_bought_empty.html')
-    
-    return JsonResponse({'html': html})
+    return JsonResponse({'html': render_panel('frequently_bought', detail)})
 
 
 def get_related_products(request):
-    """Optimized AJAX endpoint for related products"""
-    product_id = request.GET.get('product_id')
-    
-    if not product_id:
+    """Related products panel (see product_panels)"""
+    detail = get_product_detail_by_id(request.GET.get('product_id'))
+    if detail is None:
         return JsonResponse({'html': ''})
+    return JsonResponse({'html': render_panel('related', detail)})
+
+
+def product_panels(request):
+    """
+    Several detail-page panels in one round trip:
+    ?product_id=<id>&panels=frequently_bought,related,specifications,reviews,caution
+    (all panels when `panels` is omitted)
+    """
+    detail = get_product_detail_by_id(request.GET.get('product_id'))
+    if detail is None:
+        return JsonResponse({'panels': {}, 'error': 'Product not found'}, status=404)
     
-    cache_key = f'related_products_{product_id}'
-    html = cache.get(cache_key)
-    
-    if not html:
-        try:
-            # Get product's first category efficiently
-            product = Product.objects.only('id').get(id=product_id).order_by('created_at')
-            category = product.categories.filter(is_active=True).first()
-            
-            if category:
-                related_products = list(Product.objects.filter(
-                    categories=category,
-                    is_active=True
-                ).exclude(id=product_id).select_related('brand')[:8])
-                
-                if related_products:
-                    # Prefetch images
-                    product_ids = [p.id for p in related_products]
-                    images = ProductImage.objects.filter(
-                        product_id__in=product_ids,
-                        is_featured=True
-                    ).select_related('product')
-                    
-                    image_dict = {img.product_id: img for img in images}
-                    
-                    context = {
-                        'products': related_products,
-                        'image_dict': image_dict,
-                    }
-                else:
-                    context = {'products': []}
-            else:
-                context = {'products': []}
-            
-            html = render_to_string('shop/partials/related_products.html', context)
-            cache.set(cache_key, html, 300)
-            
-        except Exception as e:
-            print(f"Error in get_related_products: {e}")
-            html = render_to_string('shop/partials/related_products_empty.html')
-    
-    return JsonResponse({'html': html})
+    names = parse_panels(request.GET.get('panels'))
+    return JsonResponse({'panels': render_panels(detail, names)})
+
+
+def product_quick_view(request, product_id):
+    """Quick view modal data, served from the product's card"""
+    card = get_card(product_id)
+    if card is None or not card.is_active:
+        return JsonResponse({'error': 'Product not found'}, status=404)
+    return JsonResponse(card.to_quick_view_dict())
 
 
 # def get_tab_content(request):
@@ -1687,48 +1192,15 @@ def get_related_products(request):
 # In products/views.py - Update get_tab_content function
 
 def get_tab_content(request):
-    """AJAX view to load tab content"""
-    product_id = request.GET.get('product_id')
+    """AJAX view to load tab content (see product_panels)"""
     tab_type = request.GET.get('tab_type')
     
-    try:
-        product = Product.objects.get(id=product_id)
-        
-        if tab_type == 'specifications':
-            # CORRECT: ProductAttribute -> attribute_value -> attribute
-            specifications = ProductAttribute.objects.filter(
-                product=product
-            ).select_related(
-                'attribute_value__attribute'
-            )
-            
-            html = render_to_string('shop/partials/specifications.html', {
-                'product': product,
-                'specifications': specifications
-            })
-        elif tab_type == 'reviews':
-            # Get reviews
-            reviews = product.reviews.filter(is_approved=True)[:5] if hasattr(product, 'reviews') else []
-            
-            html = render_to_string('shop/partials/reviews.html', {
-                'product': product,
-                'reviews': reviews,
-                'review_count': len(reviews)
-            })
-        elif tab_type == 'caution':  # New caution tab
-            html = render_to_string('partials/caution.html', {
-                'product': product,
-                'caution_text': product.caution or 'No specific cautions or warnings available for this product.'
-            })
-        else:
-            html = '<p>Content not available.</p>'
-        
-        return JsonResponse({'html': html})
-    except Product.DoesNotExist:
+    detail = get_product_detail_by_id(request.GET.get('product_id'))
+    if detail is None:
         return JsonResponse({'html': '<p>Product not found.</p>'})
-    except Exception as e:
-        print(f"Error in get_tab_content: {e}")
-        return JsonResponse({'html': f'<p>Error loading content: {str(e)}</p>'})
+    if tab_type not in ('specifications', 'reviews', 'caution'):
+        return JsonResponse({'html': '<p>Content not available.</p>'})
+    return JsonResponse({'html': render_panel(tab_type, detail)})
 
 
 
@@ -1739,49 +1211,25 @@ def get_product_variation_price(request):
             product_id = request.POST.get('product_id')
             attributes = json.loads(request.POST.get('attributes', '{}'))
             
-            # Get variations with attributes in one query
-            variations = ProductVariation.objects.filter(
-                product_id=product_id,
-                is_active=True,
-                stock__gt=0
-            ).prefetch_related(
-                Prefetch(
-                    'attributes',
-                    queryset=AttributeValue.objects.select_related('attribute').only(
-                        'id', 'value', 'attribute__name'
-                    )
-                )
-            ).only('id', 'price', 'stock', 'sku')
+            # One cached matrix lookup instead of scanning the variations
+            matrix = get_variation_matrix(product_id)
+            if matrix is None:
+                return JsonResponse({'error': 'Product not found'}, status=404)
             
-            # Find matching variation
-            matching_variation = None
-            for variation in variations:
-                variation_attrs = {
-                    attr.attribute.name: attr.value 
-                    for attr in variation.attributes.all()
-                }
-                if variation_attrs == attributes:
-                    matching_variation = variation
-                    break
+            matching_variation = resolve_variation(product_id, attributes)
             
             if matching_variation:
                 return JsonResponse({
-                    'price': str(matching_variation.get_price()),
+                    'price': str(matching_variation['price']),
                     'original_price': None,  # Variation doesn't have separate original price
-                    'stock': matching_variation.stock
+                    'stock': matching_variation['stock']
                 })
             else:
-                # Get base product price
-                product = Product.objects.only('price', 'discount_price').get(id=product_id)
-                total_stock = ProductVariation.objects.filter(
-                    product_id=product_id,
-                    is_active=True
-                ).aggregate(total=Sum('stock'))['total'] or 0
-                
+                # Base product price
                 return JsonResponse({
-                    'price': str(product.get_price()),
-                    'original_price': str(product.price) if product.discount_price else None,
-                    'stock': total_stock
+                    'price': str(matrix['price']),
+                    'original_price': str(matrix['original_price']) if matrix['original_price'] else None,
+                    'stock': matrix['total_stock']
                 })
                 
         except Exception as e:
@@ -1839,32 +1287,21 @@ def get_product_variant(request):
         product_id = request.POST.get('product_id')
         selected_attrs = json.loads(request.POST.get('attributes'))
         
-        try:
-            product = Product.objects.get(id=product_id)
-            variations = product.variations.filter(is_active=True)
-            
-            # Filter variations that match all selected attributes
-            for attr_name, attr_value in selected_attrs.items():
-                variations = variations.filter(
-                    attributes__attribute__name=attr_name,
-                    attributes__value=attr_value
-                )
-            
-            if variations.exists():
-                variant = variations.first()
-                return JsonResponse({
-                    'variant': {
-                        'id': variant.id,
-                        'price': str(variant.get_price()),
-                        'stock': variant.stock,
-                        'sku': variant.sku
-                    }
-                })
-            
-            return JsonResponse({'error': 'No matching variant found'}, status=404)
-        
-        except Product.DoesNotExist:
+        if get_variation_matrix(product_id) is None:
             return JsonResponse({'error': 'Product not found'}, status=404)
+        
+        variant = resolve_variation(product_id, selected_attrs)
+        if variant:
+            return JsonResponse({
+                'variant': {
+                    'id': variant['id'],
+                    'price': str(variant['price']),
+                    'stock': variant['stock'],
+                    'sku': variant['sku']
+                }
+            })
+        
+        return JsonResponse({'error': 'No matching variant found'}, status=404)
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
@@ -1881,54 +1318,10 @@ def brand_list(request):
 
 def get_reviews_content(request):
     """Get reviews tab content with proper rating calculations"""
-    product_id = request.GET.get('product_id')
-    
-    try:
-        product = Product.objects.get(id=product_id)
-        
-        # Get approved reviews using your Review model
-        reviews = Review.objects.filter(product=product, is_approved=True)
-        
-        # Calculate rating distribution
-        rating_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        total_rating = 0
-        total_reviews = reviews.count()
-        
-        for review in reviews:
-            rating_counts[review.rating] += 1
-            total_rating += review.rating
-        
-        # Calculate average rating
-        avg_rating = total_rating / total_reviews if total_reviews > 0 else 0
-        
-        context = {
-            'product': product,
-            'reviews': reviews[:5],  # Show only first 5
-            'review_count': total_reviews,
-            'avg_rating': round(avg_rating, 1),
-            'five_star_count': rating_counts[5],
-            'four_star_count': rating_counts[4],
-            'three_star_count': rating_counts[3],
-            'two_star_count': rating_counts[2],
-            'one_star_count': rating_counts[1],
-            'total_reviews': total_reviews,
-        }
-        
-        html = render_to_string('shop/partials/reviews.html', context)
-        return JsonResponse({'html': html})
-        
-    except Product.DoesNotExist:
+    detail = get_product_detail_by_id(request.GET.get('product_id'))
+    if detail is None:
         return JsonResponse({'html': '<p>Product not found.</p>'})
-    except Exception as e:
-        print(f"Error in get_reviews_content: {e}")
-        return JsonResponse({
-            'html': '''
-            <div class="text-center py-4">
-                <i class="fa fa-comments fa-3x text-muted mb-3"></i>
-                <p class="text-muted">Unable to load reviews at this time.</p>
-            </div>
-            '''
-        })
+    return JsonResponse({'html': render_panel('reviews', detail)})
 
 @login_required
 @require_POST
@@ -2016,31 +1409,30 @@ def review_helpfulness(request):
     })
 
 def load_more_reviews(request):
-    """Load more reviews for pagination"""
+    """Next keyset page of reviews (see panels.review_page)"""
     product_id = request.GET.get('product_id')
-    offset = int(request.GET.get('offset', 0))
+    cursor = request.GET.get('cursor')
     
     try:
-        product = Product.objects.get(id=product_id)
-        reviews = Review.objects.filter(
-            product=product, 
-            is_approved=True
-        ).order_by('-created_at')[offset:offset + 5]
+        if not cursor:
+            return JsonResponse({'html': '', 'has_more': False, 'next_cursor': None})
+        page = review_page(int(product_id), cursor)
         
-        if reviews:
+        if page.object_list:
             html = render_to_string('shop/partials/review_items.html', {
-                'reviews': reviews
+                'reviews': page.object_list
             })
         else:
             html = ''
         
         return JsonResponse({
             'html': html,
-            'has_more': len(reviews) == 5
+            'has_more': page.has_next(),
+            'next_cursor': page.next_cursor,
         })
     except Exception as e:
         print(f"Error in load_more_reviews: {e}")
-        return JsonResponse({'html': '', 'has_more': False})
+        return JsonResponse({'html': '', 'has_more': False, 'next_cursor': None})
 
 
 
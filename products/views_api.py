@@ -7,6 +7,9 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.core.cache import cache
 from .models import Product, Category, Brand
+from .facets import get_facet_index
+from .catalog import CatalogQuery
+from . import copurchase, popularity, related
 from .serializers import ProductListSerializer, ProductDetailSerializer
 
 class ProductListView(generics.ListAPIView):
@@ -17,91 +20,15 @@ class ProductListView(generics.ListAPIView):
     permission_classes = [AllowAny]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description', 'sku']
-    ordering_fields = ['price', 'created_at', 'name', 'view_count']
+    ordering_fields = ['price', 'effective_price', 'rating_avg', 'rating_count', 'created_at', 'name', 'view_count', 'popularity_score']
     
     def get_queryset(self):
         """
-        Optimized queryset with filtering - NO annotations that conflict with model fields
+        Listing queryset compiled from the query params (category, brand,
+        min_price, max_price, rating, featured, attribute, q, sort) by the
+        shared CatalogQuery; ?search= and ?ordering= still apply on top.
         """
-        queryset = Product.objects.filter(
-            is_active=True
-        ).select_related(
-            'brand'
-        ).prefetch_related(
-            'images',
-            'reviews'
-        ).distinct()  # Remove duplicates
-        
-        # Apply filters from query params
-        params = self.request.query_params
-        
-        # Category filter
-        category_slug = params.get('category')
-        if category_slug:
-            try:
-                category = Category.objects.get(slug=category_slug, is_active=True)
-                descendant_ids = category.get_descendant_ids()
-                queryset = queryset.filter(categories__id__in=descendant_ids)
-            except Category.DoesNotExist:
-                queryset = queryset.none()
-        
-        # Brand filter
-        brand_slugs = params.getlist('brand')
-        if brand_slugs:
-            queryset = queryset.filter(brand__slug__in=brand_slugs)
-        
-        # Price range filter
-        min_price = params.get('min_price')
-        max_price = params.get('max_price')
-        
-        if min_price:
-            try:
-                min_price_val = float(min_price)
-                queryset = queryset.filter(
-                    Q(price__gte=min_price_val) |
-                    Q(discount_price__gte=min_price_val)
-                )
-            except (ValueError, TypeError):
-                pass
-        
-        if max_price:
-            try:
-                max_price_val = float(max_price)
-                queryset = queryset.filter(
-                    Q(price__lte=max_price_val) |
-                    Q(discount_price__lte=max_price_val)
-                )
-            except (ValueError, TypeError):
-                pass
-        
-        # Rating filter - using subquery instead of annotation
-        rating = params.get('rating')
-        if rating:
-            try:
-                rating_val = float(rating)
-                from reviews.models import Review
-                # Get product IDs with average rating >= rating_val
-                product_ids = Review.objects.filter(
-                    is_approved=True
-                ).values('product').annotate(
-                    avg_rating=Avg('rating')
-                ).filter(avg_rating__gte=rating_val).values_list('product', flat=True)
-                
-                queryset = queryset.filter(id__in=product_ids)
-            except (ValueError, TypeError, ImportError):
-                pass
-        
-        # Featured filter
-        featured = params.get('featured')
-        if featured and featured.lower() == 'true':
-            queryset = queryset.filter(is_featured=True)
-        
-        # Attribute filter
-        attribute_values = params.getlist('attribute')
-        if attribute_values:
-            queryset = queryset.filter(attributes__id__in=attribute_values).distinct()
-        
-        return queryset
+        return CatalogQuery.from_params(self.request.query_params).queryset()
     
     @method_decorator(cache_page(60 * 5))
     def list(self, request, *args, **kwargs):
@@ -118,12 +45,12 @@ class ProductDetailView(generics.RetrieveAPIView):
     lookup_field = 'slug'
     
     def retrieve(self, request, *args, **kwargs):
-        # Increment view count
+        # Buffered, flushed in batches by products.popularity
         instance = self.get_object()
-        instance.view_count += 1
-        instance.save(update_fields=['view_count'])
+        popularity.record_view(instance.id)
         
-        return super().retrieve(request, *args, **kwargs)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
 
 
 @api_view(['GET'])
@@ -132,60 +59,45 @@ def get_filter_options(request):
     """
     Get available filter options (brands, price range, attributes) for current context
     """
-    # Get base queryset based on category
-    queryset = Product.objects.filter(is_active=True)
+    facet_index = get_facet_index()
     
+    # Get base product set based on category
+    category_id = None
     category_slug = request.query_params.get('category')
     if category_slug:
         try:
-            category = Category.objects.get(slug=category_slug, is_active=True)
-            descendant_ids = category.get_descendant_ids()
-            queryset = queryset.filter(categories__id__in=descendant_ids)
+            category = Category.objects.only('id').get(slug=category_slug, is_active=True)
+            category_id = category.id
         except Category.DoesNotExist:
             pass
+    context_mask = facet_index.context_mask(category_id=category_id)
     
     # Get brands with counts
-    brands = Brand.objects.filter(
-        product__in=queryset.values('id'),
-        is_active=True
-    ).annotate(
-        product_count=Count('product')
-    ).filter(product_count__gt=0).order_by('-product_count')
-    
+    logo_storage = Brand._meta.get_field('logo').storage
     brand_data = [
         {
-            'id': brand.id,
-            'name': brand.name,
-            'slug': brand.slug,
-            'logo': request.build_absolute_uri(brand.logo.url) if brand.logo else None,
-            'product_count': brand.product_count
+            'id': brand['id'],
+            'name': brand['name'],
+            'slug': brand['slug'],
+            'logo': request.build_absolute_uri(logo_storage.url(brand['logo'])) if brand['logo'] else None,
+            'product_count': brand['product_count']
         }
-        for brand in brands
+        for brand in facet_index.brand_counts(context_mask)
     ]
     
     # Get price range
-    price_range = queryset.aggregate(
-        min_price=Min('price'),
-        max_price=Max('price')
-    )
+    price_range = facet_index.price_range(context_mask)
     
     # Get attributes with counts
-    from .models import AttributeValue
-    attributes = AttributeValue.objects.filter(
-        product__in=queryset.values('id')
-    ).annotate(
-        product_count=Count('product')
-    ).filter(product_count__gt=0).select_related('attribute').order_by('attribute__name', 'value')
-    
     attribute_groups = {}
-    for attr in attributes:
-        attr_name = attr.attribute.name
+    for attr in facet_index.attribute_counts(context_mask):
+        attr_name = attr['attribute']
         if attr_name not in attribute_groups:
             attribute_groups[attr_name] = []
         attribute_groups[attr_name].append({
-            'id': attr.id,
-            'value': attr.value,
-            'product_count': attr.product_count
+            'id': attr['id'],
+            'value': attr['value'],
+            'product_count': attr['product_count']
         })
     
     return Response({
@@ -207,16 +119,25 @@ def get_related_products(request, product_id):
     try:
         product = Product.objects.get(id=product_id)
         
-        # Get first category
+        # Content-similar neighbours precomputed by build_related_index
+        ids = related.related_ids(product.id, 8)
+        if ids:
+            by_id = Product.objects.select_related('brand').in_bulk(ids)
+            serializer = ProductListSerializer(
+                [by_id[pid] for pid in ids if pid in by_id], many=True, context={'request': request}
+            )
+            return Response(serializer.data)
+        
+        # Not indexed yet: fall back to the first category
         category = product.categories.filter(is_active=True).first()
         
         if category:
-            related = Product.objects.filter(
+            related_products = Product.objects.filter(
                 categories=category,
                 is_active=True
             ).exclude(id=product.id).select_related('brand')[:8]
             
-            serializer = ProductListSerializer(related, many=True, context={'request': request})
+            serializer = ProductListSerializer(related_products, many=True, context={'request': request})
             return Response(serializer.data)
         
         return Response([])
@@ -232,12 +153,10 @@ def get_frequently_bought(request, product_id):
     Get frequently bought together products
     """
     try:
-        from orders.models import OrderItem
-        
-        frequently_bought = Product.objects.filter(
-            orderitem__order__items__product_id=product_id,
-            is_active=True
-        ).exclude(id=product_id).distinct()[:4]
+        # Ranked partners precomputed by build_copurchase_matrix
+        partner_ids = copurchase.partner_ids(product_id, 4)
+        by_id = Product.objects.select_related('brand').in_bulk(partner_ids)
+        frequently_bought = [by_id[pid] for pid in partner_ids if pid in by_id]
         
         serializer = ProductListSerializer(frequently_bought, many=True, context={'request': request})
         return Response(serializer.data)
@@ -279,6 +279,20 @@ LOGOUT_REDIRECT_URL = 'home'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Product image renditions are generated ahead of time (generate_renditions),
+# so spec URLs never check storage or generate inline
+IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY = 'products.renditions.PregeneratedStrategy'
+
+# Threads that process admin image uploads after the response. Set to 0 when a
+# separate `manage.py generate_renditions --watch 5` worker runs instead
+PRODUCT_IMAGE_BACKGROUND_THREADS = 2
+
+# On-demand resized media (/img/<w>x<h>/<path>, core.resize). Set to 'X-Sendfile'
+# (Apache) or 'X-Accel-Redirect' (nginx, with IMAGE_RESIZE_INTERNAL_URL as an
+# internal location aliased to MEDIA_ROOT/resized/) to let the web server send files
+IMAGE_RESIZE_SENDFILE = ''
+IMAGE_RESIZE_INTERNAL_URL = '/internal/resized/'
+
 # Stripe settings
 STRIPE_PUBLISHABLE_KEY = 'your_stripe_publishable_key'
 STRIPE_SECRET_KEY = 'your_stripe_secret_key'
@@ -446,7 +460,9 @@ JAZZMIN_SETTINGS = {
     # "language_chooser": True,
 }
 
-# Cache configuration
+# Cache configuration. LocMemCache is per process: cache versions bumped in one
+# worker aren't seen by the others, so version-keyed caches stay short-lived
+# (core/caching.py). A shared backend (Redis, Memcached) lets them live longer
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -35,9 +35,9 @@ class ProductSitemap(Sitemap):
     def images(self, obj):
         """Add product images to sitemap for Google Image search"""
         images = []
-        for img in obj.images.all()[:10]:  # Limit to 10 images per product
+        for img in list(obj.images.all())[:10]:  # Limit to 10 images per product (prefetched)
             images.append({
-                'location': img.image.url,
+                'location': img.rendition_url('image'),
                 'title': obj.name,
                 'caption': img.alt_text or obj.name,
                 'license': 'https://genialtouch.com/terms-and-conditions/',
@@ -49,7 +49,7 @@ class ProductSitemap(Sitemap):
         urls = super().get_urls(page, site, protocol)
         for url in urls:
             item = url.get('item')
-            if hasattr(item, 'images') and item.images.exists():
+            if hasattr(item, 'images') and item.images.all():
                 url['images'] = self.images(item)
         return urls
 
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from .models import Review
+from .ratings import refresh_product_ratings
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
@@ -56,13 +58,22 @@ class ReviewAdmin(admin.ModelAdmin):
     
     # Custom admin actions
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
-        self.message_user(request, f"Approved {queryset.count()} review(s).")
+        # Read before the update: with the is_approved filter on, the
+        # queryset no longer matches these rows afterwards
+        product_ids = list(queryset.values_list('product_id', flat=True))
+        with transaction.atomic():
+            updated = queryset.update(is_approved=True)
+            # update() skips the signals, so refresh the rating rollup here
+            refresh_product_ratings(product_ids)
+        self.message_user(request, f"Approved {updated} review(s).")
     approve_reviews.short_description = "Approve selected reviews"
     
     def disapprove_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
-        self.message_user(request, f"Disapproved {queryset.count()} review(s).")
+        product_ids = list(queryset.values_list('product_id', flat=True))
+        with transaction.atomic():
+            updated = queryset.update(is_approved=False)
+            refresh_product_ratings(product_ids)
+        self.message_user(request, f"Disapproved {updated} review(s).")
     disapprove_reviews.short_description = "Disapprove selected reviews"
     
     # Customize ordering
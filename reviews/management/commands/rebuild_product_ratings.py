@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from reviews.ratings import refresh_product_ratings
+
+class Command(BaseCommand):
+    help = 'Rebuild the rating rollup (count, sum, average, histogram) on every product'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        
+        for start in range(0, len(product_ids), batch_size):
+            refresh_product_ratings(product_ids[start:start + batch_size])
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {len(product_ids)} products'))
@@ -15,6 +15,10 @@ class Review(models.Model):
     
     class Meta:
         unique_together = ('user', 'product')
+        indexes = [
+            # Keyset-paginated review stream of a product (products.panels.review_page)
+            models.Index(fields=['product', 'is_approved', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.user.email}'s review for {self.product.name}"
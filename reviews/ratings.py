@@ -0,0 +1,66 @@
+"""
+Approved-review rollup stored on Product (rating_count, rating_sum,
+rating_avg and the rating_1..rating_5 histogram).
+
+The rollup is recomputed for the touched products from their approved
+reviews inside the caller's transaction, with the product rows locked so
+concurrent review writes can't interleave. Recomputing (instead of
+applying +/- deltas) keeps it correct for rating edits, approvals and
+queryset.update() calls alike, and is one indexed GROUP BY per write.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from products import facets, cards, detail
+from products.models import Product
+
+
+STARS = (1, 2, 3, 4, 5)
+
+
+def empty_stats():
+    stats = {'rating_count': 0, 'rating_sum': 0, 'rating_avg': 0}
+    for star in STARS:
+        stats[f'rating_{star}'] = 0
+    return stats
+
+
+def compute_ratings(product_ids):
+    """Return {product_id: rollup field values} from the approved reviews"""
+    from .models import Review
+
+    result = {product_id: empty_stats() for product_id in product_ids}
+    rows = Review.objects.filter(
+        product_id__in=list(product_ids), is_approved=True
+    ).order_by().values('product_id', 'rating').annotate(n=Count('id'))
+
+    for row in rows:
+        stats = result[row['product_id']]
+        if row['rating'] in STARS:
+            stats[f'rating_{row["rating"]}'] += row['n']
+        stats['rating_count'] += row['n']
+        stats['rating_sum'] += row['rating'] * row['n']
+
+    for stats in result.values():
+        if stats['rating_count']:
+            stats['rating_avg'] = stats['rating_sum'] / stats['rating_count']
+    return result
+
+
+def refresh_product_ratings(product_ids):
+    """Recompute and store the rollup for the given products"""
+    product_ids = sorted({pid for pid in product_ids if pid})
+    if not product_ids:
+        return
+    with transaction.atomic():
+        # Lock in id order so two writers never deadlock on each other
+        list(Product.objects.select_for_update().filter(
+            id__in=product_ids
+        ).order_by('id').values_list('id', flat=True))
+        for product_id, stats in compute_ratings(product_ids).items():
+            Product.objects.filter(id=product_id).update(**stats)
+        # Rating sorts/filters changed: move the catalog version on commit
+        facets.schedule_refresh(product_ids)
+        cards.schedule_refresh(product_ids)
+        # Rating summary and review preview on the detail page
+        detail.schedule_bump(product_ids)
@@ -0,0 +1,23 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Review
+from .ratings import refresh_product_ratings
+
+
+# Product rating rollup maintenance
+
+@receiver(pre_save, sender=Review)
+def remember_review_product(sender, instance, **kwargs):
+    # A review moved to another product (admin edit) must refresh both
+    instance._previous_product_id = None
+    if instance.pk:
+        instance._previous_product_id = Review.objects.filter(
+            pk=instance.pk
+        ).values_list('product_id', flat=True).first()
+
+@receiver([post_save, post_delete], sender=Review)
+def refresh_ratings_for_review(sender, instance, **kwargs):
+    refresh_product_ratings([
+        instance.product_id,
+        getattr(instance, '_previous_product_id', None),
+    ])
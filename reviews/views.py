@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from products.models import Product
 from .models import Review
 from orders.models import OrderItem
@@ -29,14 +30,16 @@ def add_review(request, product_id):
         title = request.POST.get('title')
         comment = request.POST.get('comment')
         
-        Review.objects.create(
-            user=request.user,
-            product=product,
-            rating=rating,
-            title=title,
-            comment=comment,
-            is_approved=True  # Auto-approve for now, can be moderated later
-        )
+        # Atomic so the review and the product's rating rollup commit together
+        with transaction.atomic():
+            Review.objects.create(
+                user=request.user,
+                product=product,
+                rating=rating,
+                title=title,
+                comment=comment,
+                is_approved=True  # Auto-approve for now, can be moderated later
+            )
         
         messages.success(request, 'Thank you for your review!')
         return redirect('product_detail', slug=product.slug)
@@ -51,7 +54,8 @@ def edit_review(request, review_id):
         review.rating = request.POST.get('rating')
         review.title = request.POST.get('title')
         review.comment = request.POST.get('comment')
-        review.save()
+        with transaction.atomic():
+            review.save()
         
         messages.success(request, 'Your review has been updated')
         return redirect('product_detail', slug=review.product.slug)
@@ -62,7 +66,8 @@ def edit_review(request, review_id):
 def delete_review(request, review_id):
     review = get_object_or_404(Review, id=review_id, user=request.user)
     product_slug = review.product.slug
-    review.delete()
+    with transaction.atomic():
+        review.delete()
     
     messages.success(request, 'Your review has been deleted')
     return redirect('product_detail', slug=product_slug)
\ No newline at end of file
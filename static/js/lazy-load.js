@@ -120,9 +120,10 @@ class LazyImageLoader {
             img.dispatchEvent(new Event('lazyloaderror'));
         };
         
-        // Start loading
-        if (src) tempImg.src = src;
+        // Start loading (with the same sizes, so the preload picks the same candidate)
+        if (img.sizes) tempImg.sizes = img.sizes;
         if (srcset) tempImg.srcset = srcset;
+        if (src) tempImg.src = src;
     }
     
     loadBackground(element) {
@@ -370,9 +371,12 @@ class InfiniteScrollManager {
                     <div class="ps-product">
                         <div class="ps-product__thumbnail">
                             <a href="${product.url}">
-                                <img class="lazy-image" 
+                                <img class="lazy-image${product.placeholder ? ' lqip' : ''}" 
                                      data-src="${product.image_url}" 
-                                     src="/static/img/placeholder.webp"
+                                     data-srcset="${product.image_srcset || ''}"
+                                     sizes="(max-width: 575px) 50vw, (max-width: 991px) 33vw, 240px"
+                                     src="${product.placeholder || '/static/img/placeholder.webp'}"
+                                     ${product.width ? `width="${product.width}" height="${product.height}"` : ''}
                                      alt="${product.name}">
                             </a>
                             ${discountBadge}
@@ -628,9 +632,12 @@ function displayCategoryProducts(categoryId, categoryName, data) {
                 <div class="ps-product">
                     <div class="ps-product__thumbnail">
                         <a href="${product.url}">
-                            <img class="lazy-image" 
+                            <img class="lazy-image${product.placeholder ? ' lqip' : ''}" 
                                  data-src="${product.image_url}" 
-                                 src="/static/img/placeholder.webp"
+                                 data-srcset="${product.image_srcset || ''}"
+                                 sizes="(max-width: 575px) 50vw, (max-width: 991px) 33vw, 240px"
+                                 src="${product.placeholder || '/static/img/placeholder.webp'}"
+                                 ${product.width ? `width="${product.width}" height="${product.height}"` : ''}
                                  alt="${product.name}">
                         </a>
                         ${discountBadge}
@@ -738,9 +745,12 @@ window.loadMoreCategoryProducts = async function(categoryId, page) {
                             <div class="ps-product">
                                 <div class="ps-product__thumbnail">
                                     <a href="${product.url}">
-                                        <img class="lazy-image" 
+                                        <img class="lazy-image${product.placeholder ? ' lqip' : ''}" 
                                              data-src="${product.image_url}" 
-                                             src="/static/img/placeholder.webp"
+                                             data-srcset="${product.image_srcset || ''}"
+                                             sizes="(max-width: 575px) 50vw, (max-width: 991px) 33vw, 240px"
+                                             src="${product.placeholder || '/static/img/placeholder.webp'}"
+                                             ${product.width ? `width="${product.width}" height="${product.height}"` : ''}
                                              alt="${product.name}">
                                     </a>
                                     ${discountBadge}